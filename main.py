@@ -1,8 +1,34 @@
 import os
+import re
+import sys
+import copy
+import time
+import hmac
+import uuid
+import heapq
+import socket
+import base64
+import pickle
+import hashlib
+import atexit
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from collections import OrderedDict, Counter, deque
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from pymongo import MongoClient, monitoring, UpdateOne, DeleteOne, ASCENDING, ReturnDocument
+from pymongo.errors import OperationFailure, DuplicateKeyError
+from bson import ObjectId, Binary
+from telegram import (
+    Update,
+    InlineKeyboardMarkup,
+    InlineKeyboardButton,
+    InlineQueryResultArticle,
+    InlineQueryResultCachedPhoto,
+    InputTextMessageContent,
+)
+from telegram.error import RetryAfter, Forbidden, BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -10,11 +36,16 @@ from telegram.ext import (
     ConversationHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
+    TypeHandler,
+    BasePersistence,
+    BaseRateLimiter,
+    PersistenceInput,
     filters,
 )
 # Flask server ke liye
-from flask import Flask
-from threading import Thread
+from flask import Flask, Response, jsonify, request, abort
+from threading import Thread, Lock
 # Subscription time ke liye
 from datetime import datetime, timedelta
 
@@ -23,6 +54,32 @@ app = Flask(__name__)
 @app.route('/')
 def home():
     return "I am alive and running!"
+@app.route('/stats/db')
+def db_stats():
+    """Mongo connection pool ke numbers (pool size tune karne ke liye)."""
+    return jsonify(get_db_pool_stats())
+@app.route('/stats/outbound')
+def outbound_stats():
+    """Outbound Telegram queue ki depth, waits aur flood-wait counters."""
+    return jsonify(OUTBOUND_LIMITER.snapshot())
+@app.route('/stats/catalog')
+def catalog_stats():
+    """Catalog aur navigation keyboard cache ke hit/miss numbers."""
+    return jsonify({"catalog_entries": len(CATALOG), "catalog_hits": CATALOG.hits, "catalog_misses": CATALOG.misses, "keyboard_hits": KEYBOARD_CACHE_STATS["hits"], "keyboard_misses": KEYBOARD_CACHE_STATS["misses"]})
+@app.route('/metrics')
+def metrics():
+    """Prometheus text format: handler, Mongo aur Telegram API latency + queue depths."""
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+@app.route('/healthz')
+def healthz():
+    """Liveness: process aur bot ka event loop zinda hai (sirf cached values, koi I/O nahi)."""
+    report = health_report(readiness=False)
+    return jsonify(report), 200 if report["ok"] else 503
+@app.route('/readyz')
+def readyz():
+    """Readiness: Mongo ping, event loop heartbeat aur backlogs apne budget ke andar hain."""
+    report = health_report(readiness=True)
+    return jsonify(report), 200 if report["ok"] else 503
 def run_flask():
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
@@ -46,76 +103,1650 @@ except Exception as e:
     logger.error(f"Error reading secrets: {e}")
     exit()
 
-# --- (FIXED) Database Connection ---
-# Render/Heroku jaise platforms par global client issue karta hai.
-# Hum har function mein naya client/db connection lenge.
+# --- Metrics (Prometheus) ---
+# Chhota in-house registry (prometheus_client dependency ki zaroorat nahi). Histograms/counters
+# thread-safe hain kyunki Mongo listener executor threads se aur /metrics Flask thread se aata hai.
+# Numbers per-process hain; gunicorn ke har worker ka apna /metrics hota hai.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+class HistogramMetric:
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help_text, self.label_names, self.buckets = name, help_text, label_names, buckets
+        self._series = {} # label values -> [bucket counts..., sum, count]
+        self._lock = Lock()
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in sorted(items):
+            labels = dict(zip(self.label_names, key))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series[-1]}")
+        return lines
+
+class CounterMetric:
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name, self.help_text, self.label_names = name, help_text, label_names
+        self._values = Counter()
+        self._lock = Lock()
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] += amount
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(dict(zip(self.label_names, key)))} {value}" for key, value in items]
+        return lines
+
+class GaugeMetric:
+    """Value scrape ke time `read()` se aati hai; read() {labels_tuple: value} ya number return kare."""
+    def __init__(self, name: str, help_text: str, read, label_names: tuple = ()):
+        self.name, self.help_text, self.read, self.label_names = name, help_text, read, label_names
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} read nahi hua: {e}")
+            return lines
+        if isinstance(value, dict):
+            lines += [f"{self.name}{_format_labels(dict(zip(self.label_names, key)))} {v}" for key, v in sorted(value.items())]
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+HANDLER_LATENCY = METRICS.register(HistogramMetric("bot_handler_duration_seconds", "Telegram handler callback latency.", ("handler",)))
+HANDLER_ERRORS = METRICS.register(CounterMetric("bot_handler_errors_total", "Handler callbacks jo exception se khatam hue.", ("handler",)))
+MONGO_LATENCY = METRICS.register(HistogramMetric("mongo_command_duration_seconds", "MongoDB command latency.", ("collection", "command")))
+MONGO_FAILURES = METRICS.register(CounterMetric("mongo_command_failures_total", "Fail hue MongoDB commands.", ("collection", "command")))
+TELEGRAM_LATENCY = METRICS.register(HistogramMetric("telegram_api_duration_seconds", "Telegram Bot API call latency (limiter wait ke bina).", ("endpoint",)))
+TELEGRAM_ERRORS = METRICS.register(CounterMetric("telegram_api_errors_total", "Telegram Bot API errors.", ("endpoint", "error")))
+
+def timed_handler(callback, name: str = None):
+    """Handler callback ko latency/error metrics ke saath wrap karta hai (dobara wrap nahi hota)."""
+    if getattr(callback, "_metrics_timed", False):
+        return callback
+    name = name or getattr(callback, "__name__", "unknown")
+    async def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name)
+    timed.__name__ = name
+    timed._metrics_timed = True
+    return timed
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Har Mongo command ki latency collection + command name ke hisaab se."""
+    def __init__(self):
+        self._pending = {}
+        self._lock = Lock()
+    def _key(self, event):
+        return (event.connection_id, event.request_id)
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "" # admin commands (ping, endSessions...) ka collection nahi hota
+        with self._lock:
+            self._pending[self._key(event)] = collection
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop(self._key(event), "")
+    def succeeded(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, collection=self._finish(event), command=event.command_name)
+    def failed(self, event):
+        collection = self._finish(event)
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        MONGO_FAILURES.inc(collection=collection, command=event.command_name)
+
+def _update_queue_depth():
+    application = BOT_RUNTIME["application"]
+    return application.update_queue.qsize() if application is not None else None
+
+def _outbound_queue_depth():
+    depth = OUTBOUND_LIMITER.snapshot()["queue_depth_by_priority"]
+    return {(name,): depth.get(name, 0) for name in PRIORITY_NAMES.values()}
+
+def _db_pool_gauge():
+    stats = get_db_pool_stats()
+    return {(k,): v for k, v in stats.items() if isinstance(v, (int, float))}
+
+METRICS.register(GaugeMetric("bot_update_queue_depth", "PTB update_queue mein pending updates.", _update_queue_depth))
+METRICS.register(GaugeMetric("telegram_outbound_queue_depth", "Outbound limiter mein wait kar rahe requests.", _outbound_queue_depth, ("priority",)))
+METRICS.register(GaugeMetric("mongo_pool_connections", "Mongo connection pool counters.", _db_pool_gauge, ("state",)))
+
+# --- Database Connection (Pooled) ---
+# Poore process ke liye ek hi MongoClient, jo apna connection pool khud sambhalta hai.
+# MongoClient fork-safe nahi hai, isliye fork ke baad (naye PID par) naya client banta hai.
+MONGO_DB_NAME = "AnimeBotDB"
+MONGO_POOL_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")),
+    "serverSelectionTimeoutMS": 5000, # 5 sec timeout
+}
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Pool events se counters banata hai: checked-out, waiting, created."""
+    def __init__(self):
+        self._lock = Lock()
+        self.stats = {"created": 0, "closed": 0, "checked_out": 0, "waiting": 0, "check_out_failed": 0, "pool_cleared": 0}
+    def _bump(self, key, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["open"] = stats["created"] - stats["closed"]
+        return stats
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): self._bump("pool_cleared")
+    def pool_closed(self, event): pass
+    def connection_created(self, event): self._bump("created")
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): self._bump("closed")
+    def connection_check_out_started(self, event): self._bump("waiting")
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.stats["waiting"] -= 1
+            self.stats["check_out_failed"] += 1
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.stats["waiting"] -= 1
+            self.stats["checked_out"] += 1
+    def connection_checked_in(self, event): self._bump("checked_out", -1)
+
+_mongo_client = None
+_mongo_client_pid = None
+_mongo_pool_listener = None
+_mongo_client_lock = Lock()
+
+def get_mongo_client():
+    """Shared MongoClient return karta hai (lazy, per-process)."""
+    global _mongo_client, _mongo_client_pid, _mongo_pool_listener
+    pid = os.getpid()
+    if _mongo_client is not None and _mongo_client_pid == pid:
+        return _mongo_client
+    with _mongo_client_lock:
+        if _mongo_client is None or _mongo_client_pid != pid:
+            # Fork ke baad parent ka client yahan use nahi ho sakta, naya banao
+            _mongo_pool_listener = PoolStatsListener()
+            _mongo_client = MongoClient(MONGO_URI, event_listeners=[_mongo_pool_listener, MongoCommandMetrics()], **MONGO_POOL_OPTIONS)
+            _mongo_client_pid = pid
+            logger.info(f"MongoClient bana (pid {pid}, maxPoolSize {MONGO_POOL_OPTIONS['maxPoolSize']}).")
+    return _mongo_client
+
 def get_db():
-    """Naya DB connection return karta hai."""
+    """Shared pooled client ka DB return karta hai."""
     try:
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000) # 5 sec timeout
-        return client['AnimeBotDB']
+        return get_mongo_client()[MONGO_DB_NAME]
     except Exception as e:
         logger.error(f"DB connection function me error: {e}")
         return None
 
+def get_db_pool_stats():
+    """Connection pool ke current counters (checked-out, waiting, created...)."""
+    stats = _mongo_pool_listener.snapshot() if _mongo_pool_listener and _mongo_client_pid == os.getpid() else {}
+    stats["max_pool_size"] = MONGO_POOL_OPTIONS["maxPoolSize"]
+    return stats
+
+def close_db():
+    """Shutdown hook: shared client ko band karta hai."""
+    global _mongo_client, _mongo_client_pid
+    with _mongo_client_lock:
+        if _mongo_client is not None and _mongo_client_pid == os.getpid():
+            _mongo_client.close()
+            logger.info("MongoClient band kar diya.")
+        _mongo_client, _mongo_client_pid = None, None
+
+atexit.register(close_db)
+
+# --- Async Data Layer ---
+# pymongo sync hai; har DB call ko ek bounded thread pool par chalate hain
+# taaki ek slow query poore event loop ko na roke.
+MONGO_EXECUTOR_WORKERS = int(os.getenv("MONGO_EXECUTOR_WORKERS", "16"))
+_db_executor = None
+_db_executor_pid = None
+
+def get_db_executor():
+    """DB calls ke liye bounded ThreadPoolExecutor (per-process)."""
+    global _db_executor, _db_executor_pid
+    pid = os.getpid()
+    if _db_executor is None or _db_executor_pid != pid:
+        _db_executor = ThreadPoolExecutor(max_workers=MONGO_EXECUTOR_WORKERS, thread_name_prefix="mongo")
+        _db_executor_pid = pid
+    return _db_executor
+
+async def run_db(func, *args, **kwargs):
+    """Sync DB function ko executor par chala ke await karne deta hai."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), partial(func, *args, **kwargs))
+
+def _collection_call(collection_name, op, args, kwargs):
+    db = get_db()
+    if db is None:
+        raise ConnectionError("DB connection nahi mila.")
+    result = getattr(db[collection_name], op)(*args, **kwargs)
+    if op in ("find", "aggregate"):
+        # Cursor ko thread ke andar hi poora padh lo
+        return list(result)
+    return result
+
+class AsyncCollection:
+    """Collection ka awaitable wrapper: `await db_animes.find_one(...)`.
+
+    `find`/`aggregate` list return karte hain; sort/limit ko kwargs ki tarah do.
+    """
+    def __init__(self, name):
+        self.name = name
+    def __getattr__(self, op):
+        async def call(*args, **kwargs):
+            return await run_db(_collection_call, self.name, op, args, kwargs)
+        call.__name__ = op
+        return call
+
+db_animes = AsyncCollection("animes")
+db_users = AsyncCollection("users")
+db_config = AsyncCollection("config")
+db_episodes = AsyncCollection("episodes")
+db_counters = AsyncCollection("counters")
+db_persistence = AsyncCollection("persistence")
+db_broadcasts = AsyncCollection("broadcasts")
+db_batches = AsyncCollection("batches")
+
+def ping_db() -> float:
+    """Mongo ko ping karta hai aur latency (seconds) return karta hai; fail hone par exception."""
+    db = get_db()
+    if db is None:
+        raise Exception("DB None return hua")
+    started = time.perf_counter()
+    db.client.admin.command("ping") # Connection test
+    return time.perf_counter() - started
+
 def check_db_connection():
     """Startup par DB check karta hai."""
     try:
         logger.info("MongoDB se connect karne ki koshish...")
-        db = get_db()
-        if db is None:
-            raise Exception("DB None return hua")
-        db.client.server_info() # Connection test
+        ping_db()
         logger.info("MongoDB se successfully connect ho gaya!")
         return True
     except Exception as e:
         logger.error(f"MongoDB connection failed: {e}")
         return False
 
+# --- Health / Readiness ---
+# Probes kabhi khud Mongo/Telegram ko call nahi karte; ek background thread DB ping cache
+# karta hai aur bot ka loop ek JobQueue heartbeat likhta hai. Probe sirf in values ko budgets
+# se compare karta hai, isliye cheap hai aur polling loop mar jaye toh bhi sahi jawab deta hai.
+HEALTH_PING_INTERVAL = float(os.getenv("HEALTH_PING_INTERVAL", "10"))
+HEALTH_DB_STALE_SECONDS = float(os.getenv("HEALTH_DB_STALE_SECONDS", "30"))
+HEALTH_DB_LATENCY_BUDGET_MS = float(os.getenv("HEALTH_DB_LATENCY_BUDGET_MS", "500"))
+HEALTH_HEARTBEAT_INTERVAL = float(os.getenv("HEALTH_HEARTBEAT_INTERVAL", "5"))
+HEALTH_LOOP_STALE_SECONDS = float(os.getenv("HEALTH_LOOP_STALE_SECONDS", "30"))
+HEALTH_STARTUP_GRACE_SECONDS = float(os.getenv("HEALTH_STARTUP_GRACE_SECONDS", "60"))
+HEALTH_OUTBOUND_BACKLOG_BUDGET = int(os.getenv("HEALTH_OUTBOUND_BACKLOG_BUDGET", "1000"))
+HEALTH_UPDATE_QUEUE_BUDGET = int(os.getenv("HEALTH_UPDATE_QUEUE_BUDGET", "500"))
+HEALTH = {
+    "started_at": time.time(), "db_ok": False, "db_latency_ms": None, "db_checked_at": None, "db_error": None,
+    "loop_heartbeat_at": None, "last_update_at": None,
+}
+_health_pinger_pid = None
+
+def _health_ping_loop():
+    while True:
+        try:
+            latency = ping_db()
+            HEALTH.update(db_ok=True, db_latency_ms=round(latency * 1000, 1), db_error=None)
+        except Exception as e:
+            HEALTH.update(db_ok=False, db_latency_ms=None, db_error=str(e))
+        HEALTH["db_checked_at"] = time.time()
+        time.sleep(HEALTH_PING_INTERVAL)
+
+def start_health_pinger():
+    """Har process mein ek DB ping thread (fork ke baad naye worker mein dobara start hota hai)."""
+    global _health_pinger_pid
+    if _health_pinger_pid == os.getpid():
+        return
+    _health_pinger_pid = os.getpid()
+    HEALTH["started_at"] = time.time()
+    Thread(target=_health_ping_loop, name="health-ping", daemon=True).start()
+
+async def health_heartbeat(context: ContextTypes.DEFAULT_TYPE):
+    HEALTH["loop_heartbeat_at"] = time.time()
+
+async def note_update_processed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    HEALTH["last_update_at"] = time.time()
+
+def _age(timestamp):
+    return round(time.time() - timestamp, 1) if timestamp else None
+
+def health_report(readiness: bool) -> dict:
+    in_grace = time.time() - HEALTH["started_at"] < HEALTH_STARTUP_GRACE_SECONDS
+    loop_age = _age(HEALTH["loop_heartbeat_at"])
+    checks = {
+        "event_loop": {"ok": (loop_age is not None and loop_age <= HEALTH_LOOP_STALE_SECONDS) or (loop_age is None and in_grace),
+                       "heartbeat_age_s": loop_age, "budget_s": HEALTH_LOOP_STALE_SECONDS},
+    }
+    if readiness:
+        db_age = _age(HEALTH["db_checked_at"])
+        checks["mongo"] = {
+            "ok": HEALTH["db_ok"] and db_age is not None and db_age <= HEALTH_DB_STALE_SECONDS and HEALTH["db_latency_ms"] <= HEALTH_DB_LATENCY_BUDGET_MS,
+            "latency_ms": HEALTH["db_latency_ms"], "budget_ms": HEALTH_DB_LATENCY_BUDGET_MS,
+            "checked_age_s": db_age, "stale_after_s": HEALTH_DB_STALE_SECONDS, "error": HEALTH["db_error"],
+        }
+        outbound = OUTBOUND_LIMITER.snapshot()["queue_depth"]
+        checks["outbound_backlog"] = {"ok": outbound <= HEALTH_OUTBOUND_BACKLOG_BUDGET, "depth": outbound, "budget": HEALTH_OUTBOUND_BACKLOG_BUDGET}
+        update_queue = _update_queue_depth()
+        checks["update_queue"] = {"ok": update_queue is None or update_queue <= HEALTH_UPDATE_QUEUE_BUDGET, "depth": update_queue, "budget": HEALTH_UPDATE_QUEUE_BUDGET}
+    return {
+        "ok": all(c["ok"] for c in checks.values()),
+        "pid": os.getpid(),
+        "last_update_age_s": _age(HEALTH["last_update_at"]),
+        "checks": checks,
+    }
+
+# Ek saath kitne updates process ho sakte hain
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+
 # --- Admin Check ---
 async def is_admin(user_id: int) -> bool:
     """Check if user is admin"""
     return user_id == ADMIN_ID
 
-# --- (FIXED) Config Helper ---
+# --- LRU Cache ---
+class LRUCache:
+    """Bounded LRU cache; har entry ka apna expiry time ho sakta hai.
+
+    Sirf event loop se use hota hai, isliye lock ki zaroorat nahi.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    def pop(self, key):
+        self._data.pop(key, None)
+    def clear(self):
+        self._data.clear()
+    def __len__(self):
+        return len(self._data)
+
+# --- Cross-Worker Cache Versions ---
+# Config, subscription aur catalog caches har process ke apne hain. Webhook mode mein N workers hote hain,
+# isliye har write `counters` ke `cache_versions` doc mein us cache ka version badhata hai, aur har worker
+# update dispatch se pehle (max har CACHE_SYNC_INTERVAL sec mein ek query) versions padhta hai; koi version
+# badla toh woh local cache khaali kar deta hai. Staleness <= CACHE_SYNC_INTERVAL. Single worker par band.
+CACHE_VERSIONS_ID = "cache_versions"
+CACHE_KINDS = ("config", "subs", "catalog")
+CACHE_SYNC = os.getenv("CACHE_SYNC", "1" if os.getenv("BOT_MODE", "polling").lower() == "webhook" else "0") == "1"
+CACHE_SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "1"))
+_cache_sync = {"versions": {}, "checked_at": 0.0, "dirty": set(), "task": None}
+
+def mark_cache_dirty(kind: str):
+    """Local write ke baad doosre workers ko batata hai (kind: config/subs/catalog).
+    Ek tick ke saare marks ek hi $inc mein jaate hain (bulk import har file par bulata hai)."""
+    if not CACHE_SYNC:
+        return
+    _cache_sync["dirty"].add(kind)
+    task = _cache_sync["task"]
+    if task is None or task.done():
+        _cache_sync["task"] = asyncio.ensure_future(_publish_cache_versions())
+
+async def _publish_cache_versions():
+    await asyncio.sleep(0) # isi tick ke baaki marks bhi aa jaayein
+    while _cache_sync["dirty"]:
+        kinds, _cache_sync["dirty"] = _cache_sync["dirty"], set()
+        try:
+            await db_counters.update_one({"_id": CACHE_VERSIONS_ID}, {"$inc": {kind: 1 for kind in kinds}}, upsert=True)
+        except Exception as e:
+            logger.error(f"Cache version bump karne me error ({', '.join(kinds)}): {e}")
+
+async def sync_cache_versions():
+    """Doosre workers ke writes ke baad local caches khaali karta hai (throttled)."""
+    if not CACHE_SYNC or time.monotonic() - _cache_sync["checked_at"] < CACHE_SYNC_INTERVAL:
+        return
+    _cache_sync["checked_at"] = time.monotonic() # concurrent updates dobara query na karein
+    try:
+        doc = await db_counters.find_one({"_id": CACHE_VERSIONS_ID}) or {}
+    except Exception as e:
+        logger.error(f"Cache versions padhne me error: {e}")
+        return
+    versions = {kind: doc.get(kind, 0) for kind in CACHE_KINDS}
+    known, _cache_sync["versions"] = _cache_sync["versions"], versions
+    # Pehli query par known khaali hai: startup ke baad ek baar sab caches saaf, jo safe hai
+    changed = {kind for kind in CACHE_KINDS if known.get(kind) != versions[kind]}
+    if "config" in changed:
+        invalidate_config()
+    if "subs" in changed:
+        SUB_CACHE.clear()
+    if "catalog" in changed:
+        CATALOG.clear()
+        CATALOG_NAMES.clear()
+        asyncio.ensure_future(rebuild_search_index()) # naye/hataaye gaye naam search mein bhi
+
+# --- Config Helper (TTL Cache) ---
+# bot_config sirf admin ke set_* flows se badalta hai, isliye use memory mein rakhte hain.
+# Admin writes update_config() se hote hain jo cache turant invalidate kar deta hai.
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", "300"))
+DEFAULT_CONFIG = {
+    "sub_qr_id": None, "donate_qr_id": None, "price": None,
+    "links": {"backup": None, "donate": None, "support": None},
+    "post_targets": [] # Post Generator ke /all targets (channels/groups)
+}
+_config_cache = {"doc": None, "expires_at": 0.0}
+
+def invalidate_config():
+    _config_cache["doc"] = None
+    _config_cache["expires_at"] = 0.0
+
 async def get_config():
-    """Database se bot config fetch karega (FIXED)"""
-    db = get_db()
-    if db is None: return {} # Return empty config if DB fails
-    
-    config = db['config'].find_one({"_id": "bot_config"})
+    """Bot config return karta hai (cache se, TTL khatam hone par DB se)."""
+    cached = _config_cache["doc"]
+    if cached is not None and time.monotonic() < _config_cache["expires_at"]:
+        return cached
+    try:
+        config = await db_config.find_one({"_id": "bot_config"})
+    except Exception as e:
+        logger.error(f"Config fetch karne me error: {e}")
+        return cached if cached is not None else {} # DB fail ho toh purana config hi sahi
     if not config:
-        default_config = {
-            "_id": "bot_config", "sub_qr_id": None, "donate_qr_id": None, "price": None, 
-            "links": {"backup": None, "donate": None, "support": None}
-        }
-        db['config'].insert_one(default_config)
-        return default_config
+        # Hot path par insert nahi karte, seed_config() startup par doc bana deta hai
+        config = {"_id": "bot_config", **copy.deepcopy(DEFAULT_CONFIG)}
+    _config_cache["doc"] = config
+    _config_cache["expires_at"] = time.monotonic() + CONFIG_CACHE_TTL
     return config
 
+async def update_config(fields: dict):
+    """Config mein fields set karta hai aur cache invalidate karta hai."""
+    await db_config.update_one({"_id": "bot_config"}, {"$set": fields}, upsert=True)
+    invalidate_config()
+    mark_cache_dirty("config")
+
+async def seed_config():
+    """Startup par config doc ensure karta hai aur cache bhar deta hai."""
+    await db_config.update_one({"_id": "bot_config"}, {"$setOnInsert": copy.deepcopy(DEFAULT_CONFIG)}, upsert=True)
+    invalidate_config()
+    await get_config()
+    logger.info("Bot config cache seed ho gaya.")
+
 # --- (FIXED) Subscription Check Helper ---
+# Har dl_/sendfile_ click par users.find_one na ho, isliye result per-user cache hota hai.
+# Active entry expiry_date par khud evict ho jaati hai; admin approve/reject par invalidate (sab workers par).
+SUB_CACHE_TTL = float(os.getenv("SUB_CACHE_TTL", "300"))
+SUB_CACHE = LRUCache(int(os.getenv("SUB_CACHE_MAX_SIZE", "100000")))
+
+def invalidate_user_subscription(user_id: int):
+    SUB_CACHE.pop(user_id)
+    mark_cache_dirty("subs")
+
 async def check_user_subscription(user_id: int):
-    """Check if user is subscribed and subscription is valid (FIXED)"""
-    db = get_db()
-    if db is None: 
+    """Check if user is subscribed and subscription is valid (cached)"""
+    cached = SUB_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+    status = await _fetch_user_subscription(user_id)
+    ttl = status.pop("cache_ttl", None)
+    if ttl: # DB error wale results cache nahi hote
+        SUB_CACHE.set(user_id, status, ttl=ttl)
+    return status
+
+async def _fetch_user_subscription(user_id: int):
+    """DB se subscription status nikalta hai (FIXED)"""
+    try:
+        user_data = await db_users.find_one({"_id": user_id})
+    except Exception as e:
+        logger.error(f"Subscription check me DB error: {e}")
         return {"active": False, "message": "DB connection error."}
         
-    user_data = db['users'].find_one({"_id": user_id})
     if not user_data or not user_data.get('subscribed', False):
-        return {"active": False, "message": "Subscribed nahi hai."}
+        return {"active": False, "message": "Subscribed nahi hai.", "cache_ttl": SUB_CACHE_TTL}
         
     expiry_date = user_data.get('expiry_date')
     if not expiry_date:
-        return {"active": False, "message": "Expiry date set nahi hai."}
+        return {"active": False, "message": "Expiry date set nahi hai.", "cache_ttl": SUB_CACHE_TTL}
         
     if datetime.now() > expiry_date:
-        # Subscription expire ho gaya hai, DB update karo
-        db['users'].update_one({"_id": user_id}, {"$set": {"subscribed": False}})
-        logger.info(f"User {user_id} ka subscription expire ho gaya.")
-        return {"active": False, "message": "Subscription expire ho gaya hai."}
+        # Read-only: `subscribed: False` likhne ka kaam sweep_expired_subscriptions job ka hai
+        return {"active": False, "message": "Subscription expire ho gaya hai.", "cache_ttl": SUB_CACHE_TTL}
         
-    # Sab theek hai
-    return {"active": True, "expiry_date": expiry_date.strftime("%Y-%m-%d %H:%M")}
+    # Sab theek hai; cache entry expiry_date se aage zinda nahi rehni chahiye
+    seconds_left = (expiry_date - datetime.now()).total_seconds()
+    return {"active": True, "expiry_date": expiry_date.strftime("%Y-%m-%d %H:%M"), "cache_ttl": min(SUB_CACHE_TTL, seconds_left)}
+
+# --- Episodes Collection ---
+# Episode files ab anime document ke andar nested nahi rehte (16 MB limit aur hot document).
+# Har file ek alag doc hai: {anime_id, season, episode, ep_no, quality, file_id, type}.
+# Anime document mein `seasons` sirf season markers rakhta hai: {"1": {}, "Movie": {}}.
+EPISODE_INDEXES = [
+    ([("anime_id", ASCENDING), ("season", ASCENDING), ("episode", ASCENDING), ("quality", ASCENDING)], {"name": "episode_file_unique", "unique": True}),
+    ([("anime_id", ASCENDING), ("season", ASCENDING), ("ep_no", ASCENDING)], {"name": "season_episode_order"}),
+]
+
+def episode_number(ep: str):
+    """Numeric episode number (sorting/range queries ke liye), text episodes ke liye None."""
+    return int(ep) if ep.isdigit() else None
+
+def episode_file_filter(anime_id, season: str, ep: str, quality: str):
+    return {"anime_id": anime_id, "season": season, "episode": ep, "quality": quality}
+
+def migrate_episodes(batch_size: int = 500):
+    """Purane nested `seasons.{s}.{ep}.{q}` files ko episodes collection mein le jaata hai.
+
+    Animes ko cursor se stream karta hai aur upserts ko batches mein likhta hai, isliye
+    dobara chalana safe hai. Har anime ke files likhne ke baad uske seasons sirf markers rehte hain.
+    """
+    db = get_db()
+    ensure_indexes()
+    stats = {"animes": 0, "files": 0}
+    ops, pending_animes = [], []
+
+    def flush():
+        # Pehle files likho, phir hi anime documents ko season markers tak chhota karo
+        if ops:
+            db['episodes'].bulk_write(ops, ordered=False)
+            stats["files"] += len(ops)
+        for anime_id, season_names in pending_animes:
+            db['animes'].update_one({"_id": anime_id}, {"$set": {"seasons": {s: {} for s in season_names}}})
+        stats["animes"] += len(pending_animes)
+        ops.clear()
+        pending_animes.clear()
+        logger.info(f"Migration progress: {stats['animes']} animes, {stats['files']} files.")
+
+    for anime in db['animes'].find({}, {"seasons": 1}, batch_size=batch_size):
+        seasons = anime.get("seasons") or {}
+        if not any(seasons.values()):
+            continue
+        for season, episodes in seasons.items():
+            for ep, qualities in (episodes or {}).items():
+                for quality, file_data in (qualities or {}).items():
+                    if not isinstance(file_data, dict) or "id" not in file_data:
+                        continue
+                    ops.append(UpdateOne(
+                        episode_file_filter(anime["_id"], season, ep, quality),
+                        {"$set": {"ep_no": episode_number(ep), "file_id": file_data["id"], "type": file_data.get("type")}},
+                        upsert=True
+                    ))
+        pending_animes.append((anime["_id"], list(seasons)))
+        if len(ops) >= batch_size:
+            flush()
+    flush()
+    logger.info(f"Migration complete: {stats['animes']} animes, {stats['files']} files.")
+    return stats
+
+# --- Media Caption Parsing ---
+# Bulk ingest aur storage-channel import dono filename/caption se season, episode aur quality
+# nikalte hain. Patterns env se override ho sakte hain (multiple patterns `||` se alag);
+# har pattern mein named group `episode` (ya `season`/`quality`) hona chahiye.
+# Patterns order mein try hote hain; ek pattern ke kai matches hon toh aakhri wala liya jaata hai
+# (title ke andar ke numbers jaise "Mob Psycho 100" ya "Kaiju No. 8" episode na banein).
+DEFAULT_EPISODE_PATTERNS = (
+    r"S\d{1,2}[\s._-]*E(?P<episode>\d{1,4})",
+    r"(?<![A-Za-z0-9])(?:Episode|Ep|E)[\s._-]*(?P<episode>\d{1,4})(?!\d)", # "_" bhi separator: "Naruto_Ep_05"
+    r"(?:^|\s)-[\s_]*(?P<episode>\d{1,4})(?:v\d)?(?=$|[\s._\-\[\]()])", # "Title - 05"
+    r"(?:^|[\s._\-\[(])(?!(?:19|20)\d{2}\b)(?P<episode>\d{1,4})(?=$|[\s._\-\])])",
+)
+DEFAULT_SEASON_PATTERNS = (
+    r"\bS(?P<season>\d{1,2})[\s._-]*E\d{1,4}",
+    r"\bSeason[\s._]*(?P<season>\d{1,2})\b", # "Season - 03" season nahi, episode hai
+    r"\b(?P<season>\d{1,2})(?:st|nd|rd|th)[\s._-]*Season\b", # "2nd Season"
+)
+DEFAULT_QUALITY_PATTERN = r"(?<![a-z0-9])(?P<quality>2160p|4k|1080p|720p|480p|360p)(?![a-z0-9])"
+
+def _compile_patterns(env_name: str, defaults) -> list:
+    raw = os.getenv(env_name)
+    patterns = raw.split("||") if raw else defaults
+    return [re.compile(p, re.IGNORECASE) for p in patterns if p]
+
+EPISODE_PATTERNS = _compile_patterns("EPISODE_PATTERNS", DEFAULT_EPISODE_PATTERNS)
+SEASON_PATTERNS = _compile_patterns("SEASON_PATTERNS", DEFAULT_SEASON_PATTERNS)
+QUALITY_PATTERN = _compile_patterns("QUALITY_PATTERN", (DEFAULT_QUALITY_PATTERN,))[0]
+QUALITY_ALIASES = {"2160p": "4K", "4k": "4K"}
+QUALITY_ORDER = ("360p", "480p", "720p", "1080p", "4K") # Low se high
+
+def quality_rank(quality: str) -> int:
+    return QUALITY_ORDER.index(quality) if quality in QUALITY_ORDER else -1
+
+def media_file(message):
+    """Message se (file_id, file_type, file_name); video/document na ho toh None."""
+    if message.video:
+        return message.video.file_id, "video", message.video.file_name
+    if message.document:
+        return message.document.file_id, "document", message.document.file_name
+    return None
+
+def parse_media_text(text: str) -> dict:
+    """Caption/filename se {"title", "season", "episode", "quality"} (jo mila).
+
+    Episode leading zeros ke bina aata hai; title pehle season/episode/quality marker se pehle ka
+    hissa hai, [tags] aur separators hata ke.
+    """
+    info = {}
+    if not text:
+        return info
+    markers = []
+    def mask(start, end):
+        # Same length ke spaces, taaki "1080"/season number episode na bane aur positions na khiskein
+        return text[:start] + " " * (end - start) + text[end:]
+    quality_match = QUALITY_PATTERN.search(text)
+    if quality_match:
+        quality = quality_match.group("quality").lower()
+        info["quality"] = QUALITY_ALIASES.get(quality, quality)
+        markers.append(quality_match.start())
+        text = mask(quality_match.start(), quality_match.end())
+    for pattern in SEASON_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            info["season"] = str(int(match.group("season")))
+            markers.append(match.start())
+            text = mask(*match.span("season"))
+            break
+    for pattern in EPISODE_PATTERNS:
+        matches = list(pattern.finditer(text))
+        if matches:
+            info["episode"] = str(int(matches[-1].group("episode")))
+            markers.append(matches[-1].start())
+            break
+    title = text[:min(markers)] if markers else re.sub(r"\.\w{2,4}$", "", text)
+    title = re.sub(r"\[[^\]]*\]|\([^)]*\)", " ", title)
+    title = " ".join(re.sub(r"[._\-|:]+", " ", title).split())
+    if title:
+        info["title"] = title
+    return info
+
+# --- Index Bootstrap ---
+# Pending payments sirf un users ke paas hain jinka pending_payment ek object hai; isi filter
+# par partial index bana hai, isliye saari pending queries yahi filter use karti hain.
+PENDING_PAYMENT_FILTER = {"pending_payment": {"$type": "object"}}
+INDEXES = {
+    "animes": [
+        ([("name", ASCENDING)], {"name": "anime_name_unique", "unique": True}),
+    ],
+    "users": [
+        ([("pending_payment", ASCENDING)], {"name": "pending_payment_partial", "partialFilterExpression": PENDING_PAYMENT_FILTER}),
+        ([("expiry_date", ASCENDING)], {"name": "active_expiry_date", "partialFilterExpression": {"subscribed": True}}),
+    ],
+    "episodes": EPISODE_INDEXES,
+    "batches": [
+        # Ek user ka ek hi season batch chal sakta hai (saare workers mein)
+        ([("user_id", ASCENDING)], {"name": "one_running_batch_per_user", "unique": True, "partialFilterExpression": {"status": "running"}}),
+    ],
+    "import_messages": [
+        ([("chat_id", ASCENDING), ("message_id", ASCENDING)], {"name": "import_messages_chat"}),
+    ],
+    "persistence": [
+        ([("user_id", ASCENDING)], {"name": "persistence_user_id"}),
+        ([("name", ASCENDING)], {"name": "persistence_conversation_name", "partialFilterExpression": {"kind": "conversation"}}),
+    ],
+}
+
+def ensure_indexes():
+    """Saare indexes ensure karta hai (idempotent) aur naye bane indexes ki report deta hai."""
+    db = get_db()
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = set(collection.index_information())
+        for keys, options in indexes:
+            if options["name"] in existing:
+                continue
+            try:
+                collection.create_index(keys, **options)
+                created.append(f"{collection_name}.{options['name']}")
+            except OperationFailure as e:
+                # Jaise: purane duplicate anime names ki wajah se unique index nahi ban paya
+                logger.error(f"Index {collection_name}.{options['name']} nahi ban paya: {e}")
+    if created:
+        logger.info(f"Naye indexes bane: {', '.join(created)}")
+    else:
+        logger.info("Saare indexes pehle se maujood hain.")
+    return created
+
+def _plan_stages(plan: dict):
+    """explain() ke winning plan ke saare stage names (upar se neeche)."""
+    plan = plan.get("queryPlan", plan) # SBE explain format
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages += _plan_stages(child)
+    return stages
+
+def explain_hot_queries():
+    """Hot queries ko explain() se check karta hai: index use hua ya collection scan."""
+    db = get_db()
+    sample_anime = db['animes'].find_one({}, {"_id": 1, "name": 1}) or {"_id": None, "name": ""}
+    hot_queries = [
+        ("animes", {"name": sample_anime["name"]}, {"_id": 0, "name": 1}),
+        ("users", PENDING_PAYMENT_FILTER, {"_id": 1}),
+        ("users", {"subscribed": True, "expiry_date": {"$lte": datetime.now()}}, {"_id": 0, "expiry_date": 1}),
+        ("episodes", {"anime_id": sample_anime["_id"], "season": "1"}, {"_id": 0, "anime_id": 1, "season": 1, "ep_no": 1}),
+        ("episodes", episode_file_filter(sample_anime["_id"], "1", "1", "720p"), {"_id": 0, "file_id": 1, "type": 1}),
+    ]
+    report = []
+    for collection_name, query, projection in hot_queries:
+        explain = db[collection_name].find(query, projection).explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        row = {
+            "collection": collection_name,
+            "filter": str(query),
+            "stages": stages,
+            "uses_index": "COLLSCAN" not in stages,
+            "covered": "COLLSCAN" not in stages and "FETCH" not in stages,
+        }
+        report.append(row)
+        logger.info(f"explain {collection_name} {query}: {' <- '.join(filter(None, stages))} (covered={row['covered']})")
+    return report
+
+# --- Pending Payments Counter ---
+# Admin panel har render par count_documents na kare, isliye pending queue ka counter
+# `counters` collection mein atomically maintain hota hai. Sirf pending state ke asli
+# transitions (none -> pending, pending -> none) par $inc hota hai; ek periodic job
+# counter ko asli count se reconcile karta hai.
+PENDING_COUNTER_ID = "pending_payments"
+PENDING_RECONCILE_INTERVAL = int(os.getenv("PENDING_RECONCILE_INTERVAL", "900"))
+
+async def get_pending_count() -> int:
+    doc = await db_counters.find_one({"_id": PENDING_COUNTER_ID})
+    return max(doc.get("count", 0), 0) if doc else 0
+
+async def adjust_pending_count(delta: int):
+    await db_counters.update_one({"_id": PENDING_COUNTER_ID}, {"$inc": {"count": delta}}, upsert=True)
+
+async def clear_pending_payment(user_id: int, extra_fields: dict = None):
+    """User ka pending_payment hatata hai; agar sach mein pending tha toh counter ghatata hai."""
+    before = await db_users.find_one_and_update(
+        {"_id": user_id},
+        {"$set": {"pending_payment": None, **(extra_fields or {})}},
+        projection={"pending_payment": 1},
+        upsert=bool(extra_fields), # approve naya user bhi bana sakta hai, reject nahi
+        return_document=ReturnDocument.BEFORE
+    )
+    if before and isinstance(before.get("pending_payment"), dict):
+        await adjust_pending_count(-1)
+
+async def reconcile_pending_count(context: ContextTypes.DEFAULT_TYPE = None):
+    """Counter ko asli pending count se sync karta hai (JobQueue job).
+
+    Counter pehle padhte hain, phir count, aur fark sirf tab $inc hota hai jab counter abhi bhi wahi
+    value par ho (compare-and-set). Beech mein koi approve/reject hua toh is run mein kuch nahi
+    likhte (woh $inc kho na jaaye); agla run dobara reconcile karega.
+    """
+    try:
+        doc = await db_counters.find_one({"_id": PENDING_COUNTER_ID})
+        real_count = await db_users.count_documents(PENDING_PAYMENT_FILTER)
+        if doc is None:
+            try:
+                await db_counters.insert_one({"_id": PENDING_COUNTER_ID, "count": real_count})
+            except DuplicateKeyError:
+                pass # Isi beech kisi $inc ne doc bana diya; agla run theek karega
+            return
+        seen = doc.get("count", 0)
+        if seen == real_count:
+            return
+        result = await db_counters.update_one({"_id": PENDING_COUNTER_ID, "count": seen}, {"$inc": {"count": real_count - seen}})
+        if result.modified_count:
+            logger.warning(f"Pending counter drift theek kiya: {seen} -> {real_count}")
+    except Exception as e:
+        logger.error(f"Pending counter reconcile karne me error: {e}")
+
+# --- Catalog Index ---
+# Har navigation click par DB se poora data fetch na ho, isliye har anime ka index memory mein
+# rehta hai: season markers, har season ka chhota summary (bhare hue pages, extras, qualities) aur
+# navigation keyboards. Episodes poore season ke saath load nahi hote: list ek page (ep_no range)
+# ki indexed query se aati hai, aur quality view sirf us episode ki files laata hai.
+# Admin ke content writes index ko incrementally update karte hain aur doosre workers ke liye
+# "catalog" cache version badhate hain (dekho Cross-Worker Cache Versions).
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "600"))
+CATALOG = LRUCache(int(os.getenv("CATALOG_CACHE_MAX_SIZE", "2000")))
+CATALOG_NAMES = LRUCache(int(os.getenv("CATALOG_CACHE_MAX_SIZE", "2000"))) # anime_id -> name
+CATALOG_PROJECTION = {"name": 1, "poster_id": 1, "description": 1, "seasons": 1}
+# Download navigation ke keyboards (season list + har season ke episode pages) har entry par cache
+# hote hain (entry ke saath hi evict/expire), aur upar ke mutation hooks jo entry methods call karte
+# hain wahi unhe invalidate karte hain. Quality keyboards per-episode hain, isliye cache nahi hote:
+# unki ginti episodes jitni hai, aur ek episode ki files se banana sasta hai.
+KEYBOARD_CACHE_STATS = Counter()
+
+_DIGIT_CHUNKS = re.compile(r"(\d+)")
+
+def sort_key(key: str):
+    """Natural sort: digit chunks numerically ("2" < "10", "OVA 2" < "OVA 10"), pure numbers
+    text keys ("Movie", "Special") se pehle. Mixed keys par bhi kabhi TypeError nahi."""
+    return tuple((0, int(chunk), "") if chunk.isdigit() else (1, 0, chunk.lower()) for chunk in _DIGIT_CHUNKS.split(key) if chunk)
+
+class CatalogEntry:
+    """Ek anime ka in-memory index. `seasons[s]` None hai jab tak season ke episodes memory mein
+    nahi hain (sirf isi process mein bane naye seasons ka poora data memory mein hota hai)."""
+    __slots__ = ("id", "name", "poster_id", "description", "seasons", "_season_keys", "_episode_keys", "_season_summary", "_keyboards")
+    def __init__(self, doc: dict):
+        self.id = doc["_id"]
+        self.name = doc["name"]
+        self.poster_id = doc.get("poster_id")
+        self.description = doc.get("description")
+        self.seasons = {s: None for s in (doc.get("seasons") or {})}
+        self._season_keys = None
+        self._episode_keys = {}
+        self._season_summary = {} # season -> {"pages", "has_extras", "qualities"}
+        self._keyboards = {} # (season, "seasons" | "episodes:{page}") -> InlineKeyboardMarkup
+    def get_keyboard(self, season, view: str):
+        """Cached navigation keyboard (sab users ke liye same), ya None."""
+        markup = self._keyboards.get((season, view))
+        KEYBOARD_CACHE_STATS["hits" if markup is not None else "misses"] += 1
+        return markup
+    def set_keyboard(self, season, view: str, markup):
+        self._keyboards[(season, view)] = markup
+        return markup
+    def invalidate_keyboards(self, season=None):
+        """Season ke keyboards (aur summary) hatao; season None ho toh poore anime ke."""
+        if season is None:
+            self._keyboards.clear()
+            self._season_summary.clear()
+        else:
+            self._season_summary.pop(season, None)
+            for key in [k for k in self._keyboards if k[0] == season]:
+                del self._keyboards[key]
+    def season_keys(self):
+        if self._season_keys is None:
+            self._season_keys = sorted(self.seasons, key=sort_key)
+        return self._season_keys
+    def is_loaded(self, season: str):
+        return self.seasons.get(season) is not None
+    def episode_keys(self, season: str):
+        if season not in self._episode_keys:
+            self._episode_keys[season] = sorted(self.seasons.get(season) or {}, key=sort_key)
+        return self._episode_keys[season]
+    def qualities(self, season: str, ep: str):
+        return (self.seasons.get(season) or {}).get(ep, {})
+    def add_season(self, season: str):
+        if season not in self.seasons:
+            self.seasons[season] = {}
+            self._season_keys = None
+            self.invalidate_keyboards(None)
+    def remove_season(self, season: str):
+        self.seasons.pop(season, None)
+        self._season_keys = None
+        self._episode_keys.pop(season, None)
+        self.invalidate_keyboards(None)
+    def add_file(self, season: str, ep: str, quality: str, file_data: dict):
+        if season not in self.seasons:
+            self.seasons[season] = None
+            self._season_keys = None
+            self.invalidate_keyboards(None)
+        if self.is_loaded(season):
+            self.seasons[season].setdefault(ep, {})[quality] = file_data
+            self._episode_keys.pop(season, None)
+        self.invalidate_keyboards(season)
+
+async def catalog_get(anime_name: str):
+    """Anime ka CatalogEntry return karta hai (None agar anime nahi hai)."""
+    entry = CATALOG.get(anime_name)
+    if entry is None:
+        doc = await db_animes.find_one({"name": anime_name}, CATALOG_PROJECTION)
+        if not doc:
+            return None
+        entry = catalog_add_anime(doc)
+    return entry
+
+async def catalog_get_by_id(anime_id: ObjectId):
+    """Callback data mein anime ka _id hota hai; usse CatalogEntry."""
+    name = CATALOG_NAMES.get(anime_id)
+    entry = CATALOG.get(name) if name is not None else None
+    if entry is None:
+        doc = await db_animes.find_one({"_id": anime_id}, CATALOG_PROJECTION)
+        if not doc:
+            return None
+        entry = catalog_add_anime(doc)
+    return entry
+
+# Episode lists ep_no ranges mein page hoti hain (1-25, 26-50, ...); text episodes ("Special",
+# "OVA") jinka ep_no None hai, alag "Extras" page par. Page ki query (anime_id, season, ep_no)
+# index par range scan hai, isliye 500-episode season mein bhi sirf 25 keys aati hain.
+# Sirf wahi ranges page banti hain jinmein sach mein episode hai (episode 0 page "0" mein), isliye
+# 1-5 aur 200 wale season mein do hi pages hain, beech ke khaali ranges nahi.
+EPISODE_PAGE_SIZE = int(os.getenv("EPISODE_PAGE_SIZE", "25"))
+EXTRAS_PAGE = "x"
+
+def page_of_episode(ep: str) -> str:
+    n = episode_number(ep)
+    return str(max(n - 1, 0) // EPISODE_PAGE_SIZE) if n is not None else EXTRAS_PAGE
+
+def page_label(page: str) -> str:
+    if page == EXTRAS_PAGE:
+        return "Extras"
+    lo = int(page) * EPISODE_PAGE_SIZE + 1
+    return f"{lo}-{lo + EPISODE_PAGE_SIZE - 1}"
+
+def episode_pages(summary: dict) -> list:
+    pages = [str(p) for p in summary["pages"]]
+    if summary["has_extras"]:
+        pages.append(EXTRAS_PAGE)
+    return pages
+
+def page_jump_rows(pages: list, current: str, callback_for, per_row: int = 4, window: int = 2, max_buttons: int = 12):
+    """Range-jump buttons; bahut pages hon toh pehla, aakhri aur current ke aas-paas wale."""
+    if len(pages) <= 1:
+        return []
+    visible = pages
+    if len(pages) > max_buttons:
+        numeric = [p for p in pages if p != EXTRAS_PAGE]
+        i = numeric.index(current) if current in numeric else len(numeric) - 1
+        keep = {0, len(numeric) - 1} | set(range(max(0, i - window), min(len(numeric), i + window + 1)))
+        visible = [numeric[j] for j in sorted(keep)] + [p for p in pages if p == EXTRAS_PAGE]
+    buttons = [InlineKeyboardButton(("• " if p == current else "") + page_label(p), callback_data=callback_for(p)) for p in visible]
+    return [buttons[i:i + per_row] for i in range(0, len(buttons), per_row)]
+
+async def catalog_season_summary(entry: CatalogEntry, season: str):
+    """{pages, has_extras, qualities} ek aggregate se; entry par cache (writes par invalidate).
+    `pages` bhare hue numeric pages hain (page_of_episode wala hi hisaab), sorted."""
+    summary = entry._season_summary.get(season)
+    if summary is None:
+        rows = await db_episodes.aggregate([
+            {"$match": {"anime_id": entry.id, "season": season}},
+            {"$group": {
+                "_id": None,
+                # Text episode -> None (Extras), warna max(ep_no - 1, 0) // EPISODE_PAGE_SIZE
+                "pages": {"$addToSet": {"$cond": [
+                    {"$eq": [{"$ifNull": ["$ep_no", None]}, None]}, None,
+                    {"$floor": {"$divide": [{"$max": [{"$subtract": ["$ep_no", 1]}, 0]}, EPISODE_PAGE_SIZE]}},
+                ]}},
+                "qualities": {"$addToSet": "$quality"},
+            }},
+        ])
+        row = rows[0] if rows else {}
+        pages = row.get("pages") or []
+        summary = {
+            "pages": sorted({int(p) for p in pages if p is not None}),
+            "has_extras": None in pages,
+            "qualities": sorted(row.get("qualities") or [], key=lambda q: (quality_rank(q), q)),
+        }
+        entry._season_summary[season] = summary
+    return summary
+
+async def catalog_episode_page(entry: CatalogEntry, season: str, page: str):
+    """Sirf ek page ke sorted episode keys."""
+    if entry.is_loaded(season):
+        return [ep for ep in entry.episode_keys(season) if page_of_episode(ep) == page]
+    if page == EXTRAS_PAGE:
+        ep_filter = {"ep_no": None}
+    else:
+        hi = (int(page) + 1) * EPISODE_PAGE_SIZE
+        ep_filter = {"ep_no": {"$lte": hi}} if page == "0" else {"ep_no": {"$gt": hi - EPISODE_PAGE_SIZE, "$lte": hi}}
+    docs = await db_episodes.find({"anime_id": entry.id, "season": season, **ep_filter}, {"_id": 0, "episode": 1}, sort=[("ep_no", ASCENDING)])
+    return sorted({d["episode"] for d in docs}, key=sort_key)
+
+async def catalog_qualities(entry: CatalogEntry, season: str, ep: str):
+    """Episode ki qualities: {quality: {"id", "type"}} (season memory mein na ho toh sirf is episode ki files)."""
+    if entry.is_loaded(season):
+        return entry.qualities(season, ep)
+    docs = await db_episodes.find({"anime_id": entry.id, "season": season, "episode": ep}, {"_id": 0, "quality": 1, "file_id": 1, "type": 1})
+    return {d["quality"]: {"id": d["file_id"], "type": d["type"]} for d in docs}
+
+async def catalog_file(entry: CatalogEntry, season: str, ep: str, quality: str):
+    """Ek file ka data; season load nahi hai toh indexed point lookup."""
+    if entry.is_loaded(season):
+        return entry.qualities(season, ep).get(quality)
+    doc = await db_episodes.find_one(episode_file_filter(entry.id, season, ep, quality), {"_id": 0, "file_id": 1, "type": 1})
+    return {"id": doc["file_id"], "type": doc["type"]} if doc else None
+
+def catalog_add_anime(doc: dict):
+    entry = CatalogEntry(doc)
+    CATALOG.set(entry.name, entry, ttl=CATALOG_CACHE_TTL)
+    CATALOG_NAMES.set(entry.id, entry.name, ttl=CATALOG_CACHE_TTL)
+    return entry
+
+def catalog_remove_anime(anime_name: str):
+    entry = CATALOG.get(anime_name)
+    if entry is not None: CATALOG_NAMES.pop(entry.id)
+    CATALOG.pop(anime_name)
+    mark_cache_dirty("catalog")
+
+def catalog_add_season(anime_name: str, season: str):
+    entry = CATALOG.get(anime_name)
+    if entry is not None: entry.add_season(season)
+    mark_cache_dirty("catalog")
+
+def catalog_remove_season(anime_name: str, season: str):
+    entry = CATALOG.get(anime_name)
+    if entry is not None: entry.remove_season(season)
+    mark_cache_dirty("catalog")
+
+def catalog_add_file(anime_name: str, season: str, ep: str, quality: str, file_data: dict):
+    entry = CATALOG.get(anime_name)
+    if entry is not None: entry.add_file(season, ep, quality, file_data)
+    mark_cache_dirty("catalog")
+
+# --- Search Index ---
+# Anime names ka in-memory search: har word se shuru hone wale prefixes ke liye trie,
+# aur typos ke liye trigram fuzzy match. Startup par bana, add/delete par update hota hai,
+# aur doosre workers ke changes ke liye periodically rebuild hota hai.
+SEARCH_REFRESH_INTERVAL = int(os.getenv("SEARCH_REFRESH_INTERVAL", "600"))
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", "0.3"))
+
+def normalize_search_text(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class AnimeSearchIndex:
+    """Prefix trie + trigram index over anime names."""
+    _END = "\0"
+    def __init__(self):
+        self._trie = {}
+        self._trigrams = {}
+        self._name_trigrams = {}
+        self.meta = {} # name -> {"id": anime _id, "poster_id": ...}
+    def __len__(self):
+        return len(self.meta)
+    def add(self, name: str, anime_id: ObjectId, poster_id: str = None):
+        self.remove(name)
+        self.meta[name] = {"id": anime_id, "poster_id": poster_id}
+        norm = normalize_search_text(name)
+        words = norm.split()
+        # Har word se shuru hone wala suffix trie mein jaata hai ("piece" -> "One Piece")
+        for i in range(len(words)):
+            node = self._trie
+            for ch in " ".join(words[i:]):
+                node = node.setdefault(ch, {})
+            node.setdefault(self._END, set()).add(name)
+        grams = trigrams(norm)
+        self._name_trigrams[name] = grams
+        for gram in grams:
+            self._trigrams.setdefault(gram, set()).add(name)
+    def remove(self, name: str):
+        if name not in self.meta:
+            return
+        del self.meta[name]
+        words = normalize_search_text(name).split()
+        for i in range(len(words)):
+            node = self._trie
+            for ch in " ".join(words[i:]):
+                node = node.get(ch)
+                if node is None: break
+            else:
+                node.get(self._END, set()).discard(name)
+        for gram in self._name_trigrams.pop(name, ()):
+            self._trigrams.get(gram, set()).discard(name)
+    def _prefix(self, prefix: str, limit: int):
+        node = self._trie
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        found, stack = [], [node]
+        while stack and len(found) < limit:
+            node = stack.pop()
+            for key, child in node.items():
+                if key == self._END:
+                    found.extend(n for n in child if n not in found)
+                else:
+                    stack.append(child)
+        return sorted(found)[:limit]
+    def _fuzzy(self, query: str, limit: int):
+        query_grams = trigrams(query)
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self._trigrams.get(gram, ()))
+        scored = []
+        for name, common in overlap.items():
+            score = common / (len(query_grams) + len(self._name_trigrams[name]) - common)
+            if score >= SEARCH_MIN_SCORE:
+                scored.append((-score, name))
+        return [name for _, name in sorted(scored)[:limit]]
+    def starts_with(self, query: str, limit: int = 50):
+        """Wo naam jinki shuruaat hi `query` hai (trie mein beech ke words se bhi entries hain, wo nahi)."""
+        norm = normalize_search_text(query or "")
+        if not norm:
+            return []
+        return [name for name in self._prefix(norm, limit) if normalize_search_text(name).startswith(norm)]
+    def search(self, query: str, limit: int = 10):
+        """Prefix matches pehle, phir fuzzy matches (score ke order mein)."""
+        norm = normalize_search_text(query)
+        if not norm:
+            return []
+        results = self._prefix(norm, limit)
+        if len(results) < limit:
+            results += [n for n in self._fuzzy(norm, limit) if n not in results][:limit - len(results)]
+        return results
+
+SEARCH_INDEX = AnimeSearchIndex()
+
+async def rebuild_search_index(context: ContextTypes.DEFAULT_TYPE = None):
+    """Poora search index DB se naya banata hai (startup + JobQueue job)."""
+    global SEARCH_INDEX
+    try:
+        docs = await db_animes.find({}, {"name": 1, "poster_id": 1})
+    except Exception as e:
+        logger.error(f"Search index rebuild me error: {e}")
+        return
+    index = AnimeSearchIndex()
+    for doc in docs:
+        index.add(doc["name"], doc["_id"], doc.get("poster_id"))
+    SEARCH_INDEX = index
+    logger.info(f"Search index bana: {len(index)} animes.")
+
+# --- Callback Data Codec ---
+# Download navigation ka callback_data compact binary hai: "~1" (version) + base64url(payload).
+# Payload = op byte + anime ka 12-byte ObjectId + typed fields. Har field ka header byte = kind (2 bits)
+# + length (6 bits): text (UTF-8), int (big-endian) ya key (season/quality naam ka 4-byte hash).
+# Season aur quality naam kabhi callback mein nahi jaate, episode number int ki tarah jaata hai,
+# isliye bahut lambe season names bhi 64-byte limit mein rehte hain. Click par key entry ki asli
+# seasons/qualities se match hoti hai (resolve_callback_fields).
+CB_PREFIX = "~1"
+CB_MAX_BYTES = 64
+CB_OP_DOWNLOAD = 1   # fields: [season[, ep]]
+CB_OP_SEND_FILE = 2  # fields: season, ep, quality
+CB_OP_SEND_SEASON = 3 # fields: season[, quality] (quality na ho toh har episode ki best)
+CB_OP_CANCEL_BATCH = 4 # fields: job_id
+CB_OP_EPISODE_PAGE = 5 # fields: season, page (ep_no range index ya "x" = Extras)
+CB_FIELD_TEXT, CB_FIELD_INT, CB_FIELD_KEY = 0, 1, 2
+CB_FIELD_MAX_LEN = 63
+
+def callback_key(name: str) -> bytes:
+    """Season/quality naam ka 4-byte hash (callback mein naam ki jagah)."""
+    return hashlib.blake2s(name.encode("utf-8"), digest_size=4).digest()
+
+def callback_episode(ep: str):
+    """Normal episode ("12") int ki tarah, "05"/"12.5"/"OVA" jaise episodes text hi rehte hain."""
+    num = episode_number(ep)
+    return num if num is not None and str(num) == ep else ep
+
+def callback_page(page: str):
+    return int(page) if page != EXTRAS_PAGE else page
+
+def encode_callback(op: int, anime_id: ObjectId, *fields) -> str:
+    """fields: bytes (callback_key), int ya str."""
+    payload = bytearray((op,)) + anime_id.binary
+    for field in fields:
+        if isinstance(field, bytes):
+            kind, raw = CB_FIELD_KEY, field
+        elif isinstance(field, int):
+            kind, raw = CB_FIELD_INT, field.to_bytes(max(1, (field.bit_length() + 7) // 8), "big")
+        else:
+            kind, raw = CB_FIELD_TEXT, str(field).encode("utf-8")
+        if len(raw) > CB_FIELD_MAX_LEN:
+            raise ValueError(f"Callback field bahut lamba hai: {field!r}")
+        payload.append(kind << 6 | len(raw))
+        payload += raw
+    data = CB_PREFIX + base64.urlsafe_b64encode(bytes(payload)).rstrip(b"=").decode("ascii")
+    if len(data) > CB_MAX_BYTES:
+        raise ValueError(f"Callback data {len(data)} bytes ka hai (limit {CB_MAX_BYTES}).")
+    return data
+
+def decode_callback(data: str):
+    """(op, anime_id, fields) return karta hai (fields: str/int/bytes); galat data par ValueError."""
+    if not data.startswith(CB_PREFIX):
+        raise ValueError("Callback prefix match nahi hua.")
+    encoded = data[len(CB_PREFIX):]
+    try:
+        payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    except Exception as e:
+        raise ValueError(f"Callback decode nahi hua: {e}")
+    if len(payload) < 13:
+        raise ValueError("Callback payload chhota hai.")
+    op, anime_id, fields, pos = payload[0], ObjectId(payload[1:13]), [], 13
+    while pos < len(payload):
+        kind, size = payload[pos] >> 6, payload[pos] & CB_FIELD_MAX_LEN
+        raw = payload[pos + 1:pos + 1 + size]
+        if len(raw) != size:
+            raise ValueError("Callback field truncated hai.")
+        if kind == CB_FIELD_TEXT:
+            fields.append(raw.decode("utf-8"))
+        elif kind == CB_FIELD_INT:
+            fields.append(int.from_bytes(raw, "big"))
+        elif kind == CB_FIELD_KEY:
+            fields.append(bytes(raw))
+        else:
+            raise ValueError(f"Callback field kind {kind} galat hai.")
+        pos += 1 + size
+    return op, anime_id, fields
+
+# --- Rate Limiting ---
+# Telegram limits: poore bot ke liye ~30 msg/sec, aur ek chat mein ~1 msg/sec.
+# TELEGRAM_GLOBAL_RATE poore bot ka budget hai. Webhook mode mein har gunicorn worker (WEB_WORKERS)
+# ka apna limiter hota hai, isliye har process ko budget / workers milta hai, taaki sab milakar limit ke andar rahein.
+TELEGRAM_WORKER_COUNT = max(int(os.getenv("WEB_WORKERS", "1")), 1) if os.getenv("BOT_MODE", "polling").lower() == "webhook" else 1
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25")) / TELEGRAM_WORKER_COUNT
+TELEGRAM_PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", "1"))
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens/sec, `capacity` tak burst."""
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    async def acquire(self, tokens: float = 1):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+# Priority classes (chhota number = pehle jaata hai). `rate_limit_args=` se pass karo.
+PRIORITY_INTERACTIVE = 0  # Menus, edits, callback replies
+PRIORITY_FILE = 1         # Episode file delivery
+PRIORITY_ADMIN = 2        # Admin/user notifications, channel posts
+PRIORITY_BROADCAST = 3    # Bulk announcements
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_FILE: "file", PRIORITY_ADMIN: "admin", PRIORITY_BROADCAST: "broadcast"}
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))  # Groups/channels: ~20 msg/min
+TELEGRAM_PER_CHAT_BURST = float(os.getenv("TELEGRAM_PER_CHAT_BURST", "3"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+# Sirf ye endpoints message limits mein count hote hain; baaki (answerCallbackQuery, getUpdates...) seedha jaate hain
+THROTTLED_ENDPOINT_PREFIXES = ("send", "edit", "copy", "forward")
+# Edits user ke click par usi ke message ki navigation hain; ye sirf global bucket mein count hote hain,
+# per-chat bucket mein nahi (warna tez navigation 1/sec par atak jaati)
+PER_CHAT_EXEMPT_PREFIXES = ("edit",)
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Saare bot API calls ke liye central limiter (PTB `builder.rate_limiter` hook).
+
+    Per-chat bucket (private ~1/sec, groups ~20/min; edits exempt) ke baad global bucket milta hai
+    (is process ka hissa, dekho TELEGRAM_WORKER_COUNT), jiska queue priority order mein serve hota hai.
+    RetryAfter aane par poora bot utni der pause hota hai aur request khud retry hoti hai.
+    """
+    def __init__(self, global_rate: float = TELEGRAM_GLOBAL_RATE, per_chat_rate: float = TELEGRAM_PER_CHAT_RATE,
+                 group_rate: float = TELEGRAM_GROUP_RATE, max_retries: int = TELEGRAM_MAX_RETRIES, max_chats: int = 10000):
+        self.rate = global_rate
+        self.capacity = max(global_rate, 1)
+        self.per_chat_rate = per_chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = [] # heap: (priority, seq, future)
+        self._seq = 0
+        self._dispatcher = None
+        self._chat_buckets = LRUCache(max_chats)
+        self.stats = Counter()
+        self.max_queue_depth = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or int(chat_id) < 0
+            bucket = TokenBucket(self.group_rate if is_group else self.per_chat_rate, capacity=TELEGRAM_PER_CHAT_BURST)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    def _take_token(self) -> float:
+        """Token mil gaya toh 0, warna kitne seconds baad milega."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def _acquire_global(self, priority: int):
+        if not self._waiters and self._take_token() == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (priority, self._seq, future))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        started = time.monotonic()
+        await future
+        self.stats[f"wait_ms_{PRIORITY_NAMES.get(priority, priority)}"] += int((time.monotonic() - started) * 1000)
+
+    async def _dispatch(self):
+        while self._waiters:
+            wait = self._take_token()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                self._tokens += 1 # Waiter cancel ho gaya, token waapas
+                continue
+            future.set_result(None)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = rate_limit_args if rate_limit_args is not None else PRIORITY_INTERACTIVE
+        throttled = endpoint.startswith(THROTTLED_ENDPOINT_PREFIXES)
+        per_chat = throttled and not endpoint.startswith(PER_CHAT_EXEMPT_PREFIXES)
+        chat_id = data.get("chat_id")
+        self.stats[f"requests_{PRIORITY_NAMES.get(priority, priority)}"] += 1
+        for attempt in range(self.max_retries + 1):
+            if throttled:
+                if per_chat and chat_id is not None:
+                    await self._chat_bucket(chat_id).acquire()
+                await self._acquire_global(priority)
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except Exception as e:
+                TELEGRAM_ERRORS.inc(endpoint=endpoint, error=type(e).__name__)
+                if not isinstance(e, RetryAfter):
+                    raise
+                delay = retry_after_seconds(e)
+                self.stats["retry_after"] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Flood wait {delay:.0f}s ({endpoint}, chat {chat_id}), attempt {attempt + 1}")
+                if attempt == self.max_retries:
+                    self.stats["gave_up"] += 1
+                    raise
+                if not throttled:
+                    await asyncio.sleep(delay)
+            finally:
+                TELEGRAM_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+
+    def snapshot(self) -> dict:
+        waiters = list(self._waiters)
+        by_priority = Counter(PRIORITY_NAMES.get(p, p) for p, _, f in waiters if not f.done())
+        return {
+            "queue_depth": sum(by_priority.values()),
+            "queue_depth_by_priority": dict(by_priority),
+            "max_queue_depth": self.max_queue_depth,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "tracked_chats": len(self._chat_buckets),
+            **self.stats,
+        }
+
+OUTBOUND_LIMITER = OutboundRateLimiter()
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    # PTB ke naye versions mein retry_after timedelta hai, purane mein int
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+# --- Broadcast Engine ---
+# Naya episode save hote hi saare active subscribers ko announcement jaata hai.
+# Recipients `_id` order mein batches mein stream hote hain; har batch ke baad progress
+# `broadcasts` collection mein checkpoint hota hai, isliye crash/restart ke baad wahin se resume.
+# Ek lease (owner + lease_until) ensure karti hai ki ek broadcast ek hi worker chalaye; owner ek
+# alag timer task se lease renew karta hai (lambe batch ke beech bhi), aur har worker periodically
+# expire hui leases (crash) aur failed broadcasts (BROADCAST_MAX_ATTEMPTS tak, backoff ke saath) claim karta hai.
+BROADCAST_NEW_EPISODES = os.getenv("BROADCAST_NEW_EPISODES", "1") == "1"
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "200"))
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", "120"))
+BROADCAST_RESUME_INTERVAL = int(os.getenv("BROADCAST_RESUME_INTERVAL", "60"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "5"))
+BROADCAST_RETRY_DELAY = int(os.getenv("BROADCAST_RETRY_DELAY", "60")) # attempt ke saath badhta hai
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def active_subscriber_filter():
+    return {"subscribed": True, "expiry_date": {"$gt": datetime.now()}}
+
+async def is_new_episode(entry, season_name: str, ep_num: str, quality: str) -> bool:
+    """Abhi upsert hui file episode ki pehli quality hai? (replace/doosri quality par broadcast nahi)"""
+    other = await db_episodes.find_one(
+        {"anime_id": entry.id, "season": season_name, "episode": ep_num, "quality": {"$ne": quality}}, {"_id": 1}
+    )
+    return other is None
+
+async def create_episode_broadcast(application: Application, entry, season_name: str, ep_num: str):
+    """Naye episode ka broadcast banata hai (ek episode ka sirf ek, chahe kitni qualities upload hon).
+    Sirf tab bulao jab episode sach mein naya ho (dekho is_new_episode)."""
+    now = datetime.now()
+    doc = {
+        "_id": f"episode:{entry.id}:{season_name}:{ep_num}",
+        "payload": {"anime_id": entry.id, "anime_name": entry.name, "poster_id": entry.poster_id, "season": season_name, "ep": ep_num},
+        "status": "running", "last_user_id": None, "sent": 0, "failed": 0, "blocked": 0, "attempts": 1,
+        "owner": worker_id(), "lease_until": now + timedelta(seconds=BROADCAST_LEASE_SECONDS),
+        "created_at": now, "updated_at": now,
+    }
+    try:
+        await db_broadcasts.insert_one(doc)
+    except DuplicateKeyError:
+        return # Is episode ka broadcast pehle hi ho chuka/chal raha hai
+    application.create_task(run_broadcast(application, doc))
+
+async def resume_broadcasts(application: Application):
+    """Adhoore broadcasts (lease expire = owner crash) aur retry ke laayak failed broadcasts claim karke resume karta hai."""
+    while True:
+        now = datetime.now()
+        try:
+            doc = await db_broadcasts.find_one_and_update(
+                {"$or": [
+                    {"status": "running", "lease_until": {"$lt": now}},
+                    {"status": "failed", "lease_until": {"$lt": now}, "attempts": {"$lt": BROADCAST_MAX_ATTEMPTS}},
+                ]},
+                {"$set": {"status": "running", "owner": worker_id(), "lease_until": now + timedelta(seconds=BROADCAST_LEASE_SECONDS)}, "$inc": {"attempts": 1}},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            logger.error(f"Broadcasts resume karne me error: {e}")
+            return
+        if not doc:
+            return
+        logger.info(f"Broadcast {doc['_id']} resume ho raha hai (attempt {doc['attempts']}, last user {doc.get('last_user_id')}).")
+        application.create_task(run_broadcast(application, doc))
+
+async def resume_broadcasts_job(context: ContextTypes.DEFAULT_TYPE):
+    await resume_broadcasts(context.application)
+
+async def _renew_broadcast_lease(broadcast_id: str, owner: str, lost: asyncio.Event):
+    """Send loop se alag lease renew karta hai; lease kisi aur ne le li toh `lost` set."""
+    while True:
+        await asyncio.sleep(BROADCAST_LEASE_SECONDS / 3)
+        try:
+            result = await db_broadcasts.update_one(
+                {"_id": broadcast_id, "owner": owner, "status": "running"},
+                {"$set": {"lease_until": datetime.now() + timedelta(seconds=BROADCAST_LEASE_SECONDS)}}
+            )
+        except Exception as e:
+            logger.warning(f"Broadcast {broadcast_id} ki lease renew nahi hui: {e}")
+            continue
+        if not result.matched_count:
+            lost.set()
+            return
+
+def broadcast_message(payload: dict):
+    caption = f"✨ **Episode {payload['ep']} Added** ✨\n\n🎬 **Anime:** {payload['anime_name']}\n➡️ **Season:** {payload['season']}\n\nNeeche [Download] button dabake download karein!"
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Download", callback_data=encode_callback(CB_OP_DOWNLOAD, payload["anime_id"], callback_key(payload["season"]), callback_episode(payload["ep"])))]])
+    return caption, keyboard
+
+async def _broadcast_send(bot, chat_id: int, payload: dict, caption: str, keyboard) -> str:
+    """Ek user ko bhejta hai; result: 'sent', 'blocked' ya 'failed'.
+    Pacing aur RetryAfter OUTBOUND_LIMITER sambhalta hai (sabse kam priority par)."""
+    try:
+        if payload.get("poster_id"):
+            await bot.send_photo(chat_id=chat_id, photo=payload["poster_id"], caption=caption, parse_mode='Markdown', reply_markup=keyboard, rate_limit_args=PRIORITY_BROADCAST)
+        else:
+            await bot.send_message(chat_id=chat_id, text=caption, parse_mode='Markdown', reply_markup=keyboard, rate_limit_args=PRIORITY_BROADCAST)
+        return "sent"
+    except Forbidden:
+        return "blocked" # User ne bot block kar diya
+    except Exception as e:
+        logger.warning(f"Broadcast {chat_id} ko nahi gaya: {e}")
+        return "failed"
+
+async def run_broadcast(application: Application, doc: dict):
+    broadcast_id, payload = doc["_id"], doc["payload"]
+    caption, keyboard = broadcast_message(payload)
+    counts = {k: doc.get(k, 0) for k in ("sent", "failed", "blocked")}
+    last_user_id = doc.get("last_user_id")
+    owner, attempts = doc["owner"], doc.get("attempts", 1)
+    started = time.monotonic()
+    processed = 0
+    lost = asyncio.Event()
+    renewer = asyncio.create_task(_renew_broadcast_lease(broadcast_id, owner, lost))
+    try:
+        while not lost.is_set():
+            query = active_subscriber_filter()
+            if last_user_id is not None:
+                query["_id"] = {"$gt": last_user_id}
+            batch = await db_users.find(query, {"_id": 1}, sort=[("_id", ASCENDING)], limit=BROADCAST_BATCH_SIZE, batch_size=BROADCAST_BATCH_SIZE)
+            if not batch:
+                break
+            results = await asyncio.gather(*[_broadcast_send(application.bot, user["_id"], payload, caption, keyboard) for user in batch])
+            for result in results:
+                counts[result] += 1
+            processed += len(batch)
+            last_user_id = batch[-1]["_id"]
+            # Checkpoint (sirf jab tak lease hamari hai)
+            await db_broadcasts.update_one(
+                {"_id": broadcast_id, "owner": owner},
+                {"$set": {"last_user_id": last_user_id, **counts, "updated_at": datetime.now()}}
+            )
+            logger.info(f"Broadcast {broadcast_id}: {counts} ({processed / max(time.monotonic() - started, 0.001):.1f} msg/s)")
+        status = "lost" if lost.is_set() else "done"
+    except Exception as e:
+        logger.error(f"Broadcast {broadcast_id} me error: {e}")
+        status = "failed"
+    finally:
+        renewer.cancel()
+    if status == "lost":
+        logger.warning(f"Broadcast {broadcast_id} ki lease doosre worker ke paas chali gayi, yahan ruk gaya.")
+        return
+    elapsed = max(time.monotonic() - started, 0.001)
+    update = {"status": status, **counts, "finished_at": datetime.now()}
+    if status == "failed":
+        # Resume job backoff ke baad dobara claim karega (BROADCAST_MAX_ATTEMPTS tak)
+        update["lease_until"] = datetime.now() + timedelta(seconds=BROADCAST_RETRY_DELAY * attempts)
+    try:
+        await db_broadcasts.update_one({"_id": broadcast_id, "owner": owner}, {"$set": update})
+    except Exception as e:
+        logger.error(f"Broadcast {broadcast_id} ka status save nahi hua: {e}")
+    if status == "failed" and attempts < BROADCAST_MAX_ATTEMPTS:
+        return # Admin ko sirf final result
+    try:
+        await application.bot.send_message(
+            ADMIN_ID,
+            f"📣 **Broadcast {'Complete' if status == 'done' else 'Failed'}**\n\n"
+            f"{payload['anime_name']} S{payload['season']} E{payload['ep']}\n"
+            f"Sent: {counts['sent']} | Failed: {counts['failed']} | Blocked: {counts['blocked']}\n"
+            f"Time: {elapsed:.0f}s | Speed: {processed / elapsed:.1f} msg/s",
+            rate_limit_args=PRIORITY_ADMIN
+        )
+    except Exception as e:
+        logger.warning(f"Admin ko broadcast report nahi bhej paya: {e}")
+
+# --- Subscription Expiry Sweeper ---
+# Expired users ek indexed range query (`active_expiry_date` partial index) aur ek update_many
+# se flip hote hain, download request ke andar nahi. Saath mein optional "N din bache hain"
+# reminders: users pehle ek run_id se claim hote hain (update_many), isliye multi-worker mein
+# bhi har expiry_date par reminder sirf ek baar jaata hai.
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", "300"))
+EXPIRY_REMINDER_DAYS = int(os.getenv("EXPIRY_REMINDER_DAYS", "3")) # 0 = reminders band
+
+async def sweep_expired_subscriptions(context: ContextTypes.DEFAULT_TYPE):
+    now = datetime.now()
+    try:
+        result = await db_users.update_many({"subscribed": True, "expiry_date": {"$lte": now}}, {"$set": {"subscribed": False}})
+        if result.modified_count:
+            logger.info(f"Expiry sweep: {result.modified_count} subscriptions expire kiye.")
+    except Exception as e:
+        logger.error(f"Expiry sweep me error: {e}")
+        return
+    if EXPIRY_REMINDER_DAYS > 0:
+        await send_expiry_reminders(context.bot, now)
+
+async def send_expiry_reminders(bot, now: datetime):
+    window = {"subscribed": True, "expiry_date": {"$gt": now, "$lte": now + timedelta(days=EXPIRY_REMINDER_DAYS)}}
+    run_id = uuid.uuid4().hex
+    try:
+        # Claim: jinhe is expiry_date ke liye reminder nahi gaya (renew hone par expiry_date badal jaati hai)
+        await db_users.update_many(
+            {**window, "$expr": {"$ne": ["$expiry_reminded_for", "$expiry_date"]}},
+            [{"$set": {"expiry_reminded_for": "$expiry_date", "expiry_reminder_run": run_id}}]
+        )
+        users = await db_users.find({**window, "expiry_reminder_run": run_id}, {"_id": 1, "expiry_date": 1})
+    except Exception as e:
+        logger.error(f"Expiry reminders claim karne me error: {e}")
+        return
+    async def remind(user):
+        days_left = max(1, -(-(user["expiry_date"] - now).total_seconds() // 86400))
+        try:
+            await bot.send_message(
+                user["_id"],
+                f"⏰ **Subscription Reminder**\n\nAapka subscription {int(days_left)} din mein expire ho jayega ({user['expiry_date'].strftime('%Y-%m-%d')}).\n\nRenew karne ke liye /menu dabayein.",
+                rate_limit_args=PRIORITY_BROADCAST
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"User {user['_id']} ko expiry reminder nahi gaya: {e}")
+            return False
+    if users:
+        results = await asyncio.gather(*[remind(u) for u in users])
+        logger.info(f"Expiry reminders: {sum(results)}/{len(users)} bheje.")
 
 # --- Conversation States ---
 (A_GET_NAME, A_GET_POSTER, A_GET_DESC, A_CONFIRM) = range(4)
@@ -130,6 +1761,7 @@ async def check_user_subscription(user_id: int):
 (DS_GET_ANIME, DS_GET_SEASON, DS_CONFIRM) = range(25, 28)
 (SUB_GET_SS,) = range(28, 29)
 (ADMIN_PENDING_MENU, ADMIN_SUB_GET_DAYS) = range(29, 31)
+(BI_GET_ANIME, BI_GET_SEASON, BI_COLLECT) = range(31, 34)
 
 # --- Common Conversation Fallbacks ---
 async def conv_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -178,6 +1810,53 @@ async def back_to_links_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await other_links_menu(update, context)
     return ConversationHandler.END
 
+# --- Paginated Anime Picker ---
+# Saare admin flows ek hi picker use karte hain jo `name` index par range query se sirf ek page
+# laata hai. Page ka cursor (pehla/aakhri naam) user_data mein rehta hai, callback_data mein nahi.
+ANIME_PAGE_SIZE = int(os.getenv("ANIME_PAGE_SIZE", "10"))
+
+async def fetch_anime_page(after: str = None, before: str = None, page_size: int = ANIME_PAGE_SIZE):
+    """Naam ke order mein ek page: (names, has_prev, has_next)."""
+    projection = {"_id": 0, "name": 1}
+    if before is not None:
+        docs = await db_animes.find({"name": {"$lt": before}}, projection, sort=[("name", -1)], limit=page_size + 1)
+        has_prev = len(docs) > page_size
+        return [d["name"] for d in docs[:page_size]][::-1], has_prev, True
+    query = {"name": {"$gt": after}} if after is not None else {}
+    docs = await db_animes.find(query, projection, sort=[("name", 1)], limit=page_size + 1)
+    has_next = len(docs) > page_size
+    return [d["name"] for d in docs[:page_size]], after is not None, has_next
+
+async def show_anime_picker(query, context, prefix: str, back_cb: str, text: str, state: int, after: str = None, before: str = None):
+    """Anime picker ka ek page dikhata hai. Catalog khali ho toh False return karta hai."""
+    names, has_prev, has_next = await fetch_anime_page(after, before)
+    if not names and (after is not None or before is not None):
+        # Cursor ke aage/peeche kuch nahi bacha (shayad delete hua), pehla page dikhao
+        names, has_prev, has_next = await fetch_anime_page()
+    if not names:
+        return False
+    keyboard = [[InlineKeyboardButton(name, callback_data=f"{prefix}{name}")] for name in names]
+    nav = []
+    if has_prev: nav.append(InlineKeyboardButton("⬅️ Prev", callback_data="picker_prev"))
+    if has_next: nav.append(InlineKeyboardButton("Next ➡️", callback_data="picker_next"))
+    if nav: keyboard.append(nav)
+    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=back_cb)])
+    context.user_data['picker'] = {"prefix": prefix, "back": back_cb, "text": text, "state": state, "first": names[0], "last": names[-1]}
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    return True
+
+async def anime_picker_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Picker ke Next/Prev buttons; conversation usi state mein rehti hai."""
+    query = update.callback_query
+    await query.answer()
+    picker = context.user_data.get('picker')
+    if not picker:
+        await query.edit_message_text("❌ Error! Picker expire ho gaya. Firse try karein.")
+        return ConversationHandler.END
+    cursor = {"after": picker["last"]} if query.data == "picker_next" else {"before": picker["first"]}
+    await show_anime_picker(query, context, picker["prefix"], picker["back"], picker["text"], picker["state"], **cursor)
+    return picker["state"]
+
 # --- Conversation: Add Anime ---
 async def add_anime_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -214,13 +1893,15 @@ async def save_anime_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer() 
     try:
-        db = get_db()
         name = context.user_data['anime_name']
-        if db['animes'].find_one({"name": name}):
+        if await db_animes.find_one({"name": name}, {"_id": 1}):
             await query.edit_message_caption(caption=f"⚠️ **Error:** Ye anime naam '{name}' pehle se hai.")
             return ConversationHandler.END
         anime_document = {"name": name, "poster_id": context.user_data['anime_poster_id'], "description": context.user_data['anime_desc'], "seasons": {}}
-        db['animes'].insert_one(anime_document)
+        await db_animes.insert_one(anime_document)
+        catalog_add_anime(anime_document)
+        SEARCH_INDEX.add(name, anime_document["_id"], anime_document["poster_id"])
+        mark_cache_dirty("catalog") # doosre workers ke search index ke liye
         await query.edit_message_caption(caption=f"✅ **Success!** '{name}' add ho gaya hai.")
     except Exception as e:
         logger.error(f"Anime save karne me error: {e}")
@@ -232,14 +1913,9 @@ async def save_anime_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def add_season_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    all_animes = list(get_db()['animes'].find({}, {"name": 1}))
-    if not all_animes:
+    if not await show_anime_picker(query, context, "season_anime_", "back_to_add_content", "Aap kis anime mein season add karna chahte hain?", S_GET_ANIME):
         await query.edit_message_text("❌ **Error!** Pehle `➕ Add Anime` se anime add karo.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")]]))
         return ConversationHandler.END
-    keyboard = [[InlineKeyboardButton(anime['name'], callback_data=f"season_anime_{anime['name']}")] for anime in all_animes]
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")])
-    text = "Aap kis anime mein season add karna chahte hain?"
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     return S_GET_ANIME
 async def get_anime_for_season(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -252,8 +1928,8 @@ async def get_season_number(update: Update, context: ContextTypes.DEFAULT_TYPE):
     season_name = update.message.text
     context.user_data['season_name'] = season_name
     anime_name = context.user_data['anime_name']
-    anime_doc = get_db()['animes'].find_one({"name": anime_name})
-    if season_name in anime_doc.get("seasons", {}):
+    entry = await catalog_get(anime_name)
+    if entry and season_name in entry.seasons:
         await update.message.reply_text(f"⚠️ **Error!** '{anime_name}' mein 'Season {season_name}' pehle se hai.\n\nKoi doosra naam/number type karein ya /cancel karein.")
         return S_GET_NUMBER
     keyboard = [[InlineKeyboardButton("✅ Haan, Save Karo", callback_data="save_season")], [InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")]]
@@ -265,7 +1941,8 @@ async def save_season(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         anime_name = context.user_data['anime_name']
         season_name = context.user_data['season_name']
-        get_db()['animes'].update_one({"name": anime_name}, {"$set": {f"seasons.{season_name}": {}}})
+        await db_animes.update_one({"name": anime_name}, {"$set": {f"seasons.{season_name}": {}}})
+        catalog_add_season(anime_name, season_name)
         await query.edit_message_text(f"✅ **Success!**\n**{anime_name}** mein **Season {season_name}** add ho gaya hai.")
     except Exception as e:
         logger.error(f"Season save karne me error: {e}")
@@ -277,22 +1954,17 @@ async def save_season(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def add_episode_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    all_animes = list(get_db()['animes'].find({}, {"name": 1}))
-    if not all_animes:
+    if not await show_anime_picker(query, context, "ep_anime_", "back_to_add_content", "Aap kis anime mein episode add karna chahte hain?", E_GET_ANIME):
         await query.edit_message_text("❌ **Error!** Pehle `➕ Add Anime` se anime add karo.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")]]))
         return ConversationHandler.END
-    keyboard = [[InlineKeyboardButton(anime['name'], callback_data=f"ep_anime_{anime['name']}")] for anime in all_animes]
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")])
-    text = "Aap kis anime mein episode add karna chahte hain?"
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     return E_GET_ANIME
 async def get_anime_for_episode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     anime_name = query.data.replace("ep_anime_", "")
     context.user_data['anime_name'] = anime_name
-    anime_doc = get_db()['animes'].find_one({"name": anime_name})
-    seasons = anime_doc.get("seasons", {})
+    entry = await catalog_get(anime_name)
+    seasons = entry.season_keys() if entry else []
     if not seasons:
         await query.edit_message_text(f"❌ **Error!** '{anime_name}' mein koi season nahi hai.\n\nPehle `➕ Add Season` se season add karo.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")]]))
         return ConversationHandler.END
@@ -329,22 +2001,24 @@ async def get_episode_quality(update: Update, context: ContextTypes.DEFAULT_TYPE
     )
     return E_GET_FILE
 async def get_episode_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    file_id = None
-    file_type = None 
-    if update.message.video: 
-        file_id = update.message.video.file_id
-        file_type = "video" 
-    elif update.message.document: 
-        file_id = update.message.document.file_id
-        file_type = "document" 
-    if not file_id:
+    media = media_file(update.message)
+    if not media:
         await update.message.reply_text("Ye video file nahi hai. Please ek video file forward karein ya /cancel karein.")
         return E_GET_FILE
+    file_id, file_type, _ = media
     try:
         anime_name, season_name, ep_num, quality = context.user_data['anime_name'], context.user_data['season_name'], context.user_data['ep_num'], context.user_data['quality']
+        entry = await catalog_get(anime_name)
+        result = await db_episodes.update_one(
+            episode_file_filter(entry.id, season_name, ep_num, quality),
+            {"$set": {"ep_no": episode_number(ep_num), "file_id": file_id, "type": file_type}},
+            upsert=True
+        )
         file_data = {"id": file_id, "type": file_type}
-        dot_notation_key = f"seasons.{season_name}.{ep_num}.{quality}"
-        get_db()['animes'].update_one({"name": anime_name}, {"$set": {dot_notation_key: file_data}})
+        catalog_add_file(anime_name, season_name, ep_num, quality, file_data)
+        # File replace ya same episode ki doosri quality par subscribers ko dobara announcement nahi
+        if BROADCAST_NEW_EPISODES and result.upserted_id is not None and await is_new_episode(entry, season_name, ep_num, quality):
+            await create_episode_broadcast(context.application, entry, season_name, ep_num)
         logger.info(f"Naya episode save ho gaya: {anime_name} S{season_name} E{ep_num} {quality}")
         await update.message.reply_text(f"✅ **Success!**\nEpisode **{ep_num} ({quality})** save ho gaya hai.")
     except Exception as e:
@@ -353,6 +2027,112 @@ async def get_episode_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
     return ConversationHandler.END
 
+# --- Conversation: Bulk Add Episodes ---
+# Admin anime + season ek baar chunta hai, phir saari files (media group ya ek-ek) forward karta hai.
+# Har file ka episode/quality caption ya filename se parse hota hai aur user_data mein buffer
+# hota hai; /done par ek hi bulk_write se saare upserts jaate hain.
+BULK_STATUS_INTERVAL = float(os.getenv("BULK_STATUS_INTERVAL", "3"))
+
+async def bulk_episode_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    if not await show_anime_picker(query, context, "bulk_anime_", "back_to_add_content", "Bulk upload: kis **Anime** mein episodes add karne hain?", BI_GET_ANIME):
+        await query.edit_message_text("❌ **Error!** Pehle `➕ Add Anime` se anime add karo.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")]]))
+        return ConversationHandler.END
+    return BI_GET_ANIME
+async def bulk_episode_anime(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    anime_name = query.data.replace("bulk_anime_", "")
+    context.user_data['anime_name'] = anime_name
+    entry = await catalog_get(anime_name)
+    seasons = entry.season_keys() if entry else []
+    if not seasons:
+        await query.edit_message_text(f"❌ **Error!** '{anime_name}' mein koi season nahi hai.\n\nPehle `➕ Add Season` se season add karo.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")]]))
+        return ConversationHandler.END
+    keyboard = [[InlineKeyboardButton(f"Season {s}", callback_data=f"bulk_season_{s}")] for s in seasons]
+    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_add_content")])
+    await query.edit_message_text(f"Aapne **{anime_name}** select kiya hai.\n\nAb **Season** select karein:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    return BI_GET_SEASON
+async def bulk_episode_season(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    context.user_data['season_name'] = query.data.replace("bulk_season_", "")
+    context.user_data['bulk_files'] = {}   # "ep|quality" -> {ep, quality, file_id, type}
+    context.user_data['bulk_skipped'] = [] # parse nahi hue filenames
+    context.user_data['bulk_dupes'] = []   # batch mein dobara aaye (pehli file rakhi)
+    context.user_data['bulk_status_at'] = 0.0
+    await query.edit_message_text(
+        f"📦 **Bulk Upload** — {context.user_data['anime_name']} S{context.user_data['season_name']}\n\n"
+        "Ab saari episode files forward karo (media group bhi chalega). Episode aur quality caption ya filename se nikalenge, "
+        "jaise `Naruto S01E05 720p.mkv` ya `[Sub] Naruto - 05 [1080p]`.\n\n/done - Save karo\n/cancel - Cancel."
+    )
+    return BI_COLLECT
+async def bulk_episode_collect(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    media = media_file(message)
+    if not media:
+        return BI_COLLECT
+    file_id, file_type, file_name = media
+    label = file_name or message.caption or file_id[:12]
+    # Caption pehle, phir filename (jo field zyada info de)
+    info = parse_media_text(message.caption)
+    for key, value in parse_media_text(file_name).items():
+        info.setdefault(key, value)
+    if "episode" not in info or "quality" not in info:
+        context.user_data['bulk_skipped'].append(label)
+    else:
+        key = f"{info['episode']}|{info['quality']}"
+        if key in context.user_data['bulk_files']:
+            context.user_data['bulk_dupes'].append(label)
+        else:
+            context.user_data['bulk_files'][key] = {"ep": info['episode'], "quality": info['quality'], "file_id": file_id, "type": file_type}
+    # Har file par reply nahi; kuch seconds mein ek baar chhota status
+    now = time.monotonic()
+    if now - context.user_data.get('bulk_status_at', 0.0) >= BULK_STATUS_INTERVAL:
+        context.user_data['bulk_status_at'] = now
+        await message.reply_text(
+            f"📥 Mapped: {len(context.user_data['bulk_files'])} | Skipped: {len(context.user_data['bulk_skipped'])} | "
+            f"Duplicate: {len(context.user_data['bulk_dupes'])}\n/done - Save karo"
+        )
+    return BI_COLLECT
+async def bulk_episode_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    anime_name, season_name = context.user_data['anime_name'], context.user_data['season_name']
+    files = list(context.user_data.get('bulk_files', {}).values())
+    skipped, dupes = context.user_data.get('bulk_skipped', []), context.user_data.get('bulk_dupes', [])
+    if not files:
+        await update.message.reply_text("❌ Abhi tak koi file map nahi hui. Files forward karo ya /cancel karein.")
+        return BI_COLLECT
+    try:
+        entry = await catalog_get(anime_name)
+        result = await db_episodes.bulk_write([
+            UpdateOne(
+                episode_file_filter(entry.id, season_name, f["ep"], f["quality"]),
+                {"$set": {"ep_no": episode_number(f["ep"]), "file_id": f["file_id"], "type": f["type"]}},
+                upsert=True
+            ) for f in files
+        ], ordered=False)
+        for f in files:
+            catalog_add_file(anime_name, season_name, f["ep"], f["quality"], {"id": f["file_id"], "type": f["type"]})
+    except Exception as e:
+        logger.error(f"Bulk episodes save karne me error: {e}")
+        await update.message.reply_text("❌ **Error!** Database me files save nahi kar paya. Files dobara forward karke /done try karein.")
+        return BI_COLLECT
+    logger.info(f"Bulk upload: {anime_name} S{season_name} -> {len(files)} files ({result.upserted_count} new)")
+    mapped = sorted(files, key=lambda f: (sort_key(f["ep"]), f["quality"]))
+    lines = [
+        f"✅ **Bulk Upload Complete** — {anime_name} S{season_name}\n",
+        f"Mapped: {len(files)} (new {result.upserted_count}, replaced {result.matched_count})",
+        "  " + ", ".join(f"E{f['ep']} {f['quality']}" for f in mapped[:60]) + (" ..." if len(mapped) > 60 else ""),
+        f"Skipped (episode/quality nahi mila): {len(skipped)}",
+    ]
+    lines += [f"  • {name}" for name in skipped[:20]]
+    lines.append(f"Duplicate (batch mein dobara): {len(dupes)}")
+    lines += [f"  • {name}" for name in dupes[:20]]
+    await update.message.reply_text("\n".join(lines))
+    context.user_data.clear()
+    return ConversationHandler.END
+
 # --- Conversation: Set Subscription QR ---
 async def set_sub_qr_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -364,7 +2144,7 @@ async def set_sub_qr_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Ye photo nahi hai. Please ek **Photo** bhejo, 'File' nahi, ya /cancel karein.")
         return CS_GET_QR
     qr_file_id = update.message.photo[-1].file_id
-    get_db()['config'].update_one({"_id": "bot_config"}, {"$set": {"sub_qr_id": qr_file_id}}, upsert=True)
+    await update_config({"sub_qr_id": qr_file_id})
     logger.info(f"Subscription QR code update ho gaya.")
     await update.message.reply_text("✅ **Success!** Naya subscription QR code set ho gaya hai.")
     await sub_settings_menu(update, context) # Wapas menu dikhao
@@ -378,7 +2158,7 @@ async def set_price_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return CP_GET_PRICE
 async def set_price_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     price_text = update.message.text
-    get_db()['config'].update_one({"_id": "bot_config"}, {"$set": {"price": price_text}}, upsert=True)
+    await update_config({"price": price_text})
     logger.info(f"Price update ho gaya: {price_text}")
     await update.message.reply_text(f"✅ **Success!** Naya price set ho gaya hai: '{price_text}'.")
     await sub_settings_menu(update, context) # Wapas menu dikhao
@@ -395,7 +2175,7 @@ async def set_donate_qr_save(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Ye photo nahi hai. Please ek **Photo** bhejo, 'File' nahi, ya /cancel karein.")
         return CD_GET_QR
     qr_file_id = update.message.photo[-1].file_id
-    get_db()['config'].update_one({"_id": "bot_config"}, {"$set": {"donate_qr_id": qr_file_id}}, upsert=True)
+    await update_config({"donate_qr_id": qr_file_id})
     logger.info(f"Donate QR code update ho gaya.")
     await update.message.reply_text("✅ **Success!** Naya donate QR code set ho gaya hai.")
     await donate_settings_menu(update, context) # Wapas menu dikhao
@@ -423,7 +2203,7 @@ async def set_links_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def get_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     link_url = update.message.text
     link_type = context.user_data['link_type']
-    get_db()['config'].update_one({"_id": "bot_config"}, {"$set": {f"links.{link_type}": link_url}}, upsert=True)
+    await update_config({f"links.{link_type}": link_url})
     logger.info(f"{link_type} link update ho gaya: {link_url}")
     await update.message.reply_text(f"✅ **Success!** Naya {link_type} link set ho gaya hai.")
     if link_type == "donate": await donate_settings_menu(update, context)
@@ -432,7 +2212,7 @@ async def get_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 async def skip_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     link_type = context.user_data['link_type']
-    get_db()['config'].update_one({"_id": "bot_config"}, {"$set": {f"links.{link_type}": None}}, upsert=True)
+    await update_config({f"links.{link_type}": None})
     logger.info(f"{link_type} link skip kiya (None set).")
     await update.message.reply_text(f"✅ **Success!** {link_type} link remove kar diya gaya hai.")
     if link_type == "donate": await donate_settings_menu(update, context)
@@ -456,21 +2236,17 @@ async def post_gen_select_anime(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     post_type = query.data
     context.user_data['post_type'] = post_type
-    all_animes = list(get_db()['animes'].find({}, {"name": 1}))
-    if not all_animes:
+    if not await show_anime_picker(query, context, "post_anime_", "admin_menu", "Kaunsa **Anime** select karna hai?", PG_GET_ANIME):
         await query.edit_message_text("❌ **Error!** Database mein koi anime nahi hai.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="admin_menu")]]))
         return ConversationHandler.END
-    keyboard = [[InlineKeyboardButton(anime['name'], callback_data=f"post_anime_{anime['name']}")] for anime in all_animes]
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="admin_menu")])
-    await query.edit_message_text("Kaunsa **Anime** select karna hai?", reply_markup=InlineKeyboardMarkup(keyboard))
     return PG_GET_ANIME
 async def post_gen_select_season(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     anime_name = query.data.replace("post_anime_", "")
     context.user_data['anime_name'] = anime_name
-    anime_doc = get_db()['animes'].find_one({"name": anime_name})
-    seasons = anime_doc.get("seasons", {})
+    entry = await catalog_get(anime_name)
+    seasons = entry.season_keys() if entry else []
     if not seasons:
         await query.edit_message_text(f"❌ **Error!** '{anime_name}' mein koi season nahi hai.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="admin_menu")]]))
         return ConversationHandler.END
@@ -483,17 +2259,32 @@ async def post_gen_select_episode(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     season_name = query.data.replace("post_season_", "")
     context.user_data['season_name'] = season_name
-    anime_name = context.user_data['anime_name']
     if context.user_data['post_type'] == 'post_gen_season':
         return await generate_post_ask_chat(update, context)
-    anime_doc = get_db()['animes'].find_one({"name": anime_name})
-    episodes = anime_doc.get("seasons", {}).get(season_name, {})
-    if not episodes:
+    return await show_post_episode_page(query, context, None)
+async def post_gen_episode_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    return await show_post_episode_page(query, context, query.data.replace("post_page_", ""))
+async def show_post_episode_page(query, context, page):
+    """Post generator ki episode list, download view ki tarah ep_no ranges mein paged."""
+    anime_name, season_name = context.user_data['anime_name'], context.user_data['season_name']
+    entry = await catalog_get(anime_name)
+    pages = episode_pages(await catalog_season_summary(entry, season_name)) if entry else []
+    if not pages:
         await query.edit_message_text(f"❌ **Error!** '{anime_name}' - Season {season_name} mein koi episode nahi hai.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="admin_menu")]]))
         return ConversationHandler.END
+    if page not in pages:
+        page = pages[0]
+    episodes = await catalog_episode_page(entry, season_name, page)
     keyboard = [[InlineKeyboardButton(f"Episode {ep}", callback_data=f"post_ep_{ep}")] for ep in episodes]
+    keyboard += page_jump_rows(pages, page, lambda p: f"post_page_{p}")
     keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="admin_menu")])
-    await query.edit_message_text(f"Aapne **Season {season_name}** select kiya hai.\n\nAb **Episode** select karein:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    range_text = f" ({page_label(page)})" if len(pages) > 1 else ""
+    try:
+        await query.edit_message_text(f"Aapne **Season {season_name}** select kiya hai.\n\nAb **Episode**{range_text} select karein:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    except BadRequest as e:
+        if "not modified" not in str(e).lower(): raise
     return PG_GET_EPISODE
 async def post_gen_final_episode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -508,20 +2299,20 @@ async def generate_post_ask_chat(update: Update, context: ContextTypes.DEFAULT_T
         anime_name = context.user_data['anime_name']
         season_name = context.user_data.get('season_name')
         ep_num = context.user_data.get('ep_num')
-        anime_doc = get_db()['animes'].find_one({"name": anime_name})
+        entry = await catalog_get(anime_name)
         if ep_num:
             caption = f"✨ **Episode {ep_num} Added** ✨\n\n🎬 **Anime:** {anime_name}\n➡️ **Season:** {season_name}\n\nNeeche [Download] button dabake download karein!"
-            poster_id = anime_doc['poster_id']
+            poster_id = entry.poster_id
         else:
             caption = f"✅ **{anime_name}**\n"
             if season_name: caption += f"**[ S{season_name} ]**\n\n"
-            if anime_doc.get('description'): caption += f"**📖 Synopsis:**\n{anime_doc['description']}\n\n"
+            if entry.description: caption += f"**📖 Synopsis:**\n{entry.description}\n\n"
             caption += "Neeche [Download] button dabake download karein!"
-            poster_id = anime_doc['poster_id']
+            poster_id = entry.poster_id
         links = config.get('links', {})
-        dl_callback_data = f"dl_{anime_name}"
-        if season_name: dl_callback_data += f"_{season_name}"
-        if ep_num: dl_callback_data += f"_{ep_num}"
+        dl_fields = [callback_key(season_name)] if season_name else []
+        if season_name and ep_num: dl_fields.append(callback_episode(ep_num))
+        dl_callback_data = encode_callback(CB_OP_DOWNLOAD, entry.id, *dl_fields)
         backup_url = links.get('backup')
         if not backup_url or not backup_url.startswith(("http", "t.me")): backup_url = "https://t.me/"
         donate_url = links.get('donate')
@@ -538,7 +2329,8 @@ async def generate_post_ask_chat(update: Update, context: ContextTypes.DEFAULT_T
         context.user_data['post_keyboard'] = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
             "✅ **Post Ready!**\n\nAb uss **Channel ka @username** ya **Group/Channel ki Chat ID** bhejo jahaan ye post karna hai.\n"
-            "(Example: @MyAnimeChannel ya -100123456789)\n\n/cancel - Cancel."
+            "(Example: @MyAnimeChannel ya -100123456789, ek se zyada ho toh space/comma se alag karein)\n\n"
+            f"/all - Saare saved targets par bhejo ({len(config.get('post_targets') or [])})\n/cancel - Cancel."
         )
         return PG_GET_CHAT
     except Exception as e:
@@ -547,34 +2339,89 @@ async def generate_post_ask_chat(update: Update, context: ContextTypes.DEFAULT_T
         await query.edit_message_text("❌ **Error!** Post generate nahi ho paya. Logs check karein.")
         context.user_data.clear()
         return ConversationHandler.END
-async def post_gen_send_to_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.message.text
-    try:
-        await context.bot.send_photo(
-            chat_id=chat_id,
-            photo=context.user_data['post_poster_id'],
-            caption=context.user_data['post_caption'],
-            parse_mode='Markdown',
-            reply_markup=context.user_data['post_keyboard']
-        )
-        await update.message.reply_text(f"✅ **Success!**\nPost ko '{chat_id}' par bhej diya gaya hai.")
-    except Exception as e:
-        logger.error(f"Post channel me bhejme me error: {e}")
-        await update.message.reply_text(f"❌ **Error!**\nPost '{chat_id}' par nahi bhej paya. Check karo ki bot uss channel me admin hai ya ID sahi hai.\nError: {e}")
+# Multi-target publishing: har target par ek hi poster file_id bhejte hain (re-upload nahi),
+# bounded parallelism ke saath, aur admin ko per-target result table milta hai.
+POST_PUBLISH_CONCURRENCY = int(os.getenv("POST_PUBLISH_CONCURRENCY", "5"))
+
+def parse_post_targets(text: str) -> list:
+    """'@chan, -100123 @other' -> ['@chan', '-100123', '@other'] (order same, duplicates hata ke)."""
+    targets = [t for t in re.split(r"[\s,]+", text.strip()) if t]
+    return list(dict.fromkeys(targets))
+
+async def publish_post(bot, targets: list, poster_id: str, caption: str, keyboard) -> list:
+    """Saare targets par concurrently post karta hai. Result: [(target, ok, latency_ms, error)]"""
+    semaphore = asyncio.Semaphore(POST_PUBLISH_CONCURRENCY)
+    async def send_one(target):
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await bot.send_photo(chat_id=target, photo=poster_id, caption=caption, parse_mode='Markdown', reply_markup=keyboard, rate_limit_args=PRIORITY_ADMIN)
+                return (target, True, (time.monotonic() - started) * 1000, None)
+            except Exception as e:
+                logger.error(f"Post '{target}' par bhejne me error: {e}")
+                return (target, False, (time.monotonic() - started) * 1000, str(e))
+    return await asyncio.gather(*[send_one(t) for t in targets])
+
+def format_publish_results(results: list) -> str:
+    ok_count = sum(1 for r in results if r[1])
+    lines = [f"📤 **Post Results** ({ok_count}/{len(results)} success)\n"]
+    for target, ok, latency_ms, error in results:
+        if ok:
+            lines.append(f"✅ {target} — {latency_ms:.0f} ms")
+        else:
+            lines.append(f"❌ {target} — {latency_ms:.0f} ms — {error}")
+    if ok_count < len(results):
+        lines.append("\nFailed targets par check karo ki bot admin hai aur ID sahi hai.")
+    return "\n".join(lines)
+
+async def _publish_and_report(update: Update, context: ContextTypes.DEFAULT_TYPE, targets: list):
+    results = await publish_post(
+        context.bot, targets,
+        context.user_data['post_poster_id'], context.user_data['post_caption'], context.user_data['post_keyboard']
+    )
+    logger.info(f"Post {len(targets)} targets par publish hua: {sum(1 for r in results if r[1])} success")
+    await update.message.reply_text(format_publish_results(results))
     context.user_data.clear()
     return ConversationHandler.END
 
+async def post_gen_send_to_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    targets = parse_post_targets(update.message.text)
+    if not targets:
+        await update.message.reply_text("Koi chat ID nahi mili. Dobara bhejo ya /cancel karein.")
+        return PG_GET_CHAT
+    return await _publish_and_report(update, context, targets)
+
+async def post_gen_send_to_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    config = await get_config()
+    targets = config.get('post_targets') or []
+    if not targets:
+        await update.message.reply_text("❌ Koi saved target nahi hai. Pehle /post_targets se set karein, ya chat ID bhejo.")
+        return PG_GET_CHAT
+    return await _publish_and_report(update, context, targets)
+
+async def post_targets_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/post_targets - list dikhata hai; /post_targets @a -100123 - list set karta hai; /post_targets clear - khaali."""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("Aap admin nahi hain.")
+        return
+    if context.args:
+        targets = [] if context.args == ["clear"] else parse_post_targets(" ".join(context.args))
+        await update_config({"post_targets": targets})
+        logger.info(f"Post targets update hue: {targets}")
+    else:
+        targets = (await get_config()).get('post_targets') or []
+    if targets:
+        await update.message.reply_text("🎯 **Post Targets:**\n" + "\n".join(f"• {t}" for t in targets) + "\n\nBadalne ke liye: /post_targets @chan1 -100123...\nHatane ke liye: /post_targets clear")
+    else:
+        await update.message.reply_text("🎯 Koi post target set nahi hai.\n\nSet karne ke liye: /post_targets @chan1 -100123...")
+
 # --- Conversation: Delete Anime ---
 async def delete_anime_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    all_animes = list(get_db()['animes'].find({}, {"name": 1}))
-    if not all_animes:
+    if not await show_anime_picker(query, context, "del_anime_", "back_to_manage", "Kaunsa **Anime** delete karna hai? (Ye permanent hoga)", DA_GET_ANIME):
         await query.edit_message_text("❌ **Error!** Database mein koi anime nahi hai.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_manage")]]))
         return ConversationHandler.END
-    keyboard = [[InlineKeyboardButton(anime['name'], callback_data=f"del_anime_{anime['name']}")] for anime in all_animes]
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_manage")])
-    await query.edit_message_text("Kaunsa **Anime** delete karna hai? (Ye permanent hoga)", reply_markup=InlineKeyboardMarkup(keyboard))
     return DA_GET_ANIME
 async def delete_anime_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -589,7 +2436,12 @@ async def delete_anime_do(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("Deleting...")
     anime_name = context.user_data['anime_name']
     try:
-        get_db()['animes'].delete_one({"name": anime_name})
+        entry = await catalog_get(anime_name)
+        await db_animes.delete_one({"name": anime_name})
+        if entry:
+            await db_episodes.delete_many({"anime_id": entry.id})
+        catalog_remove_anime(anime_name)
+        SEARCH_INDEX.remove(anime_name)
         logger.info(f"Anime deleted: {anime_name}")
         await query.edit_message_text(f"✅ **Success!**\nAnime '{anime_name}' delete ho gaya hai.")
     except Exception as e:
@@ -602,21 +2454,17 @@ async def delete_anime_do(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def delete_season_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    all_animes = list(get_db()['animes'].find({}, {"name": 1}))
-    if not all_animes:
+    if not await show_anime_picker(query, context, "del_season_anime_", "back_to_manage", "Kaunse **Anime** ka season delete karna hai?", DS_GET_ANIME):
         await query.edit_message_text("❌ **Error!** Database mein koi anime nahi hai.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_manage")]]))
         return ConversationHandler.END
-    keyboard = [[InlineKeyboardButton(anime['name'], callback_data=f"del_season_anime_{anime['name']}")] for anime in all_animes]
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_manage")])
-    await query.edit_message_text("Kaunse **Anime** ka season delete karna hai?", reply_markup=InlineKeyboardMarkup(keyboard))
     return DS_GET_ANIME
 async def delete_season_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     anime_name = query.data.replace("del_season_anime_", "")
     context.user_data['anime_name'] = anime_name
-    anime_doc = get_db()['animes'].find_one({"name": anime_name})
-    seasons = anime_doc.get("seasons", {})
+    entry = await catalog_get(anime_name)
+    seasons = entry.season_keys() if entry else []
     if not seasons:
         await query.edit_message_text(f"❌ **Error!** '{anime_name}' mein koi season nahi hai.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_manage")]]))
         return ConversationHandler.END
@@ -639,7 +2487,11 @@ async def delete_season_do(update: Update, context: ContextTypes.DEFAULT_TYPE):
     anime_name = context.user_data['anime_name']
     season_name = context.user_data['season_name']
     try:
-        get_db()['animes'].update_one({"name": anime_name}, {"$unset": {f"seasons.{season_name}": ""}})
+        entry = await catalog_get(anime_name)
+        await db_animes.update_one({"name": anime_name}, {"$unset": {f"seasons.{season_name}": ""}})
+        if entry:
+            await db_episodes.delete_many({"anime_id": entry.id, "season": season_name})
+        catalog_remove_season(anime_name, season_name)
         logger.info(f"Season deleted: {anime_name} - S{season_name}")
         await query.edit_message_text(f"✅ **Success!**\nSeason '{season_name}' delete ho gaya hai.")
     except Exception as e:
@@ -682,14 +2534,6 @@ async def user_sent_screenshot(update: Update, context: ContextTypes.DEFAULT_TYP
         return SUB_GET_SS
         
     user = update.effective_user
-    db = get_db()
-    
-    # Check karo ki pehle se pending toh nahi hai
-    user_data = db['users'].find_one({"_id": user.id})
-    if user_data and user_data.get("pending_payment"):
-        await update.message.reply_text("Aapka ek payment pehle se hi verification ke liye pending hai. Lütfen intezaar karein.")
-        return ConversationHandler.END
-        
     screenshot_id = update.message.photo[-1].file_id
     
     # Admin ko forward karne ki jagah DB mein save karo
@@ -698,11 +2542,18 @@ async def user_sent_screenshot(update: Update, context: ContextTypes.DEFAULT_TYP
             "ss_id": screenshot_id,
             "time": datetime.now()
         }
-        db['users'].update_one(
-            {"_id": user.id},
-            {"$set": {"pending_payment": pending_data}},
-            upsert=True
-        )
+        # Sirf tab set karo jab pehle se pending na ho (atomic check + set).
+        # Pending user par filter match nahi hota aur upsert duplicate _id par fail hota hai.
+        try:
+            await db_users.update_one(
+                {"_id": user.id, "pending_payment": {"$not": {"$type": "object"}}},
+                {"$set": {"pending_payment": pending_data}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            await update.message.reply_text("Aapka ek payment pehle se hi verification ke liye pending hai. Lütfen intezaar karein.")
+            return ConversationHandler.END
+        await adjust_pending_count(1)
         
         await update.message.reply_text(
             "✅ **Screenshot Mil Gaya!**\n\n"
@@ -712,8 +2563,8 @@ async def user_sent_screenshot(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # (Optional) Admin ko sirf ek notification bhejo
         try:
-            admin_pending_count = db['users'].count_documents({"pending_payment": {"$ne": None}})
-            await context.bot.send_message(ADMIN_ID, f"🔔 **Naya Payment** 🔔\n\nEk naya payment verification ke liye aaya hai. Aapke paas ab total **{admin_pending_count}** pending hain.\n\n/admin dabake check karein.")
+            admin_pending_count = await get_pending_count()
+            await context.bot.send_message(ADMIN_ID, f"🔔 **Naya Payment** 🔔\n\nEk naya payment verification ke liye aaya hai. Aapke paas ab total **{admin_pending_count}** pending hain.\n\n/admin dabake check karein.", rate_limit_args=PRIORITY_ADMIN)
         except Exception as e:
             logger.warning(f"Admin ko 'naya payment' notification nahi bhej paya: {e}")
             
@@ -735,10 +2586,11 @@ async def admin_approval_handler(update: Update, context: ContextTypes.DEFAULT_T
     
     if action == "reject":
         try:
-            await context.bot.send_message(user_id, "❌ **Payment Rejected** ❌\n\nAapka payment verification fail ho gaya hai. Agar koi galti hui hai, toh please /support se contact karein.")
+            await context.bot.send_message(user_id, "❌ **Payment Rejected** ❌\n\nAapka payment verification fail ho gaya hai. Agar koi galti hui hai, toh please /support se contact karein.", rate_limit_args=PRIORITY_ADMIN)
             await query.edit_message_caption(caption=f"❌ User {user_id} ko reject kar diya gaya hai.", reply_markup=None)
             # DB se pending status hatao
-            get_db()['users'].update_one({"_id": user_id}, {"$set": {"pending_payment": None}})
+            await clear_pending_payment(user_id)
+            invalidate_user_subscription(user_id)
         except Exception as e:
             logger.error(f"User {user_id} ko reject message bhejme me error: {e}")
             await query.edit_message_caption(caption=f"❌ User {user_id} ko reject kar diya gaya hai (par use message nahi bhej paya).", reply_markup=None)
@@ -769,15 +2621,8 @@ async def admin_set_sub_days(update: Update, context: ContextTypes.DEFAULT_TYPE)
     expiry_date = datetime.now() + timedelta(days=days)
     
     # User ko DB mein update karo (aur pending status hatao)
-    get_db()['users'].update_one(
-        {"_id": user_id},
-        {"$set": {
-            "subscribed": True,
-            "expiry_date": expiry_date,
-            "pending_payment": None # Pending status clear karo
-        }},
-        upsert=True
-    )
+    await clear_pending_payment(user_id, {"subscribed": True, "expiry_date": expiry_date})
+    invalidate_user_subscription(user_id)
     
     logger.info(f"Admin ne user {user_id} ko {days} din ka sub diya.")
     
@@ -786,7 +2631,7 @@ async def admin_set_sub_days(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # User ko confirmation do
     try:
-        await context.bot.send_message(user_id, f"🎉 **Subscription Activated!** 🎉\n\nAapka account {days} din ke liye activate ho gaya hai. Happy watching!\n\n/menu dabake check kar sakte hain.")
+        await context.bot.send_message(user_id, f"🎉 **Subscription Activated!** 🎉\n\nAapka account {days} din ke liye activate ho gaya hai. Happy watching!\n\n/menu dabake check kar sakte hain.", rate_limit_args=PRIORITY_ADMIN)
     except Exception as e:
         logger.error(f"User {user_id} ko activation message bhejme me error: {e}")
         
@@ -799,7 +2644,7 @@ async def show_pending_payments(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    pending_users = list(get_db()['users'].find({"pending_payment": {"$ne": None}}))
+    pending_users = await db_users.find(PENDING_PAYMENT_FILTER)
     
     keyboard = []
     if not pending_users:
@@ -821,7 +2666,7 @@ async def show_pending_user_details(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     
     user_id = int(query.data.split('_')[-1])
-    user_data = get_db()['users'].find_one({"_id": user_id})
+    user_data = await db_users.find_one({"_id": user_id})
     
     if not user_data or not user_data.get("pending_payment"):
         await query.answer("❌ Error! Ye user ab pending nahi hai. List refresh ho rahi hai...", show_alert=True)
@@ -849,7 +2694,8 @@ async def show_pending_user_details(update: Update, context: ContextTypes.DEFAUL
             photo=ss_id,
             caption=admin_caption,
             reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='HTML'
+            parse_mode='HTML',
+            rate_limit_args=PRIORITY_ADMIN
         )
         
         # Purana message edit karke batao ki SS bhej diya hai
@@ -870,6 +2716,7 @@ async def add_content_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("➕ Add Anime", callback_data="admin_add_anime")],
         [InlineKeyboardButton("➕ Add Season", callback_data="admin_add_season")],
         [InlineKeyboardButton("➕ Add Episode", callback_data="admin_add_episode")],
+        [InlineKeyboardButton("📦 Bulk Add Episodes", callback_data="admin_bulk_episodes")],
         [InlineKeyboardButton("⬅️ Back to Admin Menu", callback_data="admin_menu")]
     ]
     text = "➕ **Add Content** ➕\n\nAap kya add karna chahte hain?"
@@ -946,10 +2793,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id, first_name = user.id, user.first_name
     logger.info(f"User {user_id} ({first_name}) ne /start dabaya.")
     
-    db = get_db()
-    user_data = db['users'].find_one({"_id": user_id})
+    user_data = await db_users.find_one({"_id": user_id}, {"_id": 1})
     if not user_data:
-        db['users'].insert_one({"_id": user_id, "first_name": first_name, "username": user.username, "subscribed": False, "expiry_date": None, "pending_payment": None})
+        await db_users.insert_one({"_id": user_id, "first_name": first_name, "username": user.username, "subscribed": False, "expiry_date": None, "pending_payment": None})
         logger.info(f"Naya user database me add kiya: {user_id}")
     
     if await is_admin(user_id):
@@ -996,7 +2842,7 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def user_check_sub_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    user_id = query.effective_user.id
+    user_id = query.from_user.id
     sub_status = await check_user_subscription(user_id)
     
     if sub_status["active"]:
@@ -1006,11 +2852,64 @@ async def user_check_sub_status(update: Update, context: ContextTypes.DEFAULT_TY
         await query.message.delete()
         await menu_command(update, context)
 
+# --- Search (Inline + /search) ---
+SEARCH_RESULTS_LIMIT = int(os.getenv("SEARCH_RESULTS_LIMIT", "10"))
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/search <naam> - anime dhoondh ke Download buttons dikhata hai."""
+    query_text = " ".join(context.args)
+    if not query_text:
+        await update.message.reply_text("Anime ka naam bhi likho.\n(Example: /search naruto)")
+        return
+    names = SEARCH_INDEX.search(query_text, SEARCH_RESULTS_LIMIT)
+    if not names:
+        await update.message.reply_text(f"❌ '{query_text}' se milta-julta koi anime nahi mila.")
+        return
+    keyboard = [[InlineKeyboardButton(name, callback_data=encode_callback(CB_OP_DOWNLOAD, SEARCH_INDEX.meta[name]["id"]))] for name in names]
+    await update.message.reply_text(f"🔎 **'{query_text}'** ke results:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline mode (@bot naam) - poster ke saath results, har result par Download button."""
+    inline_query = update.inline_query
+    names = SEARCH_INDEX.search(inline_query.query, SEARCH_RESULTS_LIMIT)
+    results = []
+    for name in names:
+        result_id = hashlib.md5(name.encode()).hexdigest()
+        meta = SEARCH_INDEX.meta[name]
+        keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Download", callback_data=encode_callback(CB_OP_DOWNLOAD, meta["id"]))]])
+        poster_id = meta["poster_id"]
+        if poster_id:
+            results.append(InlineQueryResultCachedPhoto(id=result_id, photo_file_id=poster_id, title=name, caption=f"🎬 **{name}**", parse_mode='Markdown', reply_markup=keyboard))
+        else:
+            results.append(InlineQueryResultArticle(id=result_id, title=name, input_message_content=InputTextMessageContent(f"🎬 **{name}**", parse_mode='Markdown'), reply_markup=keyboard))
+    await inline_query.answer(results, cache_time=30)
+
 # --- Download Handler (Poora Flow) ---
-async def download_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """(FIXED) Jab user [Download] button dabata hai"""
+def season_keyboard(entry, season_keys):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(f"Season {s_key}", callback_data=encode_callback(CB_OP_DOWNLOAD, entry.id, callback_key(s_key)))] for s_key in season_keys])
+
+def episode_keyboard(entry, season_name: str, ep_keys, page: str, pages: list, qualities: list):
+    season_key = callback_key(season_name)
+    keyboard = [[InlineKeyboardButton(f"Episode {ep_key}", callback_data=encode_callback(CB_OP_DOWNLOAD, entry.id, season_key, callback_episode(ep_key)))] for ep_key in ep_keys]
+    keyboard += page_jump_rows(pages, page, lambda p: encode_callback(CB_OP_EPISODE_PAGE, entry.id, season_key, callback_page(p)))
+    # Poora season ek click mein
+    keyboard.append([InlineKeyboardButton("📥 All Episodes (Best Quality)", callback_data=encode_callback(CB_OP_SEND_SEASON, entry.id, season_key))])
+    quality_buttons = [InlineKeyboardButton(f"📥 All {q}", callback_data=encode_callback(CB_OP_SEND_SEASON, entry.id, season_key, callback_key(q))) for q in qualities]
+    for i in range(0, len(quality_buttons), 2):
+        keyboard.append(quality_buttons[i:i + 2])
+    keyboard.append([InlineKeyboardButton("⬅️ Back (Anime)", callback_data=encode_callback(CB_OP_DOWNLOAD, entry.id))])
+    return InlineKeyboardMarkup(keyboard)
+
+def quality_keyboard(entry, season_name: str, ep_num: str, qualities: dict):
+    season_key = callback_key(season_name)
+    keyboard = [[InlineKeyboardButton(f"Episode {ep_num} ({q})", callback_data=encode_callback(CB_OP_SEND_FILE, entry.id, season_key, callback_episode(ep_num), callback_key(q)))] for q in sorted(qualities, key=lambda q: (quality_rank(q), q))]
+    keyboard.append([InlineKeyboardButton("⬅️ Back (Season)", callback_data=encode_callback(CB_OP_EPISODE_PAGE, entry.id, season_key, callback_page(page_of_episode(ep_num))))])
+    return InlineKeyboardMarkup(keyboard)
+
+async def download_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, entry, season_name: str = None, ep_num: str = None, page: str = None):
+    """(FIXED) Jab user [Download] button dabata hai: anime -> season -> episode -> quality"""
     query = update.callback_query
-    user = query.effective_user
+    user = query.from_user
     
     # 1. Subscription Check
     sub_status = await check_user_subscription(user.id)
@@ -1026,94 +2925,615 @@ async def download_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer("✅ Subscribed! Fetching details...")
     
     try:
-        parts = query.data.split('_')[1:]
-        anime_name = parts[0]
-        season_name = parts[1] if len(parts) > 1 else None
-        ep_num = parts[2] if len(parts) > 2 else None
-        
-        anime_doc = get_db()['animes'].find_one({"name": anime_name})
-        if not anime_doc:
+        if not entry:
             await query.edit_message_text("❌ Error! Ye anime database mein nahi mila. (Shayad admin ne delete kar diya hai)")
             return
+        anime_name = entry.name
 
         if ep_num:
-            qualities_dict = anime_doc.get("seasons", {}).get(season_name, {}).get(ep_num, {})
+            qualities_dict = await catalog_qualities(entry, season_name, ep_num)
             if not qualities_dict:
                 await query.edit_message_text(f"❌ Error! Episode {ep_num} ki files nahi mili.")
                 return
-            keyboard = []
-            for q in qualities_dict.keys():
-                cb_data = f"sendfile_{q}_{anime_name}_{season_name}_{ep_num}"
-                keyboard.append([InlineKeyboardButton(f"Episode {ep_num} ({q})", callback_data=cb_data)])
-            keyboard.append([InlineKeyboardButton("⬅️ Back (Season)", callback_data=f"dl_{anime_name}_{season_name}")])
-            await query.edit_message_text(f"**{anime_name} - S{season_name}**\n\nEpisode **{ep_num}** ki quality select karein:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+            reply_markup = quality_keyboard(entry, season_name, ep_num, qualities_dict)
+            await query.edit_message_text(f"**{anime_name} - S{season_name}**\n\nEpisode **{ep_num}** ki quality select karein:", reply_markup=reply_markup, parse_mode='Markdown')
 
         elif season_name:
-            episodes_dict = anime_doc.get("seasons", {}).get(season_name, {})
-            if not episodes_dict:
+            summary = await catalog_season_summary(entry, season_name)
+            pages = episode_pages(summary)
+            if not pages:
                 await query.edit_message_text(f"❌ Error! Season {season_name} ke episodes nahi mile.")
                 return
-            keyboard = []
-            sorted_ep_keys = sorted(episodes_dict.keys(), key=lambda x: int(x) if x.isdigit() else x)
-            for ep_key in sorted_ep_keys:
-                cb_data = f"dl_{anime_name}_{season_name}_{ep_key}"
-                keyboard.append([InlineKeyboardButton(f"Episode {ep_key}", callback_data=cb_data)])
-            keyboard.append([InlineKeyboardButton("⬅️ Back (Anime)", callback_data=f"dl_{anime_name}")])
-            await query.edit_message_text(f"**{anime_name}**\n\nSeason **{season_name}** ka episode select karein:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+            if page not in pages:
+                page = pages[0]
+            view = f"episodes:{page}"
+            reply_markup = entry.get_keyboard(season_name, view)
+            if reply_markup is None:
+                ep_keys = await catalog_episode_page(entry, season_name, page)
+                reply_markup = entry.set_keyboard(season_name, view, episode_keyboard(entry, season_name, ep_keys, page, pages, summary["qualities"]))
+            range_text = f" ({page_label(page)})" if len(pages) > 1 else ""
+            await query.edit_message_text(f"**{anime_name}**\n\nSeason **{season_name}**{range_text} ka episode select karein:", reply_markup=reply_markup, parse_mode='Markdown')
 
         else: 
-            seasons_dict = anime_doc.get("seasons", {})
-            if not seasons_dict:
+            sorted_season_keys = entry.season_keys()
+            if not sorted_season_keys:
                 await query.edit_message_text(f"❌ Error! '{anime_name}' ke seasons nahi mile.")
                 return
-            keyboard = []
-            sorted_season_keys = sorted(seasons_dict.keys(), key=lambda x: int(x) if x.isdigit() else x)
-            for s_key in sorted_season_keys:
-                cb_data = f"dl_{anime_name}_{s_key}"
-                keyboard.append([InlineKeyboardButton(f"Season {s_key}", callback_data=cb_data)])
-            await query.edit_message_text(f"**{anime_name}**\n\nSeason select karein:", reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+            reply_markup = entry.get_keyboard(None, "seasons") or entry.set_keyboard(None, "seasons", season_keyboard(entry, sorted_season_keys))
+            await query.edit_message_text(f"**{anime_name}**\n\nSeason select karein:", reply_markup=reply_markup, parse_mode='Markdown')
 
+    except BadRequest as e:
+        if "not modified" not in str(e).lower(): # Current page dobara dabaya
+            logger.error(f"Download handler me error: {e}")
     except Exception as e:
         logger.error(f"Download handler me error: {e}")
         try: await query.edit_message_text("❌ Error! Details fetch nahi kar paya.")
         except: pass
 
-async def send_file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def send_file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, entry, season_name: str, ep_num: str, quality: str):
     """(FIXED) File bhejta hai"""
     query = update.callback_query
-    user = query.effective_user
+    user = query.from_user
     sub_status = await check_user_subscription(user.id)
     if not sub_status["active"]:
         await query.answer("❌ Aapka subscription ab active nahi hai.", show_alert=True)
         return
     await query.answer("✅ File bhej raha hoon... Isme time lag sakta hai.")
     try:
-        parts = query.data.split('_')
-        quality = parts[1]
-        anime_name = parts[2]
-        season_name = parts[3]
-        ep_num = parts[4]
-        
-        anime_doc = get_db()['animes'].find_one({"name": anime_name})
-        file_data = anime_doc.get("seasons", {}).get(season_name, {}).get(ep_num, {}).get(quality)
+        file_data = await catalog_file(entry, season_name, ep_num, quality) if entry else None
         
         if not file_data or "id" not in file_data or "type" not in file_data:
             await context.bot.send_message(user.id, "❌ Error! File data corrupt hai. Admin se contact karein.")
             return
         file_id = file_data["id"]
         file_type = file_data["type"]
-        caption = f"🎬 **{anime_name}**\nS{season_name} - E{ep_num} ({quality})"
+        caption = f"🎬 **{entry.name}**\nS{season_name} - E{ep_num} ({quality})"
         
         if file_type == "video":
-            await context.bot.send_video(chat_id=user.id, video=file_id, caption=caption, parse_mode='Markdown')
+            await context.bot.send_video(chat_id=user.id, video=file_id, caption=caption, parse_mode='Markdown', rate_limit_args=PRIORITY_FILE)
         elif file_type == "document":
-            await context.bot.send_document(chat_id=user.id, document=file_id, caption=caption, parse_mode='Markdown')
+            await context.bot.send_document(chat_id=user.id, document=file_id, caption=caption, parse_mode='Markdown', rate_limit_args=PRIORITY_FILE)
         else:
             await context.bot.send_message(user.id, "❌ Error! File type unknown hai.")
     except Exception as e:
         logger.error(f"File send karne me error: {e}")
         await context.bot.send_message(user.id, "❌ Error! File send nahi kar paya. Shayad file server par delete ho gayi hai.")
 
+# --- Season Batch Delivery ---
+# "All Episodes" button: saari file_ids ek query mein, phir ek background task unhe order mein
+# bhejta hai. BATCH_PIPELINE_DEPTH tak sends ek saath limiter ke queue mein rehte hain (pacing
+# OUTBOUND_LIMITER karta hai), aur progress ek hi status message mein edit hota hai.
+# Cancel flag local dict mein hai aur `batches` collection mein bhi, taaki doosre worker par
+# aaya Cancel press bhi batch rok sake (sender har kuch seconds mein status poll karta hai).
+BATCH_PIPELINE_DEPTH = int(os.getenv("BATCH_PIPELINE_DEPTH", "3"))
+BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "5"))
+BATCH_CANCEL_POLL_INTERVAL = float(os.getenv("BATCH_CANCEL_POLL_INTERVAL", "3"))
+BATCH_STALE_SECONDS = int(os.getenv("BATCH_STALE_SECONDS", "120"))
+ACTIVE_BATCHES = {} # job_id -> {"cancelled": bool}
+
+async def season_batch_files(entry, season_name: str, quality: str = None):
+    """Ek query mein season ki files; har episode ki ek file (di gayi quality, warna best)."""
+    docs = await db_episodes.find({"anime_id": entry.id, "season": season_name}, {"_id": 0, "episode": 1, "quality": 1, "file_id": 1, "type": 1})
+    chosen = {}
+    for doc in docs:
+        if quality is not None and doc["quality"] != quality:
+            continue
+        current = chosen.get(doc["episode"])
+        if current is None or quality_rank(doc["quality"]) > quality_rank(current["quality"]):
+            chosen[doc["episode"]] = doc
+    return [chosen[ep] for ep in sorted(chosen, key=sort_key)]
+
+async def send_season_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, entry, season_name: str, quality: str = None):
+    query = update.callback_query
+    user = query.from_user
+    sub_status = await check_user_subscription(user.id)
+    if not sub_status["active"]:
+        await query.answer("❌ Aapka subscription ab active nahi hai.", show_alert=True)
+        return
+    if not entry:
+        await query.answer("❌ Ye anime database mein nahi mila.", show_alert=True)
+        return
+    try:
+        files = await season_batch_files(entry, season_name, quality)
+        if not files:
+            await query.answer("❌ Is season ki files nahi mili.", show_alert=True)
+            return
+        job_id = uuid.uuid4().hex[:12]
+        now = datetime.now()
+        # Crash hue worker ke "running" batches user ko block na karein
+        await db_batches.update_many(
+            {"user_id": user.id, "status": "running", "heartbeat_at": {"$lt": now - timedelta(seconds=BATCH_STALE_SECONDS)}},
+            {"$set": {"status": "abandoned"}}
+        )
+        await db_batches.insert_one({
+            "_id": job_id, "user_id": user.id, "anime_id": entry.id, "season": season_name, "quality": quality,
+            "status": "running", "total": len(files), "sent": 0, "created_at": now, "heartbeat_at": now,
+        })
+    except DuplicateKeyError:
+        await query.answer("⏳ Aapka ek batch pehle se chal raha hai. Use khatam ya cancel hone dein.", show_alert=True)
+        return
+    except Exception as e:
+        logger.error(f"Season batch start karne me error: {e}")
+        await query.answer("❌ Error! Batch start nahi ho paya.", show_alert=True)
+        return
+    await query.answer(f"✅ {len(files)} episodes bhej raha hoon...")
+    label = f"{entry.name} S{season_name}" + (f" ({quality})" if quality else "")
+    cancel_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("✖️ Cancel", callback_data=encode_callback(CB_OP_CANCEL_BATCH, entry.id, job_id))]])
+    ACTIVE_BATCHES[job_id] = {"cancelled": False}
+    try:
+        status_message = await context.bot.send_message(user.id, f"📥 {label}\n0/{len(files)} bheje...", reply_markup=cancel_keyboard)
+    except Exception as e:
+        logger.error(f"Batch status message nahi bhej paya: {e}")
+        ACTIVE_BATCHES.pop(job_id, None)
+        await db_batches.update_one({"_id": job_id}, {"$set": {"status": "failed"}})
+        return
+    context.application.create_task(deliver_season_batch(context.bot, job_id, user.id, entry.name, season_name, files, status_message, label, cancel_keyboard))
+
+async def _edit_batch_status(message, text: str, reply_markup=None):
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            logger.warning(f"Batch status edit nahi hua: {e}")
+    except Exception as e:
+        logger.warning(f"Batch status edit nahi hua: {e}")
+
+async def deliver_season_batch(bot, job_id: str, user_id: int, anime_name: str, season_name: str, files: list, status_message, label: str, cancel_keyboard):
+    state = ACTIVE_BATCHES.setdefault(job_id, {"cancelled": False})
+    window = asyncio.Semaphore(BATCH_PIPELINE_DEPTH)
+    counts = Counter()
+    tasks = []
+    last_progress = time.monotonic()
+
+    async def heartbeat():
+        # Send loop se alag: window full ho ya send atka ho tab bhi heartbeat aur cancel poll chalte rahein
+        while True:
+            await asyncio.sleep(BATCH_CANCEL_POLL_INTERVAL)
+            try:
+                doc = await db_batches.find_one_and_update(
+                    {"_id": job_id}, {"$set": {"sent": counts["sent"], "heartbeat_at": datetime.now()}}, projection={"status": 1}
+                )
+            except Exception as e:
+                logger.warning(f"Batch {job_id} heartbeat fail: {e}")
+                continue
+            if doc and doc.get("status") == "cancelled":
+                state["cancelled"] = True
+
+    async def send_one(f):
+        caption = f"🎬 **{anime_name}**\nS{season_name} - E{f['episode']} ({f['quality']})"
+        try:
+            if f["type"] == "video":
+                await bot.send_video(chat_id=user_id, video=f["file_id"], caption=caption, parse_mode='Markdown', rate_limit_args=PRIORITY_FILE)
+            else:
+                await bot.send_document(chat_id=user_id, document=f["file_id"], caption=caption, parse_mode='Markdown', rate_limit_args=PRIORITY_FILE)
+            counts["sent"] += 1
+        except Exception as e:
+            logger.warning(f"Batch {job_id}: E{f['episode']} nahi gaya: {e}")
+            counts["failed"] += 1
+        finally:
+            window.release()
+
+    status = "failed" # error ya task cancel (shutdown) par yahi save hota hai
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        for f in files:
+            await window.acquire()
+            if state["cancelled"]:
+                window.release()
+                break
+            tasks.append(asyncio.create_task(send_one(f)))
+            now = time.monotonic()
+            if now - last_progress >= BATCH_PROGRESS_INTERVAL:
+                last_progress = now
+                await _edit_batch_status(status_message, f"📥 {label}\n{counts['sent']}/{len(files)} bheje...", cancel_keyboard)
+        await asyncio.gather(*tasks)
+        status = "cancelled" if state["cancelled"] else "done"
+    except Exception as e:
+        logger.error(f"Batch {job_id} me error: {e}")
+    finally:
+        heartbeat_task.cancel()
+        # Error/cancel par bache hue sends rok do, taaki batch khatam hone ke baad files na aati rahein
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(heartbeat_task, *tasks, return_exceptions=True)
+        ACTIVE_BATCHES.pop(job_id, None)
+        try:
+            await db_batches.update_one({"_id": job_id}, {"$set": {"status": status, "sent": counts["sent"], "failed": counts["failed"], "finished_at": datetime.now()}})
+        except Exception as e:
+            logger.error(f"Batch {job_id} ka status save nahi hua: {e}")
+        title = {"cancelled": "✖️ Cancelled", "failed": "⚠️ Failed"}.get(status, "✅ Done")
+        summary = f"{title} — {label}\n{counts['sent']}/{len(files)} bheje"
+        if counts["failed"]:
+            summary += f", {counts['failed']} fail"
+        await _edit_batch_status(status_message, summary)
+        logger.info(f"Batch {job_id} ({label}) {status}: {counts['sent']}/{len(files)} sent, {counts['failed']} failed")
+
+async def cancel_batch_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, entry, job_id: str):
+    query = update.callback_query
+    state = ACTIVE_BATCHES.get(job_id)
+    if state is not None:
+        state["cancelled"] = True
+    try:
+        result = await db_batches.update_one({"_id": job_id, "user_id": query.from_user.id, "status": "running"}, {"$set": {"status": "cancelled"}})
+        modified = result.modified_count
+    except Exception as e:
+        logger.error(f"Batch cancel karne me error: {e}")
+        modified = 0
+    if state is not None or modified:
+        await query.answer("✖️ Cancel ho raha hai... jo files queue mein hain woh aa sakti hain.")
+    else:
+        await query.answer("Ye batch pehle hi khatam ho chuka hai.")
+
+# --- Inbound Guard ---
+# Impatient users ek hi button baar baar dabate hain, aur har press par poori video (ya poora
+# episode list edit) dobara jaata tha. Guard sends aur navigation (download/page) dono ko wrap karta hai:
+# - same user + same button `DUPLICATE_CLICK_WINDOW` seconds ke andar dobara -> sirf toast (beech mein
+#   doosra button daba toh window reset, taaki tez back/forward navigation na atke)
+# - send abhi chal raha hai toh window ke baad bhi duplicate nahi; send fail ho toh key turant hat jaati
+#   hai, taaki user dobara maang sake
+# - ek user ke ek saath `MAX_INFLIGHT_SENDS_PER_USER` se zyada file sends nahi
+# State per-process hai; multi-worker mein bhi ek user ko worst case N-guna hi milega.
+DUPLICATE_CLICK_WINDOW = float(os.getenv("DUPLICATE_CLICK_WINDOW", "2"))
+MAX_INFLIGHT_SENDS_PER_USER = int(os.getenv("MAX_INFLIGHT_SENDS_PER_USER", "2"))
+RECENT_CLICKS = LRUCache(int(os.getenv("RECENT_CLICKS_MAX_SIZE", "20000"))) # user_id -> aakhri click key
+INFLIGHT_CLICKS = set()
+INFLIGHT_SENDS = Counter()
+
+def inbound_guard(handler, busy_text: str = None, limit_inflight: bool = False):
+    """`handler(update, context, entry, *fields)` ko duplicate-click guard (window + in-flight) se wrap karta hai."""
+    async def guarded(update: Update, context: ContextTypes.DEFAULT_TYPE, entry, *fields):
+        query = update.callback_query
+        user_id = query.from_user.id
+        click_key = (user_id, handler.__name__, entry.id if entry else None, *fields)
+        if click_key in INFLIGHT_CLICKS or RECENT_CLICKS.get(user_id) == click_key:
+            await query.answer(busy_text)
+            return
+        if limit_inflight and INFLIGHT_SENDS[user_id] >= MAX_INFLIGHT_SENDS_PER_USER:
+            await query.answer("⏳ Aapki pichhli files abhi bhej raha hoon. Unke aane ke baad dabayein.")
+            return
+        RECENT_CLICKS.set(user_id, click_key, ttl=DUPLICATE_CLICK_WINDOW)
+        INFLIGHT_CLICKS.add(click_key)
+        if limit_inflight:
+            INFLIGHT_SENDS[user_id] += 1
+        try:
+            return await handler(update, context, entry, *fields)
+        except Exception:
+            if RECENT_CLICKS.get(user_id) == click_key:
+                RECENT_CLICKS.pop(user_id) # fail hua toh dobara dabane do
+            raise
+        finally:
+            INFLIGHT_CLICKS.discard(click_key)
+            if limit_inflight:
+                INFLIGHT_SENDS[user_id] -= 1
+                if INFLIGHT_SENDS[user_id] <= 0:
+                    del INFLIGHT_SENDS[user_id]
+    guarded.__name__ = handler.__name__
+    return guarded
+
+guarded_send_file_handler = inbound_guard(send_file_handler, "⏳ Already sending... thoda wait karein.", limit_inflight=True)
+guarded_send_season_handler = inbound_guard(send_season_handler, "⏳ Batch start ho raha hai...")
+
+async def episode_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, entry, season_name: str, page: str):
+    """Season ki episode list ka doosra range page."""
+    await download_handler(update, context, entry, season_name, page=page)
+
+guarded_download_handler = inbound_guard(download_handler)
+guarded_episode_page_handler = inbound_guard(episode_page_handler)
+
+# --- Callback Dispatcher ---
+# Saare encoded navigation buttons ek hi CallbackQueryHandler par aate hain; op byte se route hota hai.
+CALLBACK_ROUTES = {
+    CB_OP_DOWNLOAD: guarded_download_handler,
+    CB_OP_SEND_FILE: guarded_send_file_handler,
+    CB_OP_SEND_SEASON: guarded_send_season_handler,
+    CB_OP_CANCEL_BATCH: cancel_batch_handler,
+    CB_OP_EPISODE_PAGE: guarded_episode_page_handler,
+}
+
+def _match_key(field, names):
+    """Key field (callback_key) ko naamon mein se match karta hai."""
+    if not isinstance(field, bytes):
+        return None
+    return next((name for name in names if callback_key(name) == field), None)
+
+async def resolve_callback_fields(op: int, entry: CatalogEntry, fields: list):
+    """Decoded fields ko handler args (season/ep/quality naam, page) mein badalta hai.
+    Season ya quality ab catalog mein na ho (delete hua) toh None."""
+    if op == CB_OP_CANCEL_BATCH:
+        return [str(f) for f in fields]
+    if not fields:
+        return []
+    season = _match_key(fields[0], entry.season_keys())
+    if season is None:
+        return None
+    resolved = [season]
+    if op in (CB_OP_DOWNLOAD, CB_OP_SEND_FILE, CB_OP_EPISODE_PAGE) and len(fields) > 1:
+        resolved.append(str(fields[1])) # episode ya page (int ho toh bhi handler ko str chahiye)
+    quality_index = {CB_OP_SEND_FILE: 2, CB_OP_SEND_SEASON: 1}.get(op)
+    if quality_index is not None and len(fields) > quality_index:
+        quality = _match_key(fields[quality_index], QUALITY_ORDER)
+        if quality is None: # QUALITY_ORDER ke bahar ki quality: is episode/season ki asli qualities se
+            if op == CB_OP_SEND_FILE:
+                known = await catalog_qualities(entry, season, resolved[1])
+            else:
+                known = (await catalog_season_summary(entry, season))["qualities"]
+            quality = _match_key(fields[quality_index], known)
+        if quality is None:
+            return None
+        resolved.append(quality)
+    return resolved
+
+async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    try:
+        op, anime_id, fields = decode_callback(query.data)
+        route = CALLBACK_ROUTES[op]
+    except (ValueError, KeyError) as e:
+        logger.warning(f"Galat callback data '{query.data}': {e}")
+        await query.answer("❌ Ye button purana ya galat hai.", show_alert=True)
+        return
+    entry = await catalog_get_by_id(anime_id)
+    if entry is None and op != CB_OP_CANCEL_BATCH:
+        await query.answer("❌ Ye anime database mein nahi mila.", show_alert=True)
+        return
+    fields = await resolve_callback_fields(op, entry, fields)
+    if fields is None:
+        await query.answer("❌ Ye season/quality ab available nahi hai.", show_alert=True)
+        return
+    await route(update, context, entry, *fields)
+
+async def _resolve_legacy_anime(rest: str, max_fields: int):
+    """Purane `name_season_ep` format mein naam ke andar bhi '_' ho sakta hai;
+    sabse lamba naam pehle try karke jo anime mile woh return karta hai."""
+    for n_fields in range(max_fields + 1):
+        parts = rest.rsplit('_', n_fields) if n_fields else [rest]
+        if len(parts) != n_fields + 1:
+            break
+        entry = await catalog_get(parts[0])
+        if entry:
+            return entry, parts[1:]
+    return None, []
+
+async def legacy_download_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Purane channel posts ke `dl_{anime}_{season}_{ep}` buttons."""
+    entry, fields = await _resolve_legacy_anime(update.callback_query.data[len("dl_"):], 2)
+    await guarded_download_handler(update, context, entry, *fields)
+
+async def legacy_send_file_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Purane `sendfile_{q}_{anime}_{season}_{ep}` buttons (truncated/galat data par expired message)."""
+    prefix_parts = update.callback_query.data.split('_', 2)
+    parts = prefix_parts[2].rsplit('_', 2) if len(prefix_parts) == 3 else []
+    entry = await catalog_get(parts[0]) if len(parts) == 3 and all(parts) else None
+    if not entry:
+        await update.callback_query.answer("❌ Ye button purana hai. Firse Download dabayein.", show_alert=True)
+        return
+    await guarded_send_file_handler(update, context, entry, parts[1], parts[2], prefix_parts[1])
+
+# --- Storage Channel Import ---
+# Purani files ek private storage channel mein padi hain. Bot API channel history nahi padh
+# sakta, isliye import do raston se aata hai: STORAGE_CHAT_ID mein naye channel posts (bot wahan
+# admin ho), aur admin ke DM mein us channel se forward kiye gaye purane messages.
+# Caption/filename se anime, season, episode, quality nikalte hain; upserts batches mein flush hote
+# hain aur har imported message ka id `import_messages` mein (`{chat_id}:{message_id}`) record hota hai,
+# isliye koi bhi range kisi bhi order mein dobara forward karne par sirf wahi skip hote hain jo sach
+# mein import ho chuke (flush par batch ke ids ki ek `_id` `$in` query). Skip hue messages record nahi hote: anime add karke dobara forward karo toh
+# woh import ho jaate hain. /import_reset se records saaf karke poora channel dobara import kar sakte hain.
+STORAGE_CHAT_ID = int(os.getenv("STORAGE_CHAT_ID", "0")) or None
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "200"))
+IMPORT_FLUSH_INTERVAL = float(os.getenv("IMPORT_FLUSH_INTERVAL", "5"))
+IMPORT_STATUS_INTERVAL = float(os.getenv("IMPORT_STATUS_INTERVAL", "10"))
+db_import_state = AsyncCollection("import_state")
+db_import_messages = AsyncCollection("import_messages")
+
+async def resolve_import_anime(title: str):
+    """Title se catalog ka anime: exact (normalized) match, warna is title se shuru hone wala akela naam.
+    Fuzzy match kabhi nahi: galat anime mein file jaane se skip hona behtar hai."""
+    norm = normalize_search_text(title or "")
+    if not norm:
+        return None
+    candidates = SEARCH_INDEX.starts_with(norm)
+    exact = [name for name in candidates if normalize_search_text(name) == norm]
+    if exact:
+        return await catalog_get(exact[0])
+    if len(candidates) == 1:
+        return await catalog_get(candidates[0])
+    return None
+
+class StorageImporter:
+    """Storage channel ke files ko episodes mein batched upserts se import karta hai."""
+    def __init__(self):
+        self.pending = []       # [{chat_id, message_id, entry, season, ep, quality, file_id, type}]
+        self.skipped = Counter() # chat_id -> skipped since last flush
+        self.queued = set()     # (chat_id, message_id) jo pending mein hain (flush ke baad hat jaate hain)
+        self.stats = Counter()
+        self.recent_skips = deque(maxlen=20)
+        self.started_at = None
+        self._flush_lock = asyncio.Lock()
+
+    async def _already_imported(self, batch: list) -> set:
+        """Batch ke jo messages pehle import ho chuke: `_id` par ek `$in` query (poore channel ke ids memory mein nahi)."""
+        ids = [f"{item['chat_id']}:{item['message_id']}" for item in batch]
+        docs = await db_import_messages.find({"_id": {"$in": ids}}, {"_id": 1})
+        return {doc["_id"] for doc in docs}
+
+    def reset(self):
+        self.pending, self.skipped, self.queued = [], Counter(), set()
+
+    async def handle(self, message, chat_id: int, message_id: int):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.stats["seen"] += 1
+        if (chat_id, message_id) in self.queued: # flush se pehle dobara forward hua
+            self.stats["already_imported"] += 1
+            return
+        media = media_file(message)
+        if not media:
+            return
+        file_id, file_type, file_name = media
+        info = parse_media_text(message.caption)
+        for key, value in parse_media_text(file_name).items():
+            info.setdefault(key, value)
+        entry = await resolve_import_anime(info.get("title"))
+        season = info.get("season")
+        if entry and not season:
+            seasons = entry.season_keys()
+            season = seasons[0] if len(seasons) == 1 else None # Ek hi season hai toh wahi
+        reason = None
+        if not entry: reason = "anime nahi mila"
+        elif not season: reason = "season nahi mila"
+        elif "episode" not in info or "quality" not in info: reason = "episode/quality nahi mila"
+        if reason:
+            self.stats["skipped"] += 1
+            self.skipped[chat_id] += 1
+            self.recent_skips.append(f"#{message_id} {file_name or message.caption or ''} — {reason}"[:120])
+            return
+        self.pending.append({
+            "chat_id": chat_id, "message_id": message_id, "entry": entry, "season": season,
+            "ep": info["episode"], "quality": info["quality"], "file_id": file_id, "type": file_type,
+        })
+        self.queued.add((chat_id, message_id))
+        if len(self.pending) >= IMPORT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        """Pending upserts ek bulk_write mein, phir imported message ids. Fail hone par batch agle flush tak rehta hai."""
+        async with self._flush_lock:
+            if not self.pending and not self.skipped:
+                return
+            batch, skipped = self.pending, self.skipped
+            self.pending, self.skipped = [], Counter()
+            try:
+                if batch:
+                    # Pehle import ho chuke messages (dobara forward) batch se hata do
+                    done = await self._already_imported(batch)
+                    if done:
+                        dropped = [item for item in batch if f"{item['chat_id']}:{item['message_id']}" in done]
+                        self.queued.difference_update((item["chat_id"], item["message_id"]) for item in dropped)
+                        self.stats["already_imported"] += len(dropped)
+                        batch = [item for item in batch if item not in dropped]
+                new_seasons = {(item["entry"].id, item["entry"].name, item["season"]) for item in batch if item["season"] not in item["entry"].season_keys()}
+                if new_seasons:
+                    await db_animes.bulk_write([UpdateOne({"_id": anime_id}, {"$set": {f"seasons.{season}": {}}}) for anime_id, _, season in new_seasons], ordered=False)
+                    for _, anime_name, season in new_seasons:
+                        catalog_add_season(anime_name, season)
+                if batch:
+                    await db_episodes.bulk_write([
+                        UpdateOne(
+                            episode_file_filter(item["entry"].id, item["season"], item["ep"], item["quality"]),
+                            {"$set": {"ep_no": episode_number(item["ep"]), "file_id": item["file_id"], "type": item["type"]}},
+                            upsert=True
+                        ) for item in batch
+                    ], ordered=False)
+                    for item in batch:
+                        catalog_add_file(item["entry"].name, item["season"], item["ep"], item["quality"], {"id": item["file_id"], "type": item["type"]})
+                now = datetime.now()
+                if batch:
+                    await db_import_messages.bulk_write([
+                        UpdateOne(
+                            {"_id": f"{item['chat_id']}:{item['message_id']}"},
+                            {"$set": {"chat_id": item["chat_id"], "message_id": item["message_id"], "anime_id": item["entry"].id,
+                                      "season": item["season"], "episode": item["ep"], "quality": item["quality"], "imported_at": now}},
+                            upsert=True
+                        ) for item in batch
+                    ], ordered=False)
+                imported = Counter(item["chat_id"] for item in batch)
+                for chat_id in set(imported) | set(skipped):
+                    await db_import_state.update_one(
+                        {"_id": chat_id},
+                        {"$inc": {"imported": imported[chat_id], "skipped": skipped[chat_id]},
+                         "$set": {"updated_at": now}, "$setOnInsert": {"started_at": now}},
+                        upsert=True
+                    )
+                self.queued.difference_update((item["chat_id"], item["message_id"]) for item in batch)
+                self.stats["imported"] += len(batch)
+                self.stats["flushes"] += 1
+                if batch:
+                    logger.info(f"Storage import: {len(batch)} files flush hue (total {self.stats['imported']}).")
+            except Exception as e:
+                logger.error(f"Storage import flush me error: {e}")
+                self.stats["flush_failed"] += 1
+                self.pending = batch + self.pending
+                self.skipped.update(skipped)
+
+    def throughput(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return self.stats["imported"] / max(time.monotonic() - self.started_at, 0.001)
+
+STORAGE_IMPORTER = StorageImporter()
+
+async def storage_channel_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """STORAGE_CHAT_ID mein aaya naya post."""
+    message = update.channel_post
+    await STORAGE_IMPORTER.handle(message, message.chat_id, message.message_id)
+
+def forwarded_source(message):
+    """Forward ka original (chat_id, message_id); PTB ke naye `forward_origin` aur purane fields dono."""
+    origin = getattr(message, "forward_origin", None)
+    if origin is not None and getattr(origin, "chat", None) is not None:
+        return origin.chat.id, getattr(origin, "message_id", None)
+    chat = getattr(message, "forward_from_chat", None)
+    if chat is not None:
+        return chat.id, getattr(message, "forward_from_message_id", None)
+    return None, None
+
+async def storage_forward_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin ke DM mein storage channel se forward hue purane files."""
+    message = update.message
+    chat_id, message_id = forwarded_source(message)
+    if chat_id != STORAGE_CHAT_ID or message_id is None:
+        return
+    await STORAGE_IMPORTER.handle(message, chat_id, message_id)
+    now = time.monotonic()
+    if now - context.bot_data.get('import_status_at', 0.0) >= IMPORT_STATUS_INTERVAL:
+        context.bot_data['import_status_at'] = now
+        stats = STORAGE_IMPORTER.stats
+        await message.reply_text(f"📥 Import: {stats['imported']} saved, {len(STORAGE_IMPORTER.pending)} pending, {stats['skipped']} skipped, {stats['already_imported']} pehle se. /import_status")
+
+async def import_flush_job(context: ContextTypes.DEFAULT_TYPE):
+    await STORAGE_IMPORTER.flush()
+
+async def import_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("Aap admin nahi hain.")
+        return
+    stats = STORAGE_IMPORTER.stats
+    lines = [
+        "📦 **Storage Import Status**\n",
+        f"Storage chat: {STORAGE_CHAT_ID or 'set nahi hai (STORAGE_CHAT_ID)'}",
+        f"Is process mein: seen {stats['seen']} | imported {stats['imported']} | pending {len(STORAGE_IMPORTER.pending)} | skipped {stats['skipped']} | pehle se {stats['already_imported']} | flush errors {stats['flush_failed']}",
+        f"Speed: {STORAGE_IMPORTER.throughput():.1f} files/sec",
+    ]
+    try:
+        for doc in await db_import_state.find({}):
+            lines.append(f"Chat {doc['_id']}: imported {doc.get('imported', 0)}, skipped {doc.get('skipped', 0)}, updated {doc['updated_at'].strftime('%Y-%m-%d %H:%M') if doc.get('updated_at') else '-'}")
+    except Exception as e:
+        logger.error(f"Import state fetch karne me error: {e}")
+    if STORAGE_IMPORTER.recent_skips:
+        lines.append("\nRecent skips:")
+        lines += [f"  • {s}" for s in STORAGE_IMPORTER.recent_skips]
+    await update.message.reply_text("\n".join(lines))
+
+async def import_reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Storage chat ke imported message records saaf karta hai (episodes nahi), taaki poora channel dobara import ho sake."""
+    if not await is_admin(update.effective_user.id):
+        await update.message.reply_text("Aap admin nahi hain.")
+        return
+    if not STORAGE_CHAT_ID:
+        await update.message.reply_text("STORAGE_CHAT_ID set nahi hai.")
+        return
+    try:
+        await STORAGE_IMPORTER.flush()
+        result = await db_import_messages.delete_many({"chat_id": STORAGE_CHAT_ID})
+        await db_import_state.delete_one({"_id": STORAGE_CHAT_ID})
+    except Exception as e:
+        logger.error(f"Import reset me error: {e}")
+        await update.message.reply_text("❌ Import reset nahi ho paya.")
+        return
+    STORAGE_IMPORTER.reset()
+    await update.message.reply_text(f"♻️ Import records reset: {result.deleted_count} messages. Ab files dobara forward karke import kar sakte hain.")
+
 # --- Admin Panel (Naya Layout) ---
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """(FIXED) Admin panel ka main menu"""
@@ -1125,7 +3545,7 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     logger.info("Admin ne admin panel access kiya.")
     
-    pending_count = get_db()['users'].count_documents({"pending_payment": {"$ne": None}})
+    pending_count = await get_pending_count()
     
     keyboard = [
         [InlineKeyboardButton("➕ Add Content", callback_data="admin_menu_add_content")],
@@ -1154,18 +3574,236 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Error: {context.error} \nUpdate: {update}", exc_info=True)
 
-# --- Main Bot Function ---
-def main():
-    if not check_db_connection():
-        logger.critical("Bot band ho raha hai, DB connection fail.")
-        exit()
-        
-    logger.info("Flask web server start ho raha hai (Render port ke liye)...")
-    flask_thread = Thread(target=run_flask)
-    flask_thread.start()
-    
+# --- Shared Persistence (Mongo) ---
+# Conversation states, user_data aur bot_data `persistence` collection mein rehte hain, taaki
+# restart par admin ka adhoora upload na khoye aur N webhook workers ek hi state dekhein.
+# PTB khud dirty keys track karta hai aur har PERSISTENCE_FLUSH_INTERVAL par sirf unhe bhejta hai;
+# yahan us batch ke writes ek bulk_write mein jaate hain aur unchanged data dobara nahi likha jaata.
+# User ka data load_shared_state (group -2) har user ke pehle update par DB se hydrate karta hai (polling mein bhi),
+# aur PERSISTENCE_REFRESH on ho to har update par doosre workers ke changes bhi load karta hai.
+# Conversation states startup par get_conversations se aati hain; PTB unhe badalne ka public API nahi deta,
+# isliye webhook workers ke beech ek user ka conversation beech mein worker nahi badalna chahiye.
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "2"))
+PERSISTENCE_REFRESH = os.getenv("PERSISTENCE_REFRESH", "1" if os.getenv("BOT_MODE", "polling").lower() == "webhook" else "0") == "1"
+
+class MongoPersistence(BasePersistence):
+    """Mongo-backed persistence. Docs: `user:{id}`, `bot`, `conv:{name}:{key}`; har doc ka `rev`
+    batata hai kis writer ne aakhri baar likha, taaki refresh sirf doosron ke changes load kare."""
+    def __init__(self, update_interval: float = PERSISTENCE_FLUSH_INTERVAL):
+        super().__init__(store_data=PersistenceInput(chat_data=False, callback_data=False), update_interval=update_interval)
+        self._hydrated = set() # user ids jinka data DB se load ho chuka hai
+        self._pending = {}   # doc _id -> UpdateOne/DeleteOne (latest wins)
+        self._snapshots = {} # doc _id -> aakhri baar likha/padha pickled data
+        self._revs = {}      # doc _id -> aakhri rev jo is worker ko pata hai
+        self._flush_task = None
+
+    # --- Writes (batched) ---
+    async def _queue(self, doc_id: str, update: dict = None):
+        """Write ko batch mein daalta hai; ek hi persistence tick ke saare writes ek bulk_write mein."""
+        if update is None:
+            self._pending[doc_id] = DeleteOne({"_id": doc_id})
+            self._revs.pop(doc_id, None)
+            self._snapshots.pop(doc_id, None)
+        else:
+            rev = uuid.uuid4().hex
+            update["rev"] = rev
+            self._pending[doc_id] = UpdateOne({"_id": doc_id}, {"$set": update}, upsert=True)
+            self._revs[doc_id] = rev
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_soon())
+        await asyncio.shield(self._flush_task)
+    async def _flush_soon(self):
+        await asyncio.sleep(0) # isi tick ke baaki update_* calls ko bhi queue hone do
+        await self._write_pending()
+    async def _write_pending(self):
+        if not self._pending:
+            return
+        pending = dict(self._pending)
+        self._pending.clear()
+        try:
+            await db_persistence.bulk_write(list(pending.values()), ordered=False)
+        except Exception:
+            # Snapshot hata do taaki agle tick par ye data dobara likha jaaye
+            for doc_id in pending:
+                self._snapshots.pop(doc_id, None)
+            raise
+    async def _queue_data(self, doc_id: str, data, extra: dict = None):
+        raw = pickle.dumps(data)
+        if self._snapshots.get(doc_id) == raw:
+            return # kuch badla nahi
+        self._snapshots[doc_id] = raw
+        await self._queue(doc_id, {"data": Binary(raw), **(extra or {})})
+
+    # --- Loads ---
+    async def get_user_data(self):
+        return {} # Lazy: har user ka data pehle update par load_user_state load karta hai
+    async def get_chat_data(self):
+        return {}
+    async def get_bot_data(self):
+        doc = await db_persistence.find_one({"_id": "bot"})
+        if not doc:
+            return {}
+        self._snapshots["bot"], self._revs["bot"] = bytes(doc["data"]), doc.get("rev")
+        return pickle.loads(doc["data"])
+    async def get_callback_data(self):
+        return None
+    async def get_conversations(self, name: str):
+        docs = await db_persistence.find({"kind": "conversation", "name": name})
+        return {tuple(doc["key"]): doc["state"] for doc in docs}
+
+    # --- Updates (PTB har flush interval par sirf changed keys ke liye bulata hai) ---
+    async def update_user_data(self, user_id: int, data: dict):
+        if user_id not in self._hydrated:
+            return # DB wala data abhi load nahi hua; khaali dict se stored doc overwrite nahi karna
+        await self._queue_data(f"user:{user_id}", data, {"kind": "user", "user_id": user_id})
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+    async def update_bot_data(self, data: dict):
+        await self._queue_data("bot", data, {"kind": "bot"})
+    async def update_callback_data(self, data):
+        pass
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        doc_id = f"conv:{name}:{':'.join(map(str, key))}"
+        if new_state is None:
+            await self._queue(doc_id)
+        else:
+            await self._queue(doc_id, {"kind": "conversation", "name": name, "key": list(key), "user_id": key[-1], "state": new_state})
+    async def drop_user_data(self, user_id: int):
+        await self._queue(f"user:{user_id}")
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    # --- Refresh (pehla load + doosre workers ke writes) ---
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        # PTB ye check_update ke BAAD bulata hai, tab tak conversation state match ho chuki hoti hai.
+        # Asli load load_user_state mein hai, jo load_shared_state dispatch se pehle chalata hai.
+        pass
+    async def load_user_state(self, user_id: int, user_data: dict):
+        """Pehle touch par user ka data DB se hamesha load hota hai; uske baad sirf PERSISTENCE_REFRESH par
+        (aur sirf doosre writers ke changes, `rev` se pehchaan kar)."""
+        doc_id = f"user:{user_id}"
+        if user_id in self._hydrated and not PERSISTENCE_REFRESH:
+            return
+        doc = await db_persistence.find_one({"_id": doc_id})
+        first_touch = user_id not in self._hydrated
+        self._hydrated.add(user_id)
+        if doc_id in self._pending:
+            return # apna naya write abhi DB tak nahi pahuncha
+        if doc is None:
+            # Doosre worker ne data drop kiya (ya kabhi tha hi nahi)
+            if doc_id in self._revs:
+                self._revs.pop(doc_id, None)
+                self._snapshots.pop(doc_id, None)
+                user_data.clear()
+            return
+        if not first_touch and doc.get("rev") == self._revs.get(doc_id):
+            return
+        self._revs[doc_id] = doc.get("rev")
+        self._snapshots[doc_id] = bytes(doc["data"])
+        user_data.clear()
+        user_data.update(pickle.loads(doc["data"]))
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        """Shutdown par bache hue writes."""
+        await self._write_pending()
+
+async def load_shared_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Group -2: kisi bhi handler ke check_update se pehle doosre workers ke caches aur user state sync karta hai."""
+    await sync_cache_versions()
+    persistence = context.application.persistence
+    if update.effective_user and isinstance(persistence, MongoPersistence):
+        try:
+            await persistence.load_user_state(update.effective_user.id, context.user_data)
+        except Exception as e:
+            logger.error(f"User {update.effective_user.id} ki shared state load karne me error: {e}")
+
+# --- Leader Election ---
+# Webhook mode mein har gunicorn worker poora Application chalata hai. Cluster-wide kaam (expiry
+# sweep, pending reconcile, broadcast resume, set_webhook) sirf leader karta hai: `counters` ke
+# `leader` doc par ek lease (owner + lease_until) jise leader har LEADER_LEASE_SECONDS / 3 par renew
+# karta hai. Leader worker mar jaaye toh lease expire hone par koi doosra worker le leta hai.
+# Polling mode mein ek hi process hai, woh hamesha leader hai.
+LEADER_LEASE_ID = "leader"
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "60"))
+LEADER_ELECTION = os.getenv("BOT_MODE", "polling").lower() == "webhook"
+_leader = {"is_leader": not LEADER_ELECTION}
+
+def is_leader() -> bool:
+    return _leader["is_leader"]
+
+async def renew_leadership(context: ContextTypes.DEFAULT_TYPE = None) -> bool:
+    """Lease lene/renew karne ki koshish (har worker par JobQueue job); leader hai ya nahi return karta hai."""
+    if not LEADER_ELECTION:
+        return True
+    now, me = datetime.now(), worker_id()
+    try:
+        doc = await db_counters.find_one_and_update(
+            {"_id": LEADER_LEASE_ID, "$or": [{"owner": me}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"owner": me, "lease_until": now + timedelta(seconds=LEADER_LEASE_SECONDS)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        doc = None # Lease kisi aur worker ke paas hai
+    except Exception as e:
+        logger.error(f"Leader lease renew karne me error: {e}")
+        doc = None # DB na mile toh leader kaam band, lease expire hone par koi aur le lega
+    leader = doc is not None
+    if leader != _leader["is_leader"]:
+        logger.info(f"Worker {me} {'ab leader hai' if leader else 'leader nahi raha'}.")
+    _leader["is_leader"] = leader
+    return leader
+
+async def leadership_job(context: ContextTypes.DEFAULT_TYPE):
+    was_leader = is_leader()
+    if await renew_leadership() and not was_leader and LEADER_ELECTION:
+        await register_webhook(context.bot) # Naya leader (purana worker mar gaya ya naya deploy)
+
+def leader_only(callback):
+    """JobQueue callback ko sirf leader worker par chalata hai."""
+    async def run(context: ContextTypes.DEFAULT_TYPE):
+        if is_leader():
+            await callback(context)
+    run.__name__ = callback.__name__
+    return run
+
+# --- Startup Hook ---
+async def post_init(application: Application):
+    """Application start hone se pehle ek baar chalta hai."""
+    await seed_config()
+    await rebuild_search_index()
+    if await renew_leadership():
+        await reconcile_pending_count()
+        await resume_broadcasts(application)
+
+# --- Application Builder ---
+def instrument_handlers(application: Application):
+    """Saare handlers (conversation steps samet) aur CALLBACK_ROUTES ke callbacks ko timed_handler se wrap karta hai."""
+    def wrap(handler):
+        if isinstance(handler, ConversationHandler):
+            for inner in handler.entry_points + handler.fallbacks + [h for hs in handler.states.values() for h in hs]:
+                wrap(inner)
+        elif hasattr(handler, "callback"):
+            handler.callback = timed_handler(handler.callback)
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            wrap(handler)
+    for op, route in CALLBACK_ROUTES.items():
+        CALLBACK_ROUTES[op] = timed_handler(route)
+
+def build_application(webhook: bool = False) -> Application:
+    """Saare handlers aur jobs ke saath Application banata hai.
+    Webhook mode mein Updater nahi hota, updates Flask route se update_queue mein aate hain."""
     logger.info("Bot Application ban raha hai...")
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Concurrent updates: ek user ka slow request baaki users ko block na kare
+    persistence = MongoPersistence()
+    builder = Application.builder().token(BOT_TOKEN).concurrent_updates(CONCURRENT_UPDATES).post_init(post_init).persistence(persistence).rate_limiter(OUTBOUND_LIMITER)
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
     
     # --- Saare Conversation Handlers ---
     
@@ -1179,31 +3817,35 @@ def main():
     cancel_fallback = [CommandHandler("cancel", conv_cancel)]
 
     # (Saare purane conversations)
-    add_anime_conv = ConversationHandler(entry_points=[CallbackQueryHandler(add_anime_start, pattern="^admin_add_anime$")], states={A_GET_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_anime_name)], A_GET_POSTER: [MessageHandler(filters.PHOTO, get_anime_poster)], A_GET_DESC: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_anime_desc), CommandHandler("skip", skip_anime_desc)], A_CONFIRM: [CallbackQueryHandler(save_anime_details, pattern="^save_anime$")]}, fallbacks=cancel_fallback + add_content_fallback)
-    add_season_conv = ConversationHandler(entry_points=[CallbackQueryHandler(add_season_start, pattern="^admin_add_season$")], states={S_GET_ANIME: [CallbackQueryHandler(get_anime_for_season, pattern="^season_anime_")], S_GET_NUMBER: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_season_number)], S_CONFIRM: [CallbackQueryHandler(save_season, pattern="^save_season$")]}, fallbacks=cancel_fallback + add_content_fallback)
-    add_episode_conv = ConversationHandler(entry_points=[CallbackQueryHandler(add_episode_start, pattern="^admin_add_episode$")], states={E_GET_ANIME: [CallbackQueryHandler(get_anime_for_episode, pattern="^ep_anime_")], E_GET_SEASON: [CallbackQueryHandler(get_season_for_episode, pattern="^ep_season_")], E_GET_NUMBER: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_episode_number)], E_GET_QUALITY: [CallbackQueryHandler(get_episode_quality, pattern="^ep_quality_")], E_GET_FILE: [MessageHandler(filters.VIDEO | filters.Document.ALL, get_episode_file)]}, fallbacks=cancel_fallback + add_content_fallback)
-    set_sub_qr_conv = ConversationHandler(entry_points=[CallbackQueryHandler(set_sub_qr_start, pattern="^admin_set_sub_qr$")], states={CS_GET_QR: [MessageHandler(filters.PHOTO, set_sub_qr_save)]}, fallbacks=cancel_fallback + sub_settings_fallback)
-    set_price_conv = ConversationHandler(entry_points=[CallbackQueryHandler(set_price_start, pattern="^admin_set_price$")], states={CP_GET_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_price_save)]}, fallbacks=cancel_fallback + sub_settings_fallback)
-    set_donate_qr_conv = ConversationHandler(entry_points=[CallbackQueryHandler(set_donate_qr_start, pattern="^admin_set_donate_qr$")], states={CD_GET_QR: [MessageHandler(filters.PHOTO, set_donate_qr_save)]}, fallbacks=cancel_fallback + donate_settings_fallback)
-    set_links_conv = ConversationHandler(entry_points=[CallbackQueryHandler(set_links_start, pattern="^admin_set_donate_link$|^admin_set_backup_link$|^admin_set_support_link$")], states={CL_GET_BACKUP: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_link), CommandHandler("skip", skip_link)]}, fallbacks=cancel_fallback + links_fallback + donate_settings_fallback)
-    post_gen_conv = ConversationHandler(entry_points=[CallbackQueryHandler(post_gen_menu, pattern="^admin_post_gen$")], states={PG_MENU: [CallbackQueryHandler(post_gen_select_anime, pattern="^post_gen_season$"), CallbackQueryHandler(post_gen_select_anime, pattern="^post_gen_episode$")], PG_GET_ANIME: [CallbackQueryHandler(post_gen_select_season, pattern="^post_anime_")], PG_GET_SEASON: [CallbackQueryHandler(post_gen_select_episode, pattern="^post_season_")], PG_GET_EPISODE: [CallbackQueryHandler(post_gen_final_episode, pattern="^post_ep_")], PG_GET_CHAT: [MessageHandler(filters.TEXT & ~filters.COMMAND, post_gen_send_to_chat)]}, fallbacks=cancel_fallback + admin_menu_fallback)
-    del_anime_conv = ConversationHandler(entry_points=[CallbackQueryHandler(delete_anime_start, pattern="^admin_del_anime$")], states={DA_GET_ANIME: [CallbackQueryHandler(delete_anime_confirm, pattern="^del_anime_")], DA_CONFIRM: [CallbackQueryHandler(delete_anime_do, pattern="^del_anime_confirm_yes$")]}, fallbacks=cancel_fallback + manage_fallback)
-    del_season_conv = ConversationHandler(entry_points=[CallbackQueryHandler(delete_season_start, pattern="^admin_del_season$")], states={DS_GET_ANIME: [CallbackQueryHandler(delete_season_select, pattern="^del_season_anime_")], DS_GET_SEASON: [CallbackQueryHandler(delete_season_confirm, pattern="^del_season_")], DS_CONFIRM: [CallbackQueryHandler(delete_season_do, pattern="^del_season_confirm_yes$")]}, fallbacks=cancel_fallback + manage_fallback)
+    add_anime_conv = ConversationHandler(name="add_anime", persistent=True, entry_points=[CallbackQueryHandler(add_anime_start, pattern="^admin_add_anime$")], states={A_GET_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_anime_name)], A_GET_POSTER: [MessageHandler(filters.PHOTO, get_anime_poster)], A_GET_DESC: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_anime_desc), CommandHandler("skip", skip_anime_desc)], A_CONFIRM: [CallbackQueryHandler(save_anime_details, pattern="^save_anime$")]}, fallbacks=cancel_fallback + add_content_fallback)
+    add_season_conv = ConversationHandler(name="add_season", persistent=True, entry_points=[CallbackQueryHandler(add_season_start, pattern="^admin_add_season$")], states={S_GET_ANIME: [CallbackQueryHandler(anime_picker_page, pattern="^picker_(next|prev)$"), CallbackQueryHandler(get_anime_for_season, pattern="^season_anime_")], S_GET_NUMBER: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_season_number)], S_CONFIRM: [CallbackQueryHandler(save_season, pattern="^save_season$")]}, fallbacks=cancel_fallback + add_content_fallback)
+    add_episode_conv = ConversationHandler(name="add_episode", persistent=True, entry_points=[CallbackQueryHandler(add_episode_start, pattern="^admin_add_episode$")], states={E_GET_ANIME: [CallbackQueryHandler(anime_picker_page, pattern="^picker_(next|prev)$"), CallbackQueryHandler(get_anime_for_episode, pattern="^ep_anime_")], E_GET_SEASON: [CallbackQueryHandler(get_season_for_episode, pattern="^ep_season_")], E_GET_NUMBER: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_episode_number)], E_GET_QUALITY: [CallbackQueryHandler(get_episode_quality, pattern="^ep_quality_")], E_GET_FILE: [MessageHandler(filters.VIDEO | filters.Document.ALL, get_episode_file)]}, fallbacks=cancel_fallback + add_content_fallback)
+    bulk_episode_conv = ConversationHandler(name="bulk_episodes", persistent=True, entry_points=[CallbackQueryHandler(bulk_episode_start, pattern="^admin_bulk_episodes$")], states={BI_GET_ANIME: [CallbackQueryHandler(anime_picker_page, pattern="^picker_(next|prev)$"), CallbackQueryHandler(bulk_episode_anime, pattern="^bulk_anime_")], BI_GET_SEASON: [CallbackQueryHandler(bulk_episode_season, pattern="^bulk_season_")], BI_COLLECT: [CommandHandler("done", bulk_episode_done), MessageHandler(filters.VIDEO | filters.Document.ALL, bulk_episode_collect)]}, fallbacks=cancel_fallback + add_content_fallback)
+    set_sub_qr_conv = ConversationHandler(name="set_sub_qr", persistent=True, entry_points=[CallbackQueryHandler(set_sub_qr_start, pattern="^admin_set_sub_qr$")], states={CS_GET_QR: [MessageHandler(filters.PHOTO, set_sub_qr_save)]}, fallbacks=cancel_fallback + sub_settings_fallback)
+    set_price_conv = ConversationHandler(name="set_price", persistent=True, entry_points=[CallbackQueryHandler(set_price_start, pattern="^admin_set_price$")], states={CP_GET_PRICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, set_price_save)]}, fallbacks=cancel_fallback + sub_settings_fallback)
+    set_donate_qr_conv = ConversationHandler(name="set_donate_qr", persistent=True, entry_points=[CallbackQueryHandler(set_donate_qr_start, pattern="^admin_set_donate_qr$")], states={CD_GET_QR: [MessageHandler(filters.PHOTO, set_donate_qr_save)]}, fallbacks=cancel_fallback + donate_settings_fallback)
+    set_links_conv = ConversationHandler(name="set_links", persistent=True, entry_points=[CallbackQueryHandler(set_links_start, pattern="^admin_set_donate_link$|^admin_set_backup_link$|^admin_set_support_link$")], states={CL_GET_BACKUP: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_link), CommandHandler("skip", skip_link)]}, fallbacks=cancel_fallback + links_fallback + donate_settings_fallback)
+    post_gen_conv = ConversationHandler(name="post_gen", persistent=True, entry_points=[CallbackQueryHandler(post_gen_menu, pattern="^admin_post_gen$")], states={PG_MENU: [CallbackQueryHandler(post_gen_select_anime, pattern="^post_gen_season$"), CallbackQueryHandler(post_gen_select_anime, pattern="^post_gen_episode$")], PG_GET_ANIME: [CallbackQueryHandler(anime_picker_page, pattern="^picker_(next|prev)$"), CallbackQueryHandler(post_gen_select_season, pattern="^post_anime_")], PG_GET_SEASON: [CallbackQueryHandler(post_gen_select_episode, pattern="^post_season_")], PG_GET_EPISODE: [CallbackQueryHandler(post_gen_episode_page, pattern="^post_page_"), CallbackQueryHandler(post_gen_final_episode, pattern="^post_ep_")], PG_GET_CHAT: [CommandHandler("all", post_gen_send_to_all), MessageHandler(filters.TEXT & ~filters.COMMAND, post_gen_send_to_chat)]}, fallbacks=cancel_fallback + admin_menu_fallback)
+    del_anime_conv = ConversationHandler(name="del_anime", persistent=True, entry_points=[CallbackQueryHandler(delete_anime_start, pattern="^admin_del_anime$")], states={DA_GET_ANIME: [CallbackQueryHandler(anime_picker_page, pattern="^picker_(next|prev)$"), CallbackQueryHandler(delete_anime_confirm, pattern="^del_anime_")], DA_CONFIRM: [CallbackQueryHandler(delete_anime_do, pattern="^del_anime_confirm_yes$")]}, fallbacks=cancel_fallback + manage_fallback)
+    del_season_conv = ConversationHandler(name="del_season", persistent=True, entry_points=[CallbackQueryHandler(delete_season_start, pattern="^admin_del_season$")], states={DS_GET_ANIME: [CallbackQueryHandler(anime_picker_page, pattern="^picker_(next|prev)$"), CallbackQueryHandler(delete_season_select, pattern="^del_season_anime_")], DS_GET_SEASON: [CallbackQueryHandler(delete_season_confirm, pattern="^del_season_")], DS_CONFIRM: [CallbackQueryHandler(delete_season_do, pattern="^del_season_confirm_yes$")]}, fallbacks=cancel_fallback + manage_fallback)
 
     # User ka subscription flow
     user_sub_conv = ConversationHandler(
+        name="user_sub", persistent=True,
         entry_points=[CallbackQueryHandler(user_subscribe_start, pattern="^user_subscribe$")],
         states={ SUB_GET_SS: [MessageHandler(filters.PHOTO, user_sent_screenshot)] },
         fallbacks=[CommandHandler("cancel", conv_cancel)]
     )
     # Admin ka approval flow
     admin_sub_conv = ConversationHandler(
+        name="admin_sub", persistent=True,
         entry_points=[CallbackQueryHandler(admin_approval_handler, pattern="^admin_(approve|reject)_sub_")],
         states={ ADMIN_SUB_GET_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_set_sub_days)] },
         fallbacks=[CommandHandler("cancel", conv_cancel)]
     )
     # Admin jab 'Pending Payments' dabata hai
     pending_payments_conv = ConversationHandler(
+        name="pending_payments", persistent=True,
         entry_points=[CallbackQueryHandler(show_pending_payments, pattern="^admin_pending_payments$")],
         states={
             ADMIN_PENDING_MENU: [CallbackQueryHandler(show_pending_user_details, pattern="^pending_user_")]
@@ -1212,9 +3854,18 @@ def main():
     )
 
     # --- Handlers ko Add Karo ---
+    # Shared state (caches + conversations) sabse pehle, taaki group 0 ke ConversationHandlers latest state dekhein
+    application.add_handler(TypeHandler(Update, load_shared_state), group=-2)
+    # Har processed update ka time (/healthz, /readyz ke liye); group -1 baaki handlers ko nahi rokta
+    application.add_handler(TypeHandler(Update, note_update_processed), group=-1)
+    # Encoded navigation buttons sabse pehle (ek hi prefix check)
+    application.add_handler(CallbackQueryHandler(callback_router, pattern=f"^{CB_PREFIX}"))
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("admin", admin_command))
     application.add_handler(CommandHandler("menu", menu_command))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("post_targets", post_targets_command))
+    application.add_handler(InlineQueryHandler(inline_search))
     application.add_handler(CallbackQueryHandler(admin_command, pattern="^admin_menu$")) # Main "Back" button
     
     # Admin Sub-Menu Handlers
@@ -1228,6 +3879,7 @@ def main():
     application.add_handler(add_anime_conv)
     application.add_handler(add_season_conv)
     application.add_handler(add_episode_conv)
+    application.add_handler(bulk_episode_conv)
     application.add_handler(set_sub_qr_conv)
     application.add_handler(set_price_conv)
     application.add_handler(set_donate_qr_conv)
@@ -1241,13 +3893,157 @@ def main():
     
     # Single Callbacks
     application.add_handler(CallbackQueryHandler(user_check_sub_status, pattern="^user_check_sub$"))
-    application.add_handler(CallbackQueryHandler(download_handler, pattern="^dl_")) 
-    application.add_handler(CallbackQueryHandler(send_file_handler, pattern="^sendfile_")) 
+    # Purane channel posts ke buttons
+    application.add_handler(CallbackQueryHandler(legacy_download_callback, pattern="^dl_"))
+    application.add_handler(CallbackQueryHandler(legacy_send_file_callback, pattern="^sendfile_"))
+    # Storage channel importer (conversations ke baad, taaki add/bulk episode flows ko files pehle milein)
+    application.add_handler(CommandHandler("import_status", import_status_command))
+    application.add_handler(CommandHandler("import_reset", import_reset_command))
+    if STORAGE_CHAT_ID:
+        media_filter = filters.VIDEO | filters.Document.ALL
+        application.add_handler(MessageHandler(filters.UpdateType.CHANNEL_POST & filters.Chat(STORAGE_CHAT_ID) & media_filter, storage_channel_post))
+        application.add_handler(MessageHandler(filters.ChatType.PRIVATE & filters.User(ADMIN_ID) & filters.FORWARDED & media_filter, storage_forward_import))
 
     application.add_error_handler(error_handler)
+    instrument_handlers(application)
+
+    # --- Background Jobs ---
+    # Cluster-wide jobs sirf leader par (dekho Leader Election); baaki har worker ke apne caches/buffers ke liye
+    application.job_queue.run_repeating(leadership_job, interval=LEADER_LEASE_SECONDS / 3, first=LEADER_LEASE_SECONDS / 3)
+    application.job_queue.run_repeating(leader_only(reconcile_pending_count), interval=PENDING_RECONCILE_INTERVAL, first=PENDING_RECONCILE_INTERVAL)
+    application.job_queue.run_repeating(rebuild_search_index, interval=SEARCH_REFRESH_INTERVAL, first=SEARCH_REFRESH_INTERVAL)
+    application.job_queue.run_repeating(leader_only(sweep_expired_subscriptions), interval=EXPIRY_SWEEP_INTERVAL, first=10)
+    application.job_queue.run_repeating(health_heartbeat, interval=HEALTH_HEARTBEAT_INTERVAL, first=0)
+    application.job_queue.run_repeating(leader_only(resume_broadcasts_job), interval=BROADCAST_RESUME_INTERVAL, first=BROADCAST_RESUME_INTERVAL)
+    if STORAGE_CHAT_ID:
+        application.job_queue.run_repeating(import_flush_job, interval=IMPORT_FLUSH_INTERVAL, first=IMPORT_FLUSH_INTERVAL)
+    return application
 
+# --- Webhook Mode ---
+# BOT_MODE=webhook par Telegram updates Flask route par POST hote hain aur gunicorn
+# (gthread workers) unhe serve karta hai. Har worker ka apna event loop thread hota hai
+# jisme Application chalta hai; route update ko us loop ki update_queue mein daal deta hai.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+BOT_RUNTIME = {"application": None, "loop": None}
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Telegram ka webhook: secret token check karke update queue mein daalta hai."""
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        abort(403)
+    application, loop = BOT_RUNTIME["application"], BOT_RUNTIME["loop"]
+    if application is None or loop is None:
+        abort(503)
+    update = Update.de_json(request.get_json(force=True), application.bot)
+    asyncio.run_coroutine_threadsafe(application.update_queue.put(update), loop)
+    return "", 200
+
+async def _start_webhook_application(application: Application):
+    await application.initialize()
+    await application.post_init(application) # run_polling ki tarah manually chalana padta hai
+    await application.start()
+    if is_leader(): # Webhook sirf leader register karta hai (lease post_init mein li gayi)
+        await register_webhook(application.bot)
+
+async def register_webhook(bot):
+    try:
+        await bot.set_webhook(
+            url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+        logger.info(f"Webhook set ho gaya: {WEBHOOK_URL}{WEBHOOK_PATH}")
+    except Exception as e:
+        logger.error(f"Webhook set karne me error: {e}")
+
+async def _stop_webhook_application(application: Application):
+    await application.stop()
+    await application.shutdown()
+
+def start_webhook_bot():
+    """Gunicorn worker ke andar bot ka event loop thread start karta hai."""
+    start_health_pinger()
+    loop = asyncio.new_event_loop()
+    Thread(target=loop.run_forever, name="bot-loop", daemon=True).start()
+    application = build_application(webhook=True)
+    asyncio.run_coroutine_threadsafe(_start_webhook_application(application), loop).result()
+    BOT_RUNTIME.update(application=application, loop=loop)
+
+def stop_webhook_bot():
+    application, loop = BOT_RUNTIME["application"], BOT_RUNTIME["loop"]
+    if application is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(_stop_webhook_application(application), loop).result(timeout=30)
+        except Exception as e:
+            logger.error(f"Bot band karne me error: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+    BOT_RUNTIME.update(application=None, loop=None)
+    close_db()
+
+def run_webhook_server():
+    """Flask app ko gunicorn par chalata hai (sirf webhook mode mein gunicorn import hota hai)."""
+    from gunicorn.app.base import BaseApplication
+
+    class WebhookServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+        def load(self):
+            return app
+
+    WebhookServer({
+        "bind": f"0.0.0.0:{int(os.environ.get('PORT', 8080))}",
+        "workers": WEB_WORKERS,
+        "worker_class": "gthread",
+        "threads": WEB_THREADS,
+        "post_worker_init": lambda worker: start_webhook_bot(),
+        "worker_exit": lambda server, worker: stop_webhook_bot(),
+    }).run()
+
+# --- Main Bot Function ---
+def main():
+    if not check_db_connection():
+        logger.critical("Bot band ho raha hai, DB connection fail.")
+        exit()
+    ensure_indexes()
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL or not WEBHOOK_SECRET:
+            logger.critical("Webhook mode ke liye WEBHOOK_URL aur WEBHOOK_SECRET zaroori hain.")
+            exit()
+        logger.info(f"Webhook mode: gunicorn {WEB_WORKERS} worker(s) ke saath start ho raha hai...")
+        run_webhook_server()
+        return
+        
+    logger.info("Flask web server start ho raha hai (Render port ke liye)...")
+    start_health_pinger()
+    flask_thread = Thread(target=run_flask)
+    flask_thread.start()
+    
+    application = build_application()
+    BOT_RUNTIME["application"] = application # /metrics ke update queue gauge ke liye
     logger.info("Bot polling start kar raha hai...")
-    application.run_polling()
+    try:
+        application.run_polling()
+    finally:
+        close_db()
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["migrate_episodes"]:
+        # python main.py migrate_episodes [batch_size]
+        migrate_episodes(int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+    elif sys.argv[1:2] == ["explain_indexes"]:
+        # python main.py explain_indexes
+        ensure_indexes()
+        explain_hot_queries()
+    else:
+        main()
@@ -0,0 +1,159 @@
+import os
+import sys
+import copy
+from types import SimpleNamespace
+
+import pytest
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+# main.py import par secrets check karta hai; tests ke liye asli values ki zaroorat nahi
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("ADMIN_ID", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$exists":
+                    ok = (key in doc) == arg
+                elif op == "$ne":
+                    ok = value != arg
+                elif op == "$in":
+                    ok = value in arg
+                elif op in ("$lt", "$lte", "$gt", "$gte"):
+                    ok = value is not None and {"$lt": value < arg, "$lte": value <= arg, "$gt": value > arg, "$gte": value >= arg}[op]
+                elif op == "$type":
+                    ok = isinstance(value, dict) if arg == "object" else False
+                elif op == "$not":
+                    ok = not _matches(doc, {key: arg})
+                else:
+                    raise NotImplementedError(op)
+                if not ok:
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _apply(doc, update, inserting):
+    for op, fields in update.items():
+        for key, arg in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                doc[key] = copy.deepcopy(arg)
+            elif op == "$inc":
+                doc[key] = doc.get(key, 0) + arg
+            elif op == "$max":
+                doc[key] = arg if key not in doc else max(doc[key], arg)
+            elif op == "$unset":
+                doc.pop(key, None)
+            elif op != "$setOnInsert":
+                raise NotImplementedError(op)
+
+
+class FakeCollection:
+    """Tests ke liye chhota in-memory Mongo collection (sirf jo operators main.py use karta hai)."""
+    def __init__(self):
+        self.docs = {}
+
+    def _find(self, query):
+        return [doc for doc in self.docs.values() if _matches(doc, query)]
+
+    def _project(self, doc, projection):
+        if not projection:
+            return copy.deepcopy(doc)
+        keep = {k for k, v in projection.items() if v}
+        out = {k: copy.deepcopy(v) for k, v in doc.items() if k in keep or (k == "_id" and projection.get("_id", 1))}
+        return out
+
+    def find_one(self, query=None, projection=None, **kwargs):
+        found = self._find(query or {})
+        return self._project(found[0], projection) if found else None
+
+    def find(self, query=None, projection=None, sort=None, limit=0, **kwargs):
+        found = self._find(query or {})
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda d: d.get(key), reverse=direction < 0)
+        if limit:
+            found = found[:limit]
+        return [self._project(doc, projection) for doc in found]
+
+    def count_documents(self, query):
+        return len(self._find(query))
+
+    def insert_one(self, doc):
+        doc.setdefault("_id", len(self.docs) + 1)
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate _id")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        found = self._find(query)
+        if found:
+            before = copy.deepcopy(found[0])
+            _apply(found[0], update, inserting=False)
+            return SimpleNamespace(matched_count=1, modified_count=int(before != found[0]), upserted_id=None)
+        if not upsert:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        _apply(doc, update, inserting=True)
+        doc.setdefault("_id", len(self.docs) + 1)
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate _id")
+        self.docs[doc["_id"]] = doc
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=ReturnDocument.BEFORE, **kwargs):
+        found = self._find(query)
+        before = copy.deepcopy(found[0]) if found else None
+        result = self.update_one(query, update, upsert=upsert)
+        if return_document == ReturnDocument.BEFORE:
+            return self._project(before, projection) if before else None
+        doc_id = before["_id"] if before else result.upserted_id
+        return self._project(self.docs[doc_id], projection) if doc_id is not None else None
+
+    def delete_one(self, query):
+        found = self._find(query)
+        if found:
+            del self.docs[found[0]["_id"]]
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    def delete_many(self, query):
+        found = self._find(query)
+        for doc in found:
+            del self.docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(found))
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            if isinstance(request, UpdateOne):
+                self.update_one(request._filter, request._doc, upsert=request._upsert)
+            elif isinstance(request, DeleteOne):
+                self.delete_one(request._filter)
+            else:
+                raise NotImplementedError(type(request))
+        return SimpleNamespace(acknowledged=True)
+
+
+class FakeDB(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """main.get_db ko in-memory DB se badalta hai; AsyncCollection ka executor path waisa hi rehta hai."""
+    import main
+    db = FakeDB()
+    monkeypatch.setattr(main, "get_db", lambda: db)
+    return db
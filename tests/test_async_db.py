@@ -0,0 +1,58 @@
+import time
+import asyncio
+import threading
+
+import main
+
+
+class SlowCollection:
+    """Har call thread ko block karti hai (jaise slow Mongo query) aur concurrency count karti hai."""
+    def __init__(self, delay):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def find_one(self, *args, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return {"_id": 1}
+
+
+def test_concurrent_awaits_respect_executor_size_without_blocking_loop(monkeypatch):
+    collection = SlowCollection(delay=0.1)
+    monkeypatch.setattr(main, "get_db", lambda: {"items": collection})
+    monkeypatch.setattr(main, "MONGO_EXECUTOR_WORKERS", 4)
+    monkeypatch.setattr(main, "_db_executor", None)
+    db_items = main.AsyncCollection("items")
+
+    async def scenario():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker_task = asyncio.create_task(ticker())
+        started = time.monotonic()
+        results = await asyncio.gather(*[db_items.find_one({"_id": 1}) for _ in range(12)])
+        elapsed = time.monotonic() - started
+        done.set()
+        await ticker_task
+        return results, elapsed, ticks
+
+    results, elapsed, ticks = asyncio.run(scenario())
+    assert results == [{"_id": 1}] * 12
+    # 12 calls / 4 threads = 3 rounds of 0.1s; zyada threads hote toh ~0.1s lagta
+    assert collection.max_active == 4
+    assert elapsed >= 0.28
+    # Loop DB calls ke dauran bhi chalta raha
+    assert ticks >= 15
+    main._db_executor.shutdown(wait=True)
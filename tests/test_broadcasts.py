@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import main
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text=None, **kwargs):
+        self.sent.append(chat_id)
+
+
+class FakeApp:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.tasks = []
+
+    def create_task(self, coro):
+        self.tasks.append(coro)
+
+
+def broadcast_doc(**extra):
+    now = datetime.now()
+    doc = {
+        "_id": "episode:test", "status": "running", "last_user_id": None, "sent": 0, "failed": 0, "blocked": 0,
+        "attempts": 1, "owner": "a", "lease_until": now + timedelta(seconds=60), "created_at": now, "updated_at": now,
+        "payload": {"anime_id": ObjectId(), "anime_name": "Naruto", "poster_id": None, "season": "1", "ep": "5"},
+    }
+    doc.update(extra)
+    return doc
+
+
+def add_subscribers(fake_db, *user_ids):
+    for user_id in user_ids:
+        fake_db["users"].docs[user_id] = {"_id": user_id, "subscribed": True, "expiry_date": datetime.now() + timedelta(days=1)}
+
+
+def test_lease_is_renewed_until_another_owner_takes_it(fake_db, monkeypatch):
+    monkeypatch.setattr(main, "BROADCAST_LEASE_SECONDS", 0.06)
+    doc = broadcast_doc(lease_until=datetime.now())
+    fake_db["broadcasts"].docs[doc["_id"]] = dict(doc)
+
+    async def run():
+        lost = asyncio.Event()
+        renewer = asyncio.create_task(main._renew_broadcast_lease(doc["_id"], "a", lost))
+        await asyncio.sleep(0.05)
+        renewed = fake_db["broadcasts"].docs[doc["_id"]]["lease_until"]
+        fake_db["broadcasts"].docs[doc["_id"]]["owner"] = "b"
+        await asyncio.wait_for(lost.wait(), 1)
+        renewer.cancel()
+        return renewed
+
+    assert asyncio.run(run()) > doc["lease_until"]
+
+
+def test_failed_run_backs_off_without_admin_report(fake_db, monkeypatch):
+    add_subscribers(fake_db, 1, 2)
+    doc = broadcast_doc()
+    fake_db["broadcasts"].docs[doc["_id"]] = dict(doc)
+
+    def broken_find(*args, **kwargs):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(fake_db["users"], "find", broken_find)
+    app = FakeApp()
+    asyncio.run(main.run_broadcast(app, doc))
+    stored = fake_db["broadcasts"].docs[doc["_id"]]
+    assert stored["status"] == "failed"
+    assert stored["lease_until"] > datetime.now()
+    assert app.bot.sent == []
+
+
+def test_resume_retries_from_checkpoint_and_reports(fake_db, monkeypatch):
+    monkeypatch.setattr(main, "worker_id", lambda: "b")
+    add_subscribers(fake_db, 1, 2, 3)
+    past = datetime.now() - timedelta(seconds=1)
+    fake_db["broadcasts"].docs["episode:test"] = broadcast_doc(status="failed", last_user_id=1, sent=1, lease_until=past)
+    fake_db["broadcasts"].docs["episode:gave_up"] = broadcast_doc(_id="episode:gave_up", status="failed", lease_until=past, attempts=main.BROADCAST_MAX_ATTEMPTS)
+    app = FakeApp()
+
+    async def run():
+        await main.resume_broadcasts(app)
+        await asyncio.gather(*app.tasks)
+
+    asyncio.run(run())
+    stored = fake_db["broadcasts"].docs["episode:test"]
+    assert (stored["status"], stored["attempts"], stored["owner"], stored["sent"]) == ("done", 2, "b", 3)
+    assert app.bot.sent == [2, 3, main.ADMIN_ID]
+    assert fake_db["broadcasts"].docs["episode:gave_up"]["status"] == "failed"
@@ -0,0 +1,55 @@
+import asyncio
+
+from bson import ObjectId
+
+import main
+
+LONG_SEASON = "Shippuden Final Arc Season Two Part Three The Very Long Subtitle Edition"
+
+
+class FakeEntry:
+    def season_keys(self):
+        return ["1", LONG_SEASON]
+
+
+def resolve(data):
+    op, _, fields = main.decode_callback(data)
+    return asyncio.run(main.resolve_callback_fields(op, FakeEntry(), fields))
+
+
+def test_long_season_fits_and_round_trips():
+    data = main.encode_callback(main.CB_OP_SEND_FILE, ObjectId(), main.callback_key(LONG_SEASON), main.callback_episode("1071"), main.callback_key("1080p"))
+    assert len(data) <= main.CB_MAX_BYTES
+    assert resolve(data) == [LONG_SEASON, "1071", "1080p"]
+
+
+def test_text_episode_and_extras_page():
+    anime_id = ObjectId()
+    assert resolve(main.encode_callback(main.CB_OP_DOWNLOAD, anime_id, main.callback_key("1"), main.callback_episode("05"))) == ["1", "05"]
+    assert resolve(main.encode_callback(main.CB_OP_EPISODE_PAGE, anime_id, main.callback_key("1"), main.callback_page(main.EXTRAS_PAGE))) == ["1", main.EXTRAS_PAGE]
+
+
+def test_deleted_season_is_rejected():
+    assert resolve(main.encode_callback(main.CB_OP_DOWNLOAD, ObjectId(), main.callback_key("2"))) is None
+
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append(text)
+
+
+def test_malformed_legacy_send_file_gets_expired_answer(monkeypatch):
+    async def no_anime(name):
+        return None
+
+    monkeypatch.setattr(main, "catalog_get", no_anime)
+    for data in ("sendfile_", "sendfile_720p", "sendfile_720p_Naruto", "sendfile_720p_Naruto_1"):
+        query = FakeQuery(data)
+        update = type("U", (), {"callback_query": query})()
+        asyncio.run(main.legacy_send_file_callback(update, None))
+        assert query.answers and "purana" in query.answers[0]
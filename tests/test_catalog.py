@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+import main
+
+FILE = {"id": "file1", "type": "video"}
+
+
+def make_entry(*seasons):
+    entry = main.CatalogEntry({"_id": ObjectId(), "name": "Naruto", "seasons": {s: {} for s in seasons}})
+    for season in seasons:
+        entry.seasons[season] = {} # season memory mein loaded
+    return entry
+
+
+def cache_views(entry):
+    entry.set_keyboard(None, "seasons", "seasons-markup")
+    for season in entry.season_keys():
+        entry.set_keyboard(season, "episodes:1", f"{season}-markup")
+
+
+def test_new_file_invalidates_only_its_season():
+    entry = make_entry("1", "2")
+    cache_views(entry)
+    entry.add_file("1", "5", "720p", FILE)
+    assert entry.get_keyboard("1", "episodes:1") is None
+    assert entry.get_keyboard("2", "episodes:1") == "2-markup"
+    assert entry.get_keyboard(None, "seasons") == "seasons-markup"
+    assert entry.episode_keys("1") == ["5"]
+
+
+def test_season_changes_invalidate_everything():
+    entry = make_entry("1", "2")
+    cache_views(entry)
+    entry.add_season("3")
+    assert entry.get_keyboard(None, "seasons") is None
+    assert entry.get_keyboard("2", "episodes:1") is None
+    cache_views(entry)
+    entry.remove_season("2")
+    assert entry.season_keys() == ["1", "3"]
+    assert entry.get_keyboard(None, "seasons") is None
+
+
+class FakeQuery:
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=1)
+        self.edits = []
+
+    async def answer(self, text=None, show_alert=False):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None, parse_mode=None):
+        self.edits.append(reply_markup)
+
+
+def test_quality_keyboards_are_not_cached(monkeypatch):
+    async def subscribed(user_id):
+        return {"active": True}
+
+    monkeypatch.setattr(main, "check_user_subscription", subscribed)
+    entry = make_entry("1")
+    for ep in range(1, 4):
+        entry.add_file("1", str(ep), "720p", FILE)
+    query = FakeQuery()
+    for ep in range(1, 4):
+        asyncio.run(main.download_handler(SimpleNamespace(callback_query=query), None, entry, "1", str(ep)))
+    assert len(query.edits) == 3 and all(markup is not None for markup in query.edits)
+    assert entry._keyboards == {}
+
+
+def summary_for(monkeypatch, ep_numbers, qualities=("720p",)):
+    """Aggregate ka result ep_no list se (FakeDB mein aggregate nahi hai)."""
+    pages = [None if n is None else float(max(n - 1, 0) // main.EPISODE_PAGE_SIZE) for n in ep_numbers]
+
+    async def aggregate(pipeline):
+        return [{"_id": None, "pages": list(dict.fromkeys(pages)), "qualities": list(qualities)}] if ep_numbers else []
+
+    monkeypatch.setattr(main, "db_episodes", SimpleNamespace(aggregate=aggregate))
+    return asyncio.run(main.catalog_season_summary(make_entry("1"), "1"))
+
+
+def test_episode_zero_gets_a_page(monkeypatch):
+    summary = summary_for(monkeypatch, [0])
+    assert main.episode_pages(summary) == ["0"]
+    assert main.page_of_episode("0") == "0"
+
+
+def test_sparse_numbering_skips_empty_ranges(monkeypatch):
+    summary = summary_for(monkeypatch, [1, 2, 3, 4, 5, 200, None])
+    pages = main.episode_pages(summary)
+    assert pages == ["0", "7", main.EXTRAS_PAGE]
+    assert [main.page_label(p) for p in pages] == ["1-25", "176-200", "Extras"]
+    assert summary_for(monkeypatch, []) == {"pages": [], "has_extras": False, "qualities": []}
+
+
+def test_loaded_season_pages_match_existing_episodes():
+    entry = make_entry("1")
+    for ep in ("0", "1", "5", "200", "OVA"):
+        entry.add_file("1", ep, "720p", FILE)
+    page = lambda p: asyncio.run(main.catalog_episode_page(entry, "1", p))
+    assert page("0") == ["0", "1", "5"]
+    assert page("7") == ["200"]
+    assert page(main.EXTRAS_PAGE) == ["OVA"]
+    assert page("3") == []
@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+ENTRY = SimpleNamespace(id="anime1")
+
+
+class FakeQuery:
+    def __init__(self, user_id=1):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, text=None, show_alert=False):
+        self.answers.append(text)
+
+
+def tap(handler, *fields, user_id=1):
+    query = FakeQuery(user_id)
+    asyncio.run(handler(SimpleNamespace(callback_query=query), None, ENTRY, *fields))
+    return query
+
+
+@pytest.fixture(autouse=True)
+def clean_guard_state():
+    main.RECENT_CLICKS.clear()
+    main.INFLIGHT_CLICKS.clear()
+    main.INFLIGHT_SENDS.clear()
+
+
+def recording_handler(calls):
+    async def handler(update, context, entry, *fields):
+        calls.append(fields)
+    return handler
+
+
+def test_navigation_double_tap_is_dropped_within_window():
+    calls = []
+    guarded = main.inbound_guard(recording_handler(calls))
+    tap(guarded, "1", "05")
+    duplicate = tap(guarded, "1", "05")
+    assert calls == [("1", "05")]
+    assert duplicate.answers == [None]
+    tap(guarded, "1", "06", user_id=2) # doosre user par asar nahi
+    assert len(calls) == 2
+
+
+def test_other_button_resets_window_and_window_expires(monkeypatch):
+    calls = []
+    guarded = main.inbound_guard(recording_handler(calls))
+    tap(guarded, "1")
+    tap(guarded, "2")
+    tap(guarded, "1") # back: pichhla button dobara, beech mein doosra daba tha
+    assert calls == [("1",), ("2",), ("1",)]
+    monkeypatch.setattr(main, "DUPLICATE_CLICK_WINDOW", 0)
+    tap(guarded, "3")
+    tap(guarded, "3")
+    assert len(calls) == 5
+
+
+def test_send_in_flight_blocks_duplicates_after_window(monkeypatch):
+    monkeypatch.setattr(main, "DUPLICATE_CLICK_WINDOW", 0)
+    calls = []
+
+    async def slow_send(update, context, entry, *fields):
+        calls.append(fields)
+        await asyncio.sleep(0.05)
+
+    guarded = main.inbound_guard(slow_send, "busy", limit_inflight=True)
+
+    async def run():
+        queries = [FakeQuery(), FakeQuery()]
+        await asyncio.gather(*[guarded(SimpleNamespace(callback_query=q), None, ENTRY, "1", "05", "720p") for q in queries])
+        return queries
+
+    queries = asyncio.run(run())
+    assert len(calls) == 1
+    assert queries[1].answers == ["busy"]
+    tap(guarded, "1", "05", "720p") # send khatam, ab dobara mil sakta hai
+    assert len(calls) == 2
+
+
+def test_failed_send_can_be_retried_at_once():
+    calls = []
+
+    async def failing_send(update, context, entry, *fields):
+        calls.append(fields)
+        raise RuntimeError("telegram down")
+
+    guarded = main.inbound_guard(failing_send, "busy", limit_inflight=True)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            tap(guarded, "1", "05", "720p")
+    assert len(calls) == 2
+    assert not main.INFLIGHT_SENDS
+
+
+def test_download_and_page_routes_are_guarded():
+    assert main.CALLBACK_ROUTES[main.CB_OP_DOWNLOAD] is main.guarded_download_handler
+    assert main.CALLBACK_ROUTES[main.CB_OP_EPISODE_PAGE] is main.guarded_episode_page_handler
+    assert main.CALLBACK_ROUTES[main.CB_OP_SEND_FILE] is main.guarded_send_file_handler
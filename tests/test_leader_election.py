@@ -0,0 +1,40 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import main
+
+
+def as_worker(monkeypatch, name):
+    monkeypatch.setattr(main, "worker_id", lambda: name)
+    return asyncio.run(main.renew_leadership())
+
+
+def test_single_leader_and_takeover_after_expiry(fake_db, monkeypatch):
+    monkeypatch.setattr(main, "LEADER_ELECTION", True)
+    monkeypatch.setitem(main._leader, "is_leader", False)
+    assert as_worker(monkeypatch, "a") is True
+    assert as_worker(monkeypatch, "b") is False
+    assert as_worker(monkeypatch, "a") is True # renew
+    fake_db["counters"].docs[main.LEADER_LEASE_ID]["lease_until"] = datetime.now() - timedelta(seconds=1)
+    assert as_worker(monkeypatch, "b") is True
+    assert as_worker(monkeypatch, "a") is False
+
+
+def test_leader_only_jobs_skip_on_followers(monkeypatch):
+    calls = []
+
+    async def job(context):
+        calls.append(context)
+
+    wrapped = main.leader_only(job)
+    monkeypatch.setitem(main._leader, "is_leader", False)
+    asyncio.run(wrapped("ctx"))
+    assert calls == []
+    monkeypatch.setitem(main._leader, "is_leader", True)
+    asyncio.run(wrapped("ctx"))
+    assert calls == ["ctx"]
+
+
+def test_polling_mode_is_always_leader(monkeypatch):
+    monkeypatch.setattr(main, "LEADER_ELECTION", False)
+    assert asyncio.run(main.renew_leadership()) is True
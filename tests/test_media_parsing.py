@@ -0,0 +1,32 @@
+import pytest
+
+from main import parse_media_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Attack on Titan Season 2 - 03 [1080p].mkv", {"title": "Attack on Titan", "season": "2", "episode": "3", "quality": "1080p"}),
+    ("Mob Psycho 100 - 05", {"title": "Mob Psycho 100", "episode": "5"}),
+    ("Kaiju No. 8 - 04", {"title": "Kaiju No 8", "episode": "4"}),
+    ("Re Zero 2nd Season - 12", {"title": "Re Zero", "season": "2", "episode": "12"}),
+    ("Naruto S01E05 720p.mkv", {"title": "Naruto", "season": "1", "episode": "5", "quality": "720p"}),
+    ("[Sub] Naruto - 05 [1080p].mp4", {"title": "Naruto", "episode": "5", "quality": "1080p"}),
+    ("One Piece Episode 1071 2160p 2023 x265.mkv", {"title": "One Piece", "episode": "1071", "quality": "4K"}),
+    ("Attack on Titan Season 2 Ep 12 480p", {"title": "Attack on Titan", "season": "2", "episode": "12", "quality": "480p"}),
+    ("Naruto.S02.E07.1080p.mkv", {"title": "Naruto", "season": "2", "episode": "7", "quality": "1080p"}),
+    ("Jujutsu Kaisen - 24v2 [720p]", {"title": "Jujutsu Kaisen", "episode": "24", "quality": "720p"}),
+    ("Naruto_Ep_05_720p.mkv", {"title": "Naruto", "episode": "5", "quality": "720p"}),
+    ("Bleach_Episode_366_1080p.mp4", {"title": "Bleach", "episode": "366", "quality": "1080p"}),
+])
+def test_parse_media_text(text, expected):
+    assert parse_media_text(text) == expected
+
+
+def test_season_dash_is_episode_not_season():
+    info = parse_media_text("Show Season - 03")
+    assert "season" not in info
+    assert info["episode"] == "3"
+
+
+def test_empty_text():
+    assert parse_media_text("") == {}
+    assert parse_media_text(None) == {}
@@ -0,0 +1,43 @@
+import asyncio
+
+import main
+
+
+def pending_user(user_id):
+    return {"_id": user_id, "pending_payment": {"ss_id": "x"}}
+
+
+def test_reconcile_fixes_drift(fake_db):
+    for user_id in (1, 2, 3):
+        fake_db["users"].insert_one(pending_user(user_id))
+    fake_db["counters"].insert_one({"_id": main.PENDING_COUNTER_ID, "count": 7})
+    asyncio.run(main.reconcile_pending_count())
+    assert fake_db["counters"].docs[main.PENDING_COUNTER_ID]["count"] == 3
+
+
+def test_reconcile_creates_missing_counter(fake_db):
+    fake_db["users"].insert_one(pending_user(1))
+    asyncio.run(main.reconcile_pending_count())
+    assert fake_db["counters"].docs[main.PENDING_COUNTER_ID]["count"] == 1
+
+
+def test_reconcile_keeps_increment_that_lands_mid_run(fake_db, monkeypatch):
+    users, counters = fake_db["users"], fake_db["counters"]
+    users.insert_one(pending_user(1))
+    counters.insert_one({"_id": main.PENDING_COUNTER_ID, "count": 5})
+    real_count = users.count_documents
+
+    def count_then_new_payment(query):
+        # count ke baad ek naya screenshot aata hai: doc + $inc
+        result = real_count(query)
+        users.insert_one(pending_user(2))
+        counters.update_one({"_id": main.PENDING_COUNTER_ID}, {"$inc": {"count": 1}})
+        return result
+
+    monkeypatch.setattr(users, "count_documents", count_then_new_payment)
+    asyncio.run(main.reconcile_pending_count())
+    # $set hota toh 1 likh deta aur naya +1 kho jaata; ab counter chhua nahi gaya
+    assert counters.docs[main.PENDING_COUNTER_ID]["count"] == 6
+    monkeypatch.setattr(users, "count_documents", real_count)
+    asyncio.run(main.reconcile_pending_count())
+    assert counters.docs[main.PENDING_COUNTER_ID]["count"] == 2
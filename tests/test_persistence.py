@@ -0,0 +1,89 @@
+import asyncio
+import pickle
+
+from bson import Binary
+from telegram import Bot, Update
+from telegram.ext import Application, ConversationHandler, MessageHandler, TypeHandler, filters
+
+import main
+
+USER_ID = 42
+STATE_GET_FILE = 7
+
+
+def message_update(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": USER_ID, "type": "private"},
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Admin"},
+        },
+    }
+
+
+def build_app(seen):
+    async def get_file(update, context):
+        seen.append(context.user_data["anime_name"])
+        context.user_data["episode"] = update.message.text
+        return ConversationHandler.END
+
+    app = Application.builder().token("123:abc").persistence(main.MongoPersistence(update_interval=60)).build()
+    app.add_handler(TypeHandler(Update, main.load_shared_state), group=-2)
+    app.add_handler(ConversationHandler(
+        name="add_episode", persistent=True, entry_points=[],
+        states={STATE_GET_FILE: [MessageHandler(filters.TEXT, get_file)]}, fallbacks=[],
+    ))
+    return app
+
+
+async def process(app, update_id, text):
+    await app.process_update(Update.de_json(message_update(update_id, text), app.bot))
+
+
+def test_restart_resumes_conversation_with_user_data(fake_db, monkeypatch):
+    monkeypatch.setattr(main, "CACHE_SYNC", False)
+    monkeypatch.setattr(main, "PERSISTENCE_REFRESH", False)
+    monkeypatch.setattr(Bot, "initialize", lambda self: asyncio.sleep(0))
+    # Pichle process ne E_GET_FILE par conversation aur user_data save kiya tha
+    fake_db["persistence"].docs[f"conv:add_episode:{USER_ID}:{USER_ID}"] = {
+        "_id": f"conv:add_episode:{USER_ID}:{USER_ID}", "kind": "conversation", "name": "add_episode",
+        "key": [USER_ID, USER_ID], "user_id": USER_ID, "state": STATE_GET_FILE, "rev": "old",
+    }
+    fake_db["persistence"].docs[f"user:{USER_ID}"] = {
+        "_id": f"user:{USER_ID}", "kind": "user", "user_id": USER_ID, "rev": "old",
+        "data": Binary(pickle.dumps({"anime_name": "Naruto"})),
+    }
+    seen = []
+
+    async def run():
+        app = build_app(seen)
+        await app.initialize()
+        await process(app, 1, "05")
+        await app.update_persistence()
+        await app.persistence.flush()
+
+    asyncio.run(run())
+    assert seen == ["Naruto"]
+    doc = fake_db["persistence"].docs[f"user:{USER_ID}"]
+    assert pickle.loads(doc["data"]) == {"anime_name": "Naruto", "episode": "05"}
+    assert f"conv:add_episode:{USER_ID}:{USER_ID}" not in fake_db["persistence"].docs
+
+
+def test_unhydrated_user_data_is_not_flushed(fake_db):
+    stored = {"_id": "user:5", "kind": "user", "user_id": 5, "rev": "old", "data": Binary(pickle.dumps({"a": 1}))}
+    fake_db["persistence"].docs["user:5"] = dict(stored)
+    persistence = main.MongoPersistence()
+
+    async def run():
+        await persistence.update_user_data(5, {})
+        await persistence.flush()
+        user_data = {}
+        await persistence.load_user_state(5, user_data)
+        user_data["b"] = 2
+        await persistence.update_user_data(5, user_data)
+        await persistence.flush()
+        return user_data
+
+    assert asyncio.run(run()) == {"a": 1, "b": 2}
+    assert pickle.loads(fake_db["persistence"].docs["user:5"]["data"]) == {"a": 1, "b": 2}
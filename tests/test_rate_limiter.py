@@ -0,0 +1,59 @@
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import timedelta
+
+import pytest
+from telegram.error import RetryAfter
+
+import main
+
+
+def test_queued_requests_are_served_by_priority():
+    limiter = main.OutboundRateLimiter(global_rate=50, per_chat_rate=1000)
+    order = []
+
+    def request(name, priority):
+        async def callback():
+            order.append(name)
+        return limiter.process_request(callback, (), {}, "sendMessage", {"chat_id": 1}, priority)
+
+    async def run():
+        limiter._tokens = 0 # bucket khaali: sab queue mein jaayenge
+        await asyncio.gather(
+            request("broadcast", main.PRIORITY_BROADCAST),
+            request("admin", main.PRIORITY_ADMIN),
+            request("file", main.PRIORITY_FILE),
+            request("menu", main.PRIORITY_INTERACTIVE),
+        )
+
+    asyncio.run(run())
+    assert order == ["menu", "file", "admin", "broadcast"]
+    assert limiter.max_queue_depth == 4
+
+
+def test_flood_wait_is_retried_then_given_up():
+    limiter = main.OutboundRateLimiter(per_chat_rate=1000, max_retries=2)
+    calls = []
+
+    async def flaky(fail_times):
+        calls.append(fail_times)
+        if len(calls) <= fail_times:
+            raise RetryAfter(timedelta(0))
+        return "ok"
+
+    assert asyncio.run(limiter.process_request(flaky, (2,), {}, "sendMessage", {"chat_id": 1}, None)) == "ok"
+    assert limiter.stats["retry_after"] == 2
+    calls.clear()
+    with pytest.raises(RetryAfter):
+        asyncio.run(limiter.process_request(flaky, (3,), {}, "sendMessage", {"chat_id": 1}, None))
+    assert limiter.stats["gave_up"] == 1
+
+
+def test_global_budget_is_split_across_webhook_workers():
+    env = {**os.environ, "BOT_MODE": "webhook", "WEB_WORKERS": "4", "TELEGRAM_GLOBAL_RATE": "24"}
+    code = "import main; print(main.TELEGRAM_WORKER_COUNT, main.OUTBOUND_LIMITER.rate)"
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.split() == ["4", "6.0"]
@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+import main
+
+CHAT_ID = -1001
+
+
+def file_message(name):
+    return SimpleNamespace(caption=None, video=SimpleNamespace(file_id=f"file-{name}", file_name=name), document=None)
+
+
+def test_starts_with_ignores_inner_word_matches():
+    index = main.AnimeSearchIndex()
+    for name in ("One Piece", "One Punch Man", "Piece of Cake"):
+        index.add(name, ObjectId())
+    assert index.starts_with("one p") == ["One Piece", "One Punch Man"]
+    assert index.starts_with("piece") == ["Piece of Cake"]
+    assert index.starts_with("  ") == []
+
+
+def test_reforwarded_messages_are_checked_per_batch(fake_db, monkeypatch):
+    entry = SimpleNamespace(id=ObjectId(), name="Naruto", season_keys=lambda: ["1"])
+
+    async def resolve(title):
+        return entry if title == "Naruto" else None
+
+    monkeypatch.setattr(main, "resolve_import_anime", resolve)
+    monkeypatch.setattr(main, "catalog_add_file", lambda *args: None)
+    importer = main.StorageImporter()
+
+    async def forward(message_ids):
+        for message_id in message_ids:
+            await importer.handle(file_message(f"Naruto_Ep_{message_id:02d}_720p.mkv"), CHAT_ID, message_id)
+
+    async def run():
+        await forward([1, 2])
+        await forward([2]) # flush se pehle dobara
+        await importer.flush()
+        await forward([1, 2, 3]) # 1, 2 ab sirf DB records se pakde jaayenge
+        await importer.flush()
+
+    asyncio.run(run())
+    assert sorted(fake_db["import_messages"].docs) == [f"{CHAT_ID}:1", f"{CHAT_ID}:2", f"{CHAT_ID}:3"]
+    assert importer.stats["imported"] == 3
+    assert importer.stats["already_imported"] == 3
+    assert not importer.queued